@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class OverviewConfig(AppConfig):
     name = 'overview'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,85 @@
+""" Сравнение скорости подготовки данных для диаграмм Ганта:
+прежний построчный конвейер против векторизованного make_gantt.prepare.
+
+Запуск: python -m overview.bench_gantt [количество процессов] """
+import datetime
+import random
+import sys
+import timeit
+from itertools import groupby
+
+import pandas as pd
+from dateutil.tz import tzlocal
+
+from overview.make_gantt import prepare, split_by_days, COLORS
+
+
+def legacy_partition_proc(event: list) -> list:
+    """ Прежнее дробление процесса по суткам в цикле while """
+    event_title = event[0]
+    begin_event = min(event[1:]).astimezone(tzlocal()).replace(tzinfo=None)
+    end_event = max(event[1:]).astimezone(tzlocal()).replace(tzinfo=None)
+    color = random.choice(COLORS)
+    if begin_event.date() == end_event.date():
+        return [[event_title, begin_event, end_event, color]]
+
+    point = begin_event
+    parts = []
+    while point.date() != end_event.date():
+        part = datetime.datetime.combine(point.date(), datetime.time(23, 59))
+        parts.append([event_title, point, part, color])
+        point = part + datetime.timedelta(minutes=2)
+    parts.append([event_title, point, end_event, color])
+    return parts
+
+
+def legacy_pipeline(process_list) -> list:
+    """ Прежний конвейер: построчная проверка, дробление, сортировка,
+    разбивка по дням и заполнение DataFrame через DF.loc[i] """
+    processes = []
+    for process in process_list:
+        if None not in process:
+            processes.extend(legacy_partition_proc(list(process)))
+    processes.sort(key=lambda x: x[1])
+
+    frames = []
+    for _, day_proc in groupby(processes, lambda x: x[1].date()):
+        DF = pd.DataFrame(columns=['Process', 'Start', 'End', 'Color'])
+        for i, data in enumerate(list(day_proc)[::-1]):
+            DF.loc[i] = data
+        frames.append(DF)
+    return frames
+
+
+def vectorized_pipeline(process_list) -> list:
+    return split_by_days(prepare(process_list))
+
+
+def make_processes(count: int) -> list:
+    """ Случайные процессы в пределах месяца, часть длится несколько суток """
+    rnd = random.Random(0)
+    base = datetime.datetime(2019, 7, 1, tzinfo=datetime.timezone.utc)
+    names = ['Завтрак', 'Обед', 'Ужин', 'Музей', 'Театр', 'Прогулка']
+    processes = []
+    for _ in range(count):
+        start = base + datetime.timedelta(minutes=rnd.randint(0, 60 * 24 * 30))
+        length = datetime.timedelta(minutes=rnd.choice(
+            [30, 60, 90, 180, 60 * 30, 60 * 50]))
+        processes.append((rnd.choice(names), start, start + length))
+    return processes
+
+
+def main(count: int = 10000):
+    processes = make_processes(count)
+    legacy = min(timeit.repeat(lambda: legacy_pipeline(processes),
+                               number=1, repeat=3))
+    vectorized = min(timeit.repeat(lambda: vectorized_pipeline(processes),
+                                   number=1, repeat=3))
+    print(f'процессов: {count}')
+    print(f'построчно:       {legacy:.3f} с')
+    print(f'векторизованно:  {vectorized:.3f} с')
+    print(f'ускорение:       {legacy / vectorized:.1f}x')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,131 @@
+""" Кэш готовых HTML-фрагментов диаграмм Ганта.
+
+Диаграмма туриста меняется только при изменении его питания или экскурсий,
+поэтому фрагмент хранится в кэше Django под ключом из id туриста и
+номеров версий. Версия туриста увеличивается сигналами при сохранении и
+удалении его записей питания и экскурсий, общая версия - при изменении
+справочников питания и экскурсий (названия на диаграмме).
+Старые фрагменты просто перестают запрашиваться и истекают по таймауту.
+
+Версии увеличиваются только в кэше процесса, который сохранил запись.
+Пока кэш локальный (locmem, свой у каждого воркера), другие процессы
+узнают об изменении только по истечении фрагмента, поэтому таймаут
+короткий. С общим кэшем его можно увеличить настройкой
+GANTT_CACHE_TIMEOUT.
+
+Страница со многими диаграммами берет их из кэша одним запросом
+(cached_fragments), а промахи отдает на отрисовку все сразу, чтобы пул
+процессов рисовал их параллельно """
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .rendering import render_many
+
+
+# Сколько секунд хранить фрагмент, если в настройках не задан
+# GANTT_CACHE_TIMEOUT
+GANTT_TIMEOUT = 5 * 60
+
+GLOBAL_VERSION_KEY = 'gantt:version'
+TOURIST_VERSION_KEY = 'gantt:version:{}'
+FRAGMENT_KEY = 'gantt:{}:{}:{}:{}'
+GROUP_FRAGMENT_KEY = 'gantt:group:{}:{}:{}'
+
+# Режимы диаграмм: 'daily' - диаграмма на каждый день, 'tourist' - одна
+# диаграмма на туриста, 'group' - одна диаграмма на группу
+GANTT_MODES = ('daily', 'tourist', 'group')
+
+
+def gantt_timeout() -> int:
+    return getattr(settings, 'GANTT_CACHE_TIMEOUT', GANTT_TIMEOUT)
+
+
+def gantt_mode() -> str:
+    return getattr(settings, 'GANTT_MODE', 'daily')
+
+
+def _bump(key):
+    # add не перезапишет уже существующую версию, incr атомарен в кэше
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # ключ успел истечь или быть вытесненным между add и incr
+        cache.set(key, 1, None)
+
+
+def fragment_key(tourist_id) -> str:
+    tourist_version_key = TOURIST_VERSION_KEY.format(tourist_id)
+    versions = cache.get_many([GLOBAL_VERSION_KEY, tourist_version_key])
+    return FRAGMENT_KEY.format(gantt_mode(), tourist_id,
+                               versions.get(GLOBAL_VERSION_KEY, 0),
+                               versions.get(tourist_version_key, 0))
+
+
+def fragment_keys(tourist_ids: list) -> dict:
+    """ Ключи диаграмм многих туристов {id: ключ} одним запросом к кэшу """
+    keys = {tourist_id: TOURIST_VERSION_KEY.format(tourist_id)
+            for tourist_id in tourist_ids}
+    versions = cache.get_many([GLOBAL_VERSION_KEY] + list(keys.values()))
+    mode, version = gantt_mode(), versions.get(GLOBAL_VERSION_KEY, 0)
+    return {tourist_id: FRAGMENT_KEY.format(mode, tourist_id, version,
+                                            versions.get(key, 0))
+            for tourist_id, key in keys.items()}
+
+
+def group_fragment_key(group, tourist_ids: list) -> str:
+    """ Ключ диаграммы группы меняется при переименовании группы (название
+    подписывает диаграмму), изменении ее состава или версии любого из ее
+    туристов """
+    keys = [TOURIST_VERSION_KEY.format(tourist_id) for tourist_id in tourist_ids]
+    versions = cache.get_many([GLOBAL_VERSION_KEY] + keys)
+    stamp = ','.join(f'{tourist_id}.{versions.get(key, 0)}'
+                     for tourist_id, key in zip(tourist_ids, keys))
+    return GROUP_FRAGMENT_KEY.format(
+        group.id,
+        versions.get(GLOBAL_VERSION_KEY, 0),
+        hashlib.md5(f'{group.group_name}:{stamp}'.encode()).hexdigest()
+    )
+
+
+def cached_gantt(tourist_id, render) -> str:
+    """ Возвращает диаграмму туриста из кэша; при промахе вызывает
+    render() и сохраняет результат """
+    key = fragment_key(tourist_id)
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, gantt_timeout())
+    return html
+
+
+def cached_fragments(keys: dict, job) -> dict:
+    """ Диаграммы {id: HTML} по ключам кэша {id: ключ}. Промахи рисуются
+    разом через render_many по заданиям job(id) и сохраняются в кэш.
+    Диаграммы, которые пул не успел нарисовать, в результат не попадают
+    и кэшируются, когда будут готовы """
+    found = cache.get_many(list(keys.values()))
+    html = {item_id: found[key] for item_id, key in keys.items()
+            if key in found}
+    missing = {item_id: job(item_id) for item_id in keys
+               if item_id not in html}
+    if missing:
+        rendered = render_many(
+            missing,
+            late=lambda item_id, fragment: cache.set(
+                keys[item_id], fragment, gantt_timeout()))
+        cache.set_many({keys[item_id]: fragment
+                        for item_id, fragment in rendered.items()},
+                       gantt_timeout())
+        html.update(rendered)
+    return html
+
+
+def invalidate_tourist(tourist_id):
+    _bump(TOURIST_VERSION_KEY.format(tourist_id))
+
+
+def invalidate_all():
+    _bump(GLOBAL_VERSION_KEY)
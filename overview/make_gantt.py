@@ -1,139 +1,206 @@
+""" Построение диаграмм Ганта по занятиям туристов.
+
+Весь конвейер (проверка, перевод в местное время, разрезание процессов
+по полуночи, сортировка, разбивка по дням) выполняется над столбцами
+pandas/NumPy, без циклов по отдельным процессам """
 import datetime
+import zlib
+
+import numpy as np
 import pandas as pd
-from itertools import groupby
-from bokeh.plotting import figure, save, output_file
-from bokeh.models import ColumnDataSource, Range1d
-from bs4 import BeautifulSoup
+from bokeh.plotting import figure
+from bokeh.models import (ColumnDataSource, Range1d, DateRangeSlider,
+                          CustomJS, HoverTool)
+from bokeh.layouts import column
+from bokeh.embed import components
 from dateutil.tz import tzlocal
-import random
-import os
-
-
-def unpack_lists(lists_in_list: list) -> list:
-    unpacked_list = []
-    for elem in lists_in_list:
-        if type(elem[0]) is str:
-            unpacked_list.append(elem)
-        else:
-            unpacked_list.extend(elem)
-    return unpacked_list
-
-
-def partition_proc(event: list) -> list:
-    """ Функция дробления многодневных процессов и их сортировки по времени начала процесса"""
-
-    def check_date_equality (begin, end) -> bool:
-        """ Функция проверки, совпадает ли день начала с днем конца процесса"""
-        if begin.day == end.day and begin.month == end.month:
-            return True
-        return False
-
-    colors = ['#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78',
-              '#2ca02c', '#98df8a', '#d62728', '#ff9896',
-              '#9467bd', '#c5b0d5', '#8c564b', '#c49c94',
-              '#e377c2', '#f7b6d2', '#bcbd22', '#dbdb8d',
-              '#17becf', '#2ca02c', '#a55194', '#637939']
-    event_title = event[0]
-    begin_event = min(event[1:]).astimezone(tzlocal()).replace(tzinfo=None)
-    end_event = max(event[1:]).astimezone(tzlocal()).replace(tzinfo=None)
-    color = random.choice(colors)
-
-    if not check_date_equality(begin_event, end_event):
-        point = begin_event
-        temp_list = []
-        time_end = datetime.time(23, 59)        # Все суточные процессы заканиваются в полночь
-
-        while not check_date_equality(point, end_event):
-            """ Цикл будет крутиться и на каждом цикле отрезать от процесса сутки, пока
-            последние сутки не сравняются с датой окончания процесса"""
-            part = datetime.datetime.combine(point.date(), time_end)
-            temp_list.append([
-                event_title,
-                point,
-                part,
-                color
-            ])
-
-            point = part + datetime.timedelta(minutes=2)
-        temp_list.append([event_title, point, end_event, color])  # Добавление временного промежутка последних суток
-        return temp_list
-    return [event_title, begin_event, end_event, color]
-
-
-def valid_process(process: list) -> bool:
-    for elem in process:
-        if elem is None:
-            return False
-    return True
-
-
-def main(process_list) -> list:
-    valid_process_list = []
-    for process in process_list:
-        process = list(process)
-        if valid_process(process):
-            valid_process_list.append(partition_proc(process))
-
-    process_list = unpack_lists(valid_process_list)
-    return sorted(process_list, key=lambda x: x[1])
-
-
-def diagram_drow_in_file(day_proc: list, url: str):
-    # Рисует диаграмму Ганта и сохраняет ее в файл
-
-    DF = pd.DataFrame(columns=['Process', 'Start', 'End', 'Color'])
-    diagram_title = str(day_proc[0][1].date().strftime('%d.%m.%Y'))
-    for i, data in enumerate(day_proc[::-1]):
-        DF.loc[i] = data
+
+
+
+COLORS = ['#1f77b4', '#aec7e8', '#ff7f0e', '#ffbb78',
+          '#2ca02c', '#98df8a', '#d62728', '#ff9896',
+          '#9467bd', '#c5b0d5', '#8c564b', '#c49c94',
+          '#e377c2', '#f7b6d2', '#bcbd22', '#dbdb8d',
+          '#17becf', '#2ca02c', '#a55194', '#637939']
+
+# Все суточные процессы заканчиваются в 23:59, а их продолжение
+# на следующий день начинается в 00:01
+DAY_END = pd.Timedelta(hours=23, minutes=59)
+DAY_BEGIN = pd.Timedelta(minutes=1)
+
+
+def process_color(name: str) -> str:
+    """ Цвет процесса зависит только от его названия, поэтому одно занятие
+    выглядит одинаково на всех диаграммах и при каждой отрисовке """
+    return COLORS[zlib.crc32(name.encode()) % len(COLORS)]
+
+
+def to_local(times: pd.Series) -> pd.Series:
+    """ Переводит моменты времени в местное время без указания пояса """
+    return pd.to_datetime(times, utc=True).dt.tz_convert(
+        tzlocal()).dt.tz_localize(None)
+
+
+def prepare(process_list) -> pd.DataFrame:
+    """ Превращает список (название, начало, окончание) в таблицу процессов:
+    отбрасывает неполные записи, переводит время в местное, режет
+    многодневные процессы по полуночи и сортирует по времени начала """
+    DF = pd.DataFrame.from_records(list(process_list),
+                                   columns=['Process', 'Begin', 'Finish'])
+    DF = DF.dropna()
+    if DF.empty:
+        return pd.DataFrame({
+            'Process': pd.Series(dtype=object),
+            'Start': pd.Series(dtype='datetime64[ns]'),
+            'End': pd.Series(dtype='datetime64[ns]'),
+            'Color': pd.Series(dtype=object),
+        })
+
+    begin = to_local(DF.Begin)
+    finish = to_local(DF.Finish)
+    start = np.minimum(begin.values, finish.values)
+    end = np.maximum(begin.values, finish.values)
+
+    # Сколько раз процесс переходит через полночь
+    first_day = start.astype('datetime64[D]')
+    extra_days = (end.astype('datetime64[D]') - first_day).astype(np.int64)
+    parts = extra_days + 1
+
+    # Номер куска внутри своего процесса: 0, 1, ..., extra_days
+    index = np.repeat(np.arange(len(DF)), parts)
+    offsets = np.cumsum(parts) - parts
+    part = np.arange(len(index)) - np.repeat(offsets, parts)
+
+    part_day = (first_day[index] + part).astype('datetime64[ns]')
+    is_first = part == 0
+    is_last = part == extra_days[index]
+
+    result = pd.DataFrame({
+        'Process': DF.Process.values[index],
+        'Start': np.where(is_first, start[index],
+                          part_day + DAY_BEGIN.to_timedelta64()),
+        'End': np.where(is_last, end[index],
+                        part_day + DAY_END.to_timedelta64()),
+    })
+    names = result.Process.unique()
+    result['Color'] = result.Process.map(
+        dict(zip(names, map(process_color, names))))
+    return result.sort_values('Start', kind='mergesort').reset_index(drop=True)
+
+
+def split_by_days(DF: pd.DataFrame) -> list:
+    """ Разбивает таблицу процессов на таблицы отдельных дней """
+    return [day_df for _, day_df in DF.groupby(DF.Start.dt.date, sort=True)]
+
+
+def unique_labels(labels: list) -> list:
+    """ Делает подписи строк уникальными, добавляя номер к повторам """
+    seen = {}
+    result = []
+    for label in labels:
+        seen[label] = seen.get(label, 0) + 1
+        result.append(label if seen[label] == 1 else f'{label} ({seen[label]})')
+    return result
+
+
+def gantt_figure(DF: pd.DataFrame, row: str, x_range, **kwargs):
+    """ Диаграмма Ганта: строка на каждое значение столбца row.
+    Первые по времени строки - сверху """
+    factors = list(dict.fromkeys(DF[row][::-1]))
     G = figure(
-        title=diagram_title,
         x_axis_type='datetime',
-        width=300,
-        height=120,
-        y_range=DF.Process.tolist(),
-        x_range=Range1d(
-            DF.Start.min() - datetime.timedelta(hours=1),
-            DF.End.max() + datetime.timedelta(hours=1))
+        y_range=factors,
+        x_range=x_range,
+        **kwargs
     )
-    DF['ID'] = DF.index + 0.75
-    DF['ID1'] = DF.index + 0.25
-    CDS = ColumnDataSource(DF)
-    G.quad(
+    G.hbar(
+        y=row,
         left='Start',
         right='End',
-        bottom='ID',
-        top='ID1',
+        height=0.5,
         color='Color',
-        source=CDS,
-        line_width=3,
-        )
-    output_file(url)
-    save(G)
+        source=ColumnDataSource(DF),
+    )
+    G.add_tools(HoverTool(tooltips=[('', '@Process')]))
+    return G
 
 
-def parsing_file(url) -> str:
-    with open(url) as html:
-        soup = BeautifulSoup(html, 'html.parser')
-    return str(soup.body.find_all(['div', 'script']))[1:-1]
+def diagram_drow(day_df: pd.DataFrame):
+    # Рисует диаграмму Ганта за один день и возвращает объект figure
+    return gantt_figure(
+        day_df, 'Process',
+        title=day_df.Start.iloc[0].strftime('%d.%m.%Y'),
+        width=300,
+        height=120,
+        x_range=Range1d(
+            day_df.Start.min() - datetime.timedelta(hours=1),
+            day_df.End.max() + datetime.timedelta(hours=1))
+    )
 
 
-def start_gantt(original_list):
-    url = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gantt.html')
+def start_gantt(original_list) -> str:
+    """ Строит диаграммы по дням целиком в памяти, без промежуточного файла.
+    Возвращает HTML: для каждого дня <div> с диаграммой и <script>,
+    который ее отрисовывает """
     diagrams = ''
-    correct_process_list = main(original_list)
-    correct_process_list = [
-        list(elem) for _, elem in groupby(
-            correct_process_list,
-            lambda x: x[1].day
-        )
-    ]
-
-    for day_proc in correct_process_list:
-        diagram_drow_in_file(day_proc, url)
-
-        diagrams += parsing_file(url)
+    for day_df in split_by_days(prepare(original_list)):
+        script, div = components(diagram_drow(day_df))
+        diagrams += div + script
     return diagrams
 
 
-if __name__ == '__main__':
-    diagrams_list = start_gantt(process_list)
+def combined_drow(DF: pd.DataFrame, row: str, title: str = ''):
+    """ Рисует одну диаграмму Ганта на весь период;
+    над диаграммой ползунок для выбора отображаемых дней """
+    begin = DF.Start.min().normalize()
+    # Ползунок дат Bokeh отбрасывает время, поэтому конец - следующая
+    # полночь: иначе последний день нельзя выбрать, а однодневная
+    # поездка дает ползунок с совпадающими началом и концом
+    end = DF.End.max().normalize() + pd.Timedelta(days=1)
+    first_day = min(begin + pd.Timedelta(days=1), end)
+
+    G = gantt_figure(
+        DF, row,
+        title=title,
+        width=900,
+        height=60 + 25 * DF[row].nunique(),
+        x_range=Range1d(begin, first_day),
+        tools='xpan,xwheel_zoom,reset',
+    )
+    slider = DateRangeSlider(
+        title='Дни',
+        start=begin,
+        end=end,
+        value=(begin, first_day),
+        step=1,
+        width=900,
+    )
+    slider.js_on_change('value', CustomJS(args=dict(x_range=G.x_range), code="""
+        x_range.start = cb_obj.value[0];
+        x_range.end = cb_obj.value[1];
+    """))
+    return column(slider, G)
+
+
+def start_gantt_combined(original_list, title: str = '') -> str:
+    """ Одна диаграмма на туриста за всю поездку вместо диаграммы на
+    каждый день: строка на каждый вид занятия """
+    DF = prepare(original_list)
+    if DF.empty:
+        return ''
+    script, div = components(combined_drow(DF, 'Process', title))
+    return div + script
+
+
+def start_group_gantt(tourists_business: list, title: str = '') -> str:
+    """ Одна диаграмма на группу: строка на каждого туриста.
+    tourists_business - список пар (имя туриста, список его занятий) """
+    labels = unique_labels([name for name, _ in tourists_business])
+    frames = []
+    for label, (_, business) in zip(labels, tourists_business):
+        frames.append(prepare(business).assign(Row=label))
+    DF = pd.concat(frames, ignore_index=True) if frames else None
+    if DF is None or DF.empty:
+        return ''
+    script, div = components(combined_drow(DF, 'Row', title))
+    return div + script
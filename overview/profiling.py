@@ -0,0 +1,141 @@
+""" Замеры запросов к базе и времени обработки по каждому HTTP-запросу.
+
+Включается настройкой REQUEST_PROFILING = True. Для каждого запроса
+записываются число запросов к базе, их общее время, самые медленные
+запросы и повторяющиеся запросы: одинаковый с точностью до параметров
+SQL, выполненный много раз, - это и есть N+1. Отдельно учитывается время
+отрисовки диаграмм Ганта (см. timed).
+
+Записи складываются в кольцевой буфер последних запросов процесса
+(страница /crm/requests/ для сотрудников) и в лог 'overview.profiling'
+одной JSON-строкой. Если профилирование выключено, Django вовсе не
+подключает middleware, а timed сводится к одной проверке атрибута """
+import json
+import logging
+import re
+import threading
+import time
+from collections import Counter, deque
+from functools import wraps
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.utils import timezone
+
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних запросов хранить и сколько медленных SQL показывать,
+# если в настройках не заданы REQUEST_PROFILING_BUFFER и _SLOWEST
+BUFFER_SIZE = 200
+SLOWEST = 5
+
+RECENT = deque(maxlen=BUFFER_SIZE)
+_lock = threading.Lock()
+_current = threading.local()
+
+_IN_LIST = re.compile(r'\bIN \((?:[^()]|\([^()]*\))*\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+def fingerprint(sql: str) -> str:
+    """ SQL без конкретных значений: запросы, которые отличаются только
+    параметрами или длиной списка IN, дают одинаковый отпечаток """
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+class Profile:
+    """ Замеры одного HTTP-запроса """
+
+    def __init__(self):
+        self.queries = []
+        self.timings = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        # execute_wrapper: засекаем каждый запрос к базе
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((time.perf_counter() - started, sql))
+
+    def summary(self) -> dict:
+        prints = Counter(fingerprint(sql) for _, sql in self.queries)
+        slowest = sorted(self.queries, key=lambda query: query[0],
+                         reverse=True)[:getattr(
+                             settings, 'REQUEST_PROFILING_SLOWEST', SLOWEST)]
+        return {
+            'queries': len(self.queries),
+            'db_ms': round(sum(spent for spent, _ in self.queries) * 1000, 1),
+            'slowest': [{'ms': round(spent * 1000, 1), 'sql': sql}
+                        for spent, sql in slowest],
+            'duplicates': [{'count': count, 'sql': sql}
+                           for sql, count in prints.most_common()
+                           if count > 1],
+            'timings': {name: round(spent * 1000, 1)
+                        for name, spent in self.timings.items()},
+        }
+
+
+def timed(name):
+    """ Декоратор: время вызовов прибавляется к замерам текущего запроса.
+    Вне профилируемого запроса функция вызывается как есть """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = getattr(_current, 'profile', None)
+            if profile is None:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.timings[name] += time.perf_counter() - started
+        return wrapper
+    return decorator
+
+
+def recent() -> list:
+    """ Записи кольцевого буфера, новые первыми """
+    with _lock:
+        return list(reversed(RECENT))
+
+
+class RequestProfilingMiddleware:
+
+    def __init__(self, get_response):
+        global RECENT
+        if not getattr(settings, 'REQUEST_PROFILING', False):
+            raise MiddlewareNotUsed
+        size = getattr(settings, 'REQUEST_PROFILING_BUFFER', BUFFER_SIZE)
+        if RECENT.maxlen != size:
+            with _lock:
+                RECENT = deque(RECENT, maxlen=size)
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = _current.profile = Profile()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(profile):
+                response = self.get_response(request)
+        finally:
+            _current.profile = None
+        elapsed = time.perf_counter() - started
+
+        record = {
+            'time': timezone.now().isoformat(),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(elapsed * 1000, 1),
+        }
+        record.update(profile.summary())
+        with _lock:
+            RECENT.append(record)
+        logger.info(json.dumps(record, ensure_ascii=False))
+        return response
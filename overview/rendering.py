@@ -0,0 +1,142 @@
+""" Отрисовка диаграмм Ганта для остального кода.
+
+Построение диаграмм (overview.make_gantt) тянет за собой pandas, NumPy
+и Bokeh: это заметная часть времени запуска и памяти процесса. Поэтому
+модели и представления обращаются к этому модулю, а make_gantt
+импортируется только при первой отрисовке. Процессы, которые диаграмм
+не рисуют (команды manage.py, миграции, воркеры, отдающие только
+админку), библиотеки графиков не загружают вовсе.
+
+Построение диаграмм занимает процессор, поэтому много диаграмм сразу
+(render_many) рисуются параллельно в пуле процессов на
+GANTT_RENDER_WORKERS процессов. Задания - простые кортежи из названий и
+моментов времени, результат - готовые HTML-фрагменты для вставки в
+страницу. Страница ждет пул не дольше GANTT_RENDER_TIMEOUT секунд:
+медленная диаграмма не держит процесс веб-сервера """
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from importlib import import_module
+
+from django.conf import settings
+
+from .profiling import timed
+
+
+# Процессов в пуле и сколько секунд ждать диаграммы, если в настройках не
+# заданы GANTT_RENDER_WORKERS и GANTT_RENDER_TIMEOUT.
+# 0 процессов - рисовать в самом процессе веб-сервера
+WORKERS = 0
+TIMEOUT = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def renderer():
+    """ Модуль построения диаграмм; импортируется при первом обращении """
+    return import_module('overview.make_gantt')
+
+
+@timed('gantt')
+def render_tourist_gantt(business, mode='daily') -> str:
+    """ Диаграммы по занятиям туриста: по одной на день в режиме 'daily',
+    иначе одна общая """
+    return render_job(tourist_job(business, mode))
+
+
+@timed('gantt')
+def render_group_gantt(tourists_business, title='') -> str:
+    """ Одна диаграмма на группу: tourists_business - пары
+    (имя туриста, его занятия) """
+    return render_job(group_job(tourists_business, title))
+
+
+def tourist_job(business, mode='daily') -> tuple:
+    """ Задание отрисовки диаграмм туриста для render_many """
+    return ('tourist', mode, business)
+
+
+def group_job(tourists_business, title='') -> tuple:
+    """ Задание отрисовки диаграммы группы для render_many """
+    return ('group', title, tourists_business)
+
+
+def render_job(job) -> str:
+    """ Выполняет задание tourist_job или group_job. Время отрисовки
+    учитывают render_many и render_*_gantt, которые его вызывают:
+    в процессах пула замеров текущего запроса все равно нет """
+    kind, option, data = job
+    if kind == 'group':
+        return renderer().start_group_gantt(data, option)
+    if option == 'daily':
+        return renderer().start_gantt(data)
+    return renderer().start_gantt_combined(data)
+
+
+def workers() -> int:
+    return getattr(settings, 'GANTT_RENDER_WORKERS', WORKERS)
+
+
+def pool() -> ProcessPoolExecutor:
+    """ Пул процессов отрисовки, создается при первом обращении.
+    Процессы запускаются через spawn: fork многопоточного веб-сервера
+    копирует чужие блокировки и соединения с базой. Каждый процесс
+    сразу импортирует библиотеки графиков """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                workers(), mp_context=multiprocessing.get_context('spawn'),
+                initializer=renderer)
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def render_inline(jobs: dict) -> dict:
+    return {key: render_job(job) for key, job in jobs.items()}
+
+
+@timed('gantt')
+def render_many(jobs: dict, late=None) -> dict:
+    """ Рисует задания {ключ: задание} и возвращает {ключ: HTML}.
+    Диаграммы, не готовые через GANTT_RENDER_TIMEOUT секунд, в результат
+    не попадают; когда они все же будут нарисованы, вызывается
+    late(ключ, HTML). Если процесс пула упал, оставшееся рисуется здесь же """
+    if not jobs or workers() < 1:
+        return render_inline(jobs)
+    try:
+        futures = {pool().submit(render_job, job): key
+                   for key, job in jobs.items()}
+    except BrokenProcessPool:
+        shutdown_pool()
+        return render_inline(jobs)
+
+    done, pending = wait(futures, timeout=getattr(
+        settings, 'GANTT_RENDER_TIMEOUT', TIMEOUT))
+    results, broken = {}, {}
+    for future in done:
+        key = futures[future]
+        try:
+            results[key] = future.result()
+        except BrokenProcessPool:
+            broken[key] = jobs[key]
+    if broken:
+        shutdown_pool()
+        results.update(render_inline(broken))
+
+    if late is not None:
+        def finished(future):
+            if not future.cancelled() and future.exception() is None:
+                late(futures[future], future.result())
+        for future in pending:
+            future.add_done_callback(finished)
+    return results
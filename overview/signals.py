@@ -0,0 +1,38 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from tourists.models import (Tourist, TimelineForNutrition,
+                             TimelineForExcursion, DatelineForHotel,
+                             Nutrition, Excursion, Hotel)
+from .gantt_cache import invalidate_tourist, invalidate_all
+from .timeline import touch_timeline
+
+
+@receiver([post_save, post_delete], sender=TimelineForNutrition)
+@receiver([post_save, post_delete], sender=TimelineForExcursion)
+def timeline_changed(sender, instance, **kwargs):
+    invalidate_tourist(instance.tourist_id)
+
+
+@receiver(post_save, sender=Tourist)
+def tourist_changed(sender, instance, **kwargs):
+    # имя туриста подписывает его строку на диаграмме группы
+    invalidate_tourist(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Nutrition)
+@receiver([post_save, post_delete], sender=Excursion)
+def business_changed(sender, **kwargs):
+    invalidate_all()
+
+
+@receiver([post_save, post_delete], sender=TimelineForNutrition)
+@receiver([post_save, post_delete], sender=TimelineForExcursion)
+@receiver([post_save, post_delete], sender=DatelineForHotel)
+@receiver([post_save, post_delete], sender=Tourist)
+@receiver([post_save, post_delete], sender=Nutrition)
+@receiver([post_save, post_delete], sender=Excursion)
+@receiver([post_save, post_delete], sender=Hotel)
+def schedule_changed(sender, **kwargs):
+    # расписание для /crm/timeline/ включает названия туристов и занятий
+    touch_timeline()
@@ -0,0 +1,42 @@
+""" Подмены отрисовки для проверок пула процессов (см. overview.tests).
+
+Процесс пула находит функцию задания по имени модуля, поэтому подмены
+лежат в отдельном модуле без моделей Django: его можно импортировать
+в процессе пула, где Django не настроен """
+import multiprocessing
+import os
+import time
+
+
+# Сколько секунд рисуется "зависшая" диаграмма
+STUCK_SECONDS = 3
+
+
+def sleepy_render(job) -> str:
+    """ Задание (вид, секунд, HTML): ждет и возвращает HTML """
+    _, seconds, html = job
+    time.sleep(seconds)
+    return html
+
+
+def stuck_render(job) -> str:
+    """ Любое задание рисуется дольше, чем страница ждет пул """
+    time.sleep(STUCK_SECONDS)
+    return '<div>late</div>'
+
+
+def crashing_render(job) -> str:
+    """ В процессе пула задание роняет процесс, в основном процессе
+    возвращает HTML из задания (вид, что угодно, HTML) """
+    if multiprocessing.parent_process() is not None:
+        os._exit(1)
+    return job[2]
+
+
+def pid_render(job) -> str:
+    """ Номер процесса, в котором выполнено задание """
+    return str(os.getpid())
+
+
+def light_start():
+    """ Запуск процесса пула без импорта библиотек графиков """
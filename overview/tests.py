@@ -1,3 +1,424 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import deque
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.test import (SimpleTestCase, TestCase, RequestFactory,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+
+from overview import profiling, rendering, testing
+from overview.gantt_cache import (cached_fragments, fragment_key,
+                                  fragment_keys, group_fragment_key)
+from overview.profiling import RequestProfilingMiddleware, recent
+from overview.rendering import (renderer, render_many, render_tourist_gantt,
+                                tourist_job)
+from tourists.models import (Group, Tourist, Nutrition, Excursion,
+                             TimelineForNutrition, TimelineForExcursion)
+
+
+# Процесс, который не рисует диаграмм: django.setup() и загрузка всех
+# URL (а с ними представлений и админки). Бюджет переопределяется
+# настройкой STARTUP_BUDGET = {'seconds': ..., 'rss_mb': ...}
+STARTUP_BUDGET = {'seconds': 1.0, 'rss_mb': 90}
+
+CHART_MODULES = ('pandas', 'numpy', 'bokeh')
+
+STARTUP_SCRIPT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+seconds = time.perf_counter() - started
+try:
+    # ru_maxrss в Linux наследуется от запустившего процесса
+    with open('/proc/self/status') as status:
+        rss = next(int(line.split()[1]) for line in status
+                   if line.startswith('VmHWM'))
+except OSError:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({
+    'seconds': seconds,
+    'rss_mb': rss / 1024,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+''' % (CHART_MODULES,)
+
+
+def slowest_imports(importtime: str, count=10) -> list:
+    """ Самые долгие импорты из вывода python -X importtime """
+    imports = []
+    for line in importtime.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+class StartupTests(SimpleTestCase):
+    """ Запуск процесса без отрисовки диаграмм не загружает
+    библиотеки графиков и укладывается в бюджет времени и памяти """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'tourism.settings')
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            check=True)
+        cls.startup = json.loads(process.stdout.strip().splitlines()[-1])
+        cls.imports = slowest_imports(process.stderr)
+        cls.budget = dict(STARTUP_BUDGET,
+                          **getattr(settings, 'STARTUP_BUDGET', {}))
+
+    def report(self) -> str:
+        return '\n'.join(f'{microseconds / 1e6:.3f} с  {name}'
+                         for microseconds, name in self.imports)
+
+    def test_chart_libraries_not_loaded(self):
+        self.assertEqual(self.startup['loaded'], [],
+                         f'Загружены библиотеки графиков:\n{self.report()}')
+
+    def test_setup_time(self):
+        self.assertLessEqual(
+            self.startup['seconds'], self.budget['seconds'],
+            f"django.setup() {self.startup['seconds']:.2f} с, "
+            f"бюджет {self.budget['seconds']} с:\n{self.report()}")
+
+    def test_resident_memory(self):
+        self.assertLessEqual(
+            self.startup['rss_mb'], self.budget['rss_mb'],
+            f"Память {self.startup['rss_mb']:.0f} МБ, "
+            f"бюджет {self.budget['rss_mb']} МБ:\n{self.report()}")
+
+
+class CombinedGanttTests(SimpleTestCase):
+    """ Ползунок дней на общей диаграмме """
+
+    def slider(self, days):
+        start = timezone.now().replace(hour=3, minute=0, second=0,
+                                       microsecond=0)
+        business = [('Обед', start + datetime.timedelta(days=day),
+                     start + datetime.timedelta(days=day, hours=1))
+                    for day in range(days)]
+        make_gantt = renderer()
+        return make_gantt.combined_drow(make_gantt.prepare(business),
+                                        'Process').children[0]
+
+    def test_single_day(self):
+        slider = self.slider(1)
+        self.assertGreater(slider.end, slider.start)
+
+    def test_last_day_selectable(self):
+        slider = self.slider(3)
+        self.assertEqual(slider.end - slider.start, 3 * 24 * 60 * 60 * 1000)
+
+
+class FragmentKeyTests(TestCase):
+    """ Ключи кэша диаграмм туриста и группы меняются при изменении
+    всего, что на них показано """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tourist = Tourist.objects.create(name='Турист', phone='1')
+        cls.other = Tourist.objects.create(name='Другой', phone='2')
+        cls.lunch = Nutrition.objects.create(name='Обед', cost=300)
+        cls.museum = Excursion.objects.create(name='Музей', cost=500)
+        cls.time_from = timezone.now() + datetime.timedelta(days=1)
+        cls.time_to = cls.time_from + datetime.timedelta(hours=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNewKey(self, change, tourists):
+        """ change() меняет ключи туристов tourists и только их """
+        ids = [self.tourist.id, self.other.id]
+        before = fragment_keys(ids)
+        change()
+        after = fragment_keys(ids)
+        self.assertEqual(after[self.tourist.id],
+                         fragment_key(self.tourist.id))
+        self.assertEqual({tourist_id for tourist_id in ids
+                          if after[tourist_id] != before[tourist_id]},
+                         {tourist.id for tourist in tourists})
+
+    def check_row(self, model, **item):
+        row = model(tourist=self.tourist, time_from=self.time_from,
+                    time_to=self.time_to, **item)
+        self.assertNewKey(row.save, [self.tourist])
+        row.time_to += datetime.timedelta(hours=1)
+        self.assertNewKey(row.save, [self.tourist])
+        self.assertNewKey(row.delete, [self.tourist])
+
+    def test_nutrition_row(self):
+        self.check_row(TimelineForNutrition, nutrition=self.lunch)
+
+    def test_excursion_row(self):
+        self.check_row(TimelineForExcursion, excursion=self.museum)
+
+    def test_reference_name(self):
+        everyone = [self.tourist, self.other]
+        self.lunch.name = 'Поздний обед'
+        self.assertNewKey(self.lunch.save, everyone)
+        self.museum.name = 'Музей искусств'
+        self.assertNewKey(self.museum.save, everyone)
+        self.assertNewKey(self.museum.delete, everyone)
+
+    def test_group_name(self):
+        group = Group.objects.create(group_name='Группа', status='c')
+        key = group_fragment_key(group, [self.tourist.id])
+        group.group_name = 'Группа 2'
+        group.save()
+        group = Group.objects.get(pk=group.pk)
+        self.assertNotEqual(group_fragment_key(group, [self.tourist.id]), key)
+
+
+# Пояс, в котором PrepareTests ждут местное время
+VLADIVOSTOK = datetime.timezone(datetime.timedelta(hours=10))
+
+
+def local(day, hour, minute=0) -> datetime.datetime:
+    return datetime.datetime(2026, 1, day, hour, minute, tzinfo=VLADIVOSTOK)
+
+
+class PrepareTests(SimpleTestCase):
+    """ Таблица процессов из prepare() на заданном списке занятий """
+
+    def prepare(self, business) -> list:
+        make_gantt = renderer()
+        with mock.patch.object(make_gantt, 'tzlocal', lambda: VLADIVOSTOK):
+            DF = make_gantt.prepare(business)
+        return [(process, start.to_pydatetime(), end.to_pydatetime(), color)
+                for process, start, end, color in DF.itertuples(
+                    index=False, name=None)]
+
+    def test_frame(self):
+        frame = self.prepare([
+            ('Отель', local(10, 20), local(12, 10)),
+            # время в UTC переводится в местное
+            ('Обед', datetime.datetime(2026, 1, 11, 3,
+                                       tzinfo=datetime.timezone.utc),
+             local(11, 14)),
+            # начало и окончание перепутаны
+            ('Экскурсия', local(11, 17), local(11, 15)),
+            ('Ужин', None, local(11, 20)),
+        ])
+        naive = datetime.datetime
+        self.assertEqual(frame, [
+            ('Отель', naive(2026, 1, 10, 20), naive(2026, 1, 10, 23, 59),
+             '#e377c2'),
+            ('Отель', naive(2026, 1, 11, 0, 1), naive(2026, 1, 11, 23, 59),
+             '#e377c2'),
+            ('Обед', naive(2026, 1, 11, 13), naive(2026, 1, 11, 14),
+             '#ff9896'),
+            ('Экскурсия', naive(2026, 1, 11, 15), naive(2026, 1, 11, 17),
+             '#dbdb8d'),
+            ('Отель', naive(2026, 1, 12, 0, 1), naive(2026, 1, 12, 10),
+             '#e377c2'),
+        ])
+
+    def test_empty(self):
+        frame = renderer().prepare([('Ужин', None, None)])
+        self.assertEqual(list(frame.columns),
+                         ['Process', 'Start', 'End', 'Color'])
+        self.assertTrue(frame.empty)
+
+    def test_color_by_name(self):
+        # цвет не зависит от порядка и набора занятий на диаграмме
+        first = self.prepare([('Обед', local(11, 13), local(11, 14)),
+                              ('Отель', local(11, 20), local(11, 22))])
+        second = self.prepare([('Отель', local(12, 20), local(12, 22))])
+        self.assertEqual(first[1][3], second[0][3])
+
+
+class SlowRenderer:
+    """ Подмена make_gantt: каждая диаграмма рисуется DELAY секунд """
+    DELAY = 0.05
+
+    def start_gantt(self, business):
+        time.sleep(self.DELAY)
+        return '<div></div>'
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_BUFFER=3,
+                   GANTT_RENDER_WORKERS=0)
+class RequestProfilingTests(TestCase):
+    """ Замеры запросов: N+1, время диаграмм и буфер последних запросов """
+
+    def setUp(self):
+        # middleware заменяет буфер на буфер другого размера
+        self.addCleanup(setattr, profiling, 'RECENT', profiling.RECENT)
+        profiling.RECENT = deque(maxlen=profiling.BUFFER_SIZE)
+        self.factory = RequestFactory()
+
+    def profile(self, view, path='/'):
+        middleware = RequestProfilingMiddleware(view)
+        middleware(self.factory.get(path))
+        return recent()[0]
+
+    def test_disabled(self):
+        with override_settings(REQUEST_PROFILING=False):
+            with self.assertRaises(MiddlewareNotUsed):
+                RequestProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_n_plus_one(self):
+        def view(request):
+            for pk in range(4):
+                list(User.objects.filter(pk=pk))
+            return HttpResponse()
+
+        record = self.profile(view)
+        self.assertEqual(record['queries'], 4)
+        [duplicate] = record['duplicates']
+        self.assertEqual(duplicate['count'], 4)
+
+    @mock.patch('overview.rendering.renderer', SlowRenderer)
+    def test_gantt_counted_once(self):
+        def view(request):
+            render_many({1: tourist_job([])})
+            render_tourist_gantt([])
+            return HttpResponse()
+
+        gantt = self.profile(view)['timings']['gantt']
+        self.assertGreaterEqual(gantt, 2 * SlowRenderer.DELAY * 1000)
+        self.assertLess(gantt, 3 * SlowRenderer.DELAY * 1000)
+
+    def test_ring_buffer(self):
+        for number in range(5):
+            self.profile(lambda request: HttpResponse(), f'/{number}/')
+        self.assertEqual([record['path'] for record in recent()],
+                         ['/4/', '/3/', '/2/'])
+
+    def test_request_log_staff_only(self):
+        url = reverse('request_log')
+        self.assertEqual(self.client.get(url).status_code, 302)
+        user = User.objects.create_user('user', password='pass')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        user.is_staff = True
+        user.save()
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+def wait_for(condition, seconds=15) -> bool:
+    """ Ждет, пока condition() не станет истинным, не дольше seconds """
+    deadline = time.monotonic() + seconds
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+
+def stop_pool():
+    """ Останавливает пул и дожидается его процессов, чтобы они не
+    мешали замерам времени в следующих тестах """
+    running = rendering._pool
+    rendering.shutdown_pool()
+    if running is not None:
+        running.shutdown(wait=True)
+
+
+@override_settings(GANTT_RENDER_WORKERS=2, GANTT_RENDER_TIMEOUT=1)
+class RenderPoolTests(SimpleTestCase):
+    """ Отрисовка многих диаграмм в пуле процессов: таймаут, поздние
+    диаграммы, падение процесса пула и отрисовка без пула """
+
+    def setUp(self):
+        rendering.shutdown_pool()
+        self.addCleanup(stop_pool)
+        # задания подменены, библиотеки графиков процессам пула не нужны
+        patcher = mock.patch('overview.rendering.renderer',
+                             testing.light_start)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    def warm_up(self):
+        # запуск процессов пула через spawn может быть дольше таймаута
+        with override_settings(GANTT_RENDER_TIMEOUT=60):
+            render_many({number: ('sleep', 0.2, '') for number in range(2)})
+
+    @mock.patch('overview.rendering.render_job', testing.sleepy_render)
+    def test_timeout(self):
+        self.warm_up()
+        late = {}
+        results = render_many({'fast': ('sleep', 0, 'fast'),
+                               'slow': ('sleep', testing.STUCK_SECONDS,
+                                        'slow')},
+                              late=late.__setitem__)
+        self.assertEqual(results, {'fast': 'fast'})
+        self.assertTrue(wait_for(lambda: 'slow' in late))
+        self.assertEqual(late, {'slow': 'slow'})
+
+    @mock.patch('overview.rendering.render_job', testing.sleepy_render)
+    def test_late_fragment_cached(self):
+        self.warm_up()
+        found = cached_fragments(
+            {1: 'test:gantt:1'},
+            lambda item_id: ('sleep', testing.STUCK_SECONDS, 'slow'))
+        self.assertEqual(found, {})
+        self.assertTrue(wait_for(lambda: cache.get('test:gantt:1')))
+        self.assertEqual(cache.get('test:gantt:1'), 'slow')
+
+    @override_settings(GANTT_RENDER_TIMEOUT=60)
+    @mock.patch('overview.rendering.render_job', testing.crashing_render)
+    def test_broken_pool(self):
+        broken = rendering.pool()
+        results = render_many({1: ('crash', None, 'first'),
+                               2: ('crash', None, 'second')})
+        self.assertEqual(results, {1: 'first', 2: 'second'})
+        self.assertIsNot(rendering.pool(), broken)
+
+    @override_settings(GANTT_RENDER_WORKERS=0)
+    @mock.patch('overview.rendering.render_job', testing.pid_render)
+    def test_inline(self):
+        self.assertEqual(render_many({1: None}), {1: str(os.getpid())})
+        self.assertIsNone(rendering._pool)
+
+
+@override_settings(GANTT_MODE='tourist', GANTT_RENDER_WORKERS=1,
+                   GANTT_RENDER_TIMEOUT=0.5)
+class CrmRenderTimeoutTests(TestCase):
+    """ Диаграмма, которую пул не успел нарисовать, дает пустую ячейку
+    на странице CRM, а не ошибку """
+
+    @classmethod
+    def setUpTestData(cls):
+        group = Group.objects.create(group_name='Группа', status='c')
+        cls.tourist = Tourist.objects.create(name='Турист', phone='1',
+                                             group=group)
+
+    def setUp(self):
+        rendering.shutdown_pool()
+        self.addCleanup(stop_pool)
+        # задания подменены, библиотеки графиков процессам пула не нужны
+        patcher = mock.patch('overview.rendering.renderer',
+                             testing.light_start)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        cache.clear()
+
+    @mock.patch('overview.rendering.render_job', testing.stuck_render)
+    def test_empty_cell(self):
+        response = self.client.get(reverse('crm_url'))
+        self.assertEqual(response.status_code, 200)
+        [tourist] = [tourist for tourists in response.context['groups'].values()
+                     for tourist in tourists]
+        self.assertEqual(tourist.gantt_html, '')
+        self.assertNotContains(response, '<div>late</div>')
@@ -0,0 +1,90 @@
+""" Расписание группы или периода в компактном столбцовом виде.
+
+Вместо списка словарей отдаются параллельные массивы: для i-го промежутка
+tourist[i], kind[i], item[i], start[i] и end[i]. Время задается в минутах
+от начала отсчета epoch. Названия туристов и занятий отдаются отдельными
+справочниками, по одному разу на каждый id.
+
+Для условных GET в базе хранится номер версии и время последнего
+изменения расписания (TimelineVersion), их обновляют сигналы
+(см. overview.signals) и массовые изменения в обход сигналов """
+from django.db.models import F
+from django.utils import timezone
+
+from tourists.models import (TimelineForNutrition, TimelineForExcursion,
+                             DatelineForHotel, TimelineVersion)
+
+
+# Коды видов занятий в массиве kind
+KINDS = (
+    ('nutrition', TimelineForNutrition),
+    ('excursion', TimelineForExcursion),
+    ('hotel', DatelineForHotel),
+)
+
+VERSION_ID = 1
+
+
+def touch_timeline():
+    """ Отмечает, что расписание изменилось """
+    changed = timezone.now().replace(microsecond=0)
+    updated = TimelineVersion.objects.filter(pk=VERSION_ID).update(
+        version=F('version') + 1, changed=changed)
+    if not updated:
+        TimelineVersion.objects.get_or_create(
+            pk=VERSION_ID, defaults={'version': 1, 'changed': changed})
+
+
+def timeline_version() -> tuple:
+    """ Номер версии и время последнего изменения расписания """
+    state = TimelineVersion.objects.filter(pk=VERSION_ID).values_list(
+        'version', 'changed').first()
+    if state is None:
+        touch_timeline()
+        state = TimelineVersion.objects.filter(pk=VERSION_ID).values_list(
+            'version', 'changed').get()
+    return state
+
+
+def build_timeline(group=None, date_from=None, date_to=None) -> dict:
+    """ Все промежутки группы и/или периода, по одному запросу на таблицу.
+    Из периода берутся промежутки, пересекающиеся с [date_from, date_to) """
+    filters = {}
+    if group is not None:
+        filters['tourist__group'] = group
+    if date_from is not None:
+        filters['time_to__gt'] = date_from
+    if date_to is not None:
+        filters['time_from__lt'] = date_to
+
+    rows, tourists, items = [], {}, {}
+    for code, (name, model) in enumerate(KINDS):
+        labels = items.setdefault(name, {})
+        for values in model.objects.filter(**filters).order_by(
+                'time_from').values_list(
+                'tourist', 'tourist__name', name, f'{name}__name',
+                'time_from', 'time_to'):
+            tourist_id, tourist_name, item_id, item_name, time_from, time_to = values
+            tourists[tourist_id] = tourist_name
+            if item_id is not None:
+                labels[item_id] = item_name
+            rows.append((tourist_id, code, item_id, time_from, time_to))
+
+    epoch = min((row[3] for row in rows), default=timezone.now())
+    epoch = epoch.replace(second=0, microsecond=0)
+
+    def minutes(moment) -> int:
+        return int((moment - epoch).total_seconds() // 60)
+
+    return {
+        'epoch': epoch.isoformat(),
+        'unit': 'minute',
+        'kinds': [name for name, _ in KINDS],
+        'tourist': [row[0] for row in rows],
+        'kind': [row[1] for row in rows],
+        'item': [row[2] for row in rows],
+        'start': [minutes(row[3]) for row in rows],
+        'end': [minutes(row[4]) for row in rows],
+        'tourists': tourists,
+        'items': items,
+    }
@@ -1,7 +1,9 @@
 from django.urls import path
 
-from overview.views import CRM
+from overview.views import CRM, timeline_json, request_log
 
 urlpatterns = [
     path('', CRM.as_view(), name='crm_url'),
+    path('timeline/', timeline_json, name='timeline_json'),
+    path('requests/', request_log, name='request_log'),
 ]
\ No newline at end of file
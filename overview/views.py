@@ -1,6 +1,23 @@
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.shortcuts import render
-from tourists.models import Tourist, Group
+from django.http import JsonResponse, HttpResponseBadRequest
+from django.views.decorators.http import condition
+from django.db.models import Prefetch
+from django.utils import timezone
+from tourists.models import (Tourist, Group, TimelineForNutrition,
+                             TimelineForExcursion, DatelineForHotel)
 from django.views.generic import TemplateView
+from overview.gantt_cache import (gantt_mode, cached_fragments, fragment_keys,
+                                  group_fragment_key)
+from overview.rendering import tourist_job, group_job
+from overview.timeline import build_timeline, timeline_version
+from overview.profiling import recent
+from tourists.export import day_bounds
 
 
 class CRM(TemplateView):
@@ -8,12 +25,118 @@ class CRM(TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        groups_with_tourists = {}
-        groups = Group.objects.exclude(status='g')
-        for group in groups:
-            groups_with_tourists.update({group: Tourist.objects.filter(group=group.id).order_by('name')})
+        # Группы, их туристы и все временные оси туристов загружаются
+        # фиксированным числом запросов, независимо от их количества
+        tourists = Tourist.objects.with_status(timezone.now()).order_by(
+            'name').prefetch_related(
+            Prefetch('timelinefornutrition_set',
+                     queryset=TimelineForNutrition.objects.select_related(
+                         'nutrition')),
+            Prefetch('timelineforexcursion_set',
+                     queryset=TimelineForExcursion.objects.select_related(
+                         'excursion')),
+            Prefetch('datelineforhotel_set',
+                     queryset=DatelineForHotel.objects.select_related('hotel')),
+        )
+        groups = Group.objects.filter(
+            status__in=Group.ACTIVE_STATUSES).prefetch_related(
+            Prefetch('tourist_set', queryset=tourists))
+
+        mode = gantt_mode()
+        groups_with_tourists = {group: group.tourist_set.all()
+                                for group in groups}
+        # Диаграммы, которых нет в кэше, рисуются разом в пуле процессов
+        if mode == 'group':
+            by_id = {group.id: (group, tourists)
+                     for group, tourists in groups_with_tourists.items()}
+            fragments = cached_fragments(
+                {group_id: group_fragment_key(
+                    group, [tourist.id for tourist in tourists])
+                 for group_id, (group, tourists) in by_id.items()},
+                lambda group_id: group_job(
+                    [(tourist.name, tourist.gantt_business())
+                     for tourist in by_id[group_id][1]],
+                    by_id[group_id][0].group_name)
+            )
+            for group_id, (group, _) in by_id.items():
+                group.gantt_html = fragments.get(group_id, '')
+        else:
+            by_id = {tourist.id: tourist
+                     for tourists in groups_with_tourists.values()
+                     for tourist in tourists}
+            fragments = cached_fragments(
+                fragment_keys(list(by_id)),
+                lambda tourist_id: tourist_job(
+                    by_id[tourist_id].gantt_business(), mode)
+            )
+            for tourist_id, tourist in by_id.items():
+                tourist.gantt_html = fragments.get(tourist_id, '')
 
         context.update(
-            {'groups': groups_with_tourists}
+            {'groups': groups_with_tourists, 'gantt_mode': mode}
         )
         return context
+
+
+def parse_timeline_params(request) -> dict:
+    """ Параметры расписания: group - id группы, date_from и date_to -
+    даты ГГГГ-ММ-ДД. Нужен хотя бы один из них """
+    params = {}
+    try:
+        if request.GET.get('group'):
+            params['group'] = int(request.GET['group'])
+        dates = [
+            datetime.datetime.strptime(request.GET[name], '%Y-%m-%d').date()
+            if request.GET.get(name) else None
+            for name in ('date_from', 'date_to')
+        ]
+    except ValueError:
+        return None
+    if not params and dates == [None, None]:
+        return None
+    params['date_from'], params['date_to'] = day_bounds(*dates)
+    return params
+
+
+def request_timeline_version(request) -> tuple:
+    """ Версия расписания, читается из базы один раз на запрос """
+    if not hasattr(request, 'timeline_version'):
+        request.timeline_version = timeline_version()
+    return request.timeline_version
+
+
+def timeline_etag(request):
+    version, _ = request_timeline_version(request)
+    return hashlib.md5(
+        f'{version}:{request.GET.urlencode()}'.encode()).hexdigest()
+
+
+def timeline_last_modified(request):
+    _, changed = request_timeline_version(request)
+    return changed
+
+
+@staff_member_required
+@condition(etag_func=timeline_etag, last_modified_func=timeline_last_modified)
+def timeline_json(request):
+    """ Расписание группы или периода для отрисовки на клиенте.
+    Повторный запрос без изменений расписания получает 304 после
+    одного запроса версии из базы. Доступ проверяется до условного GET:
+    иначе аноним по ETag узнал бы, менялось ли расписание """
+    params = parse_timeline_params(request)
+    if params is None:
+        return HttpResponseBadRequest(
+            'Укажите group или date_from/date_to в формате ГГГГ-ММ-ДД')
+    return JsonResponse(build_timeline(**params))
+
+
+@staff_member_required
+def request_log(request):
+    """ Последние замеры запросов этого процесса (см. overview.profiling) """
+    context = admin.site.each_context(request)
+    context.update({
+        'title': 'Замеры запросов',
+        'enabled': getattr(settings, 'REQUEST_PROFILING', False),
+        'records': recent(),
+    })
+    return render(request, 'overview/request_log.html', context)
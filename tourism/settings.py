@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'overview.profiling.RequestProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,6 +84,50 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Хранит готовые диаграммы Ганта. locmem у каждого процесса свой, и
+# сброс диаграммы после изменения виден остальным воркерам только по
+# истечении GANTT_CACHE_TIMEOUT секунд. С общим кэшем (FileBasedCache,
+# DatabaseCache, Memcached) таймаут можно поднять до недели
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'crm',
+    }
+}
+
+GANTT_CACHE_TIMEOUT = 5 * 60
+
+# Диаграммы Ганта на странице /crm/: 'daily' - по диаграмме на каждый день,
+# 'tourist' - одна диаграмма на туриста, 'group' - одна на группу
+
+GANTT_MODE = 'tourist'
+
+# Диаграммы, которых нет в кэше, рисуются параллельно в стольких процессах
+# (0 - в процессе веб-сервера); страница ждет их не дольше таймаута в
+# секундах, остальные появятся в кэше к следующему открытию
+
+GANTT_RENDER_WORKERS = 2
+GANTT_RENDER_TIMEOUT = 10
+
+# PDF-документы туристов (tourists.pdf): шрифты с кириллицей (обычный и
+# жирный) и число процессов для выгрузки документов целой группы
+
+PDF_FONTS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+)
+PDF_WORKERS = 2
+
+# Замеры запросов к базе и времени по каждому запросу (overview.profiling),
+# смотреть на /crm/requests/. Выключенные замеры ничего не стоят
+
+REQUEST_PROFILING = False
+REQUEST_PROFILING_BUFFER = 200
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -128,4 +173,12 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-MEDIA_URL = '/media/'
\ No newline at end of file
+MEDIA_URL = '/media/'
+
+# Загруженные файлы отдаются после проверки прав (tourists.media). Саму
+# передачу за Django может выполнять фронтенд-сервер: 'x-accel-redirect'
+# (nginx, внутренний location MEDIA_ACCEL_PREFIX) или 'x-sendfile'
+# (Apache mod_xsendfile); пусто - отдает Django
+
+MEDIA_SENDFILE_BACKEND = ''
+MEDIA_ACCEL_PREFIX = '/protected-media/'
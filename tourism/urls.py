@@ -1,10 +1,11 @@
+import re
+
 from django.contrib import admin
 from django.urls import path, re_path, include
 from django.views.generic import RedirectView
 from django.conf.urls.static import static
 from django.conf import settings
 from django.conf.urls import url
-from django.views.static import serve
 
 
 from tourists import views
@@ -17,12 +18,12 @@ urlpatterns = [
 
 # ... the rest of your URLconf goes here ...
 
-if settings.DEBUG:
-    urlpatterns += [
-        re_path(r'^media/(?P<path>.*)$', serve, {
-            'document_root': settings.MEDIA_ROOT,
-        }),
-    ]
+# Загруженные документы отдаются только сотрудникам и во всех режимах,
+# а не только при DEBUG (см. tourists.media)
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+            views.media_file, name='media'),
+]
 
 admin.site.site_header = "CRM Туристическая фирма"
 admin.site.site_title = "CRM Туристическая фирма"
\ No newline at end of file
@@ -5,21 +5,133 @@ from django.urls import reverse
 from django.conf.urls import url
 from django.utils.html import format_html
 from django.contrib import messages
+from django.forms.models import BaseInlineFormSet
+from django.db.models import Q
+from django.http import HttpResponseRedirect
 
+from tourists.groups import (active_groups, reset_active_groups,
+                             move_tourists, GroupUnavailable)
 from tourists.models import (TimelineForNutrition, DatelineForHotel, FeedFile,
-TimelineForExcursion, Tourist, Event, Group, Hotel, Excursion, Nutrition)
+TimelineForExcursion, Tourist, Event, Group, Hotel, Excursion, Nutrition,
+HotelOccupancy, FULL_PACKAGE_OF_DOCUMENTS)
 from tourists import views
+from tourists.overlaps import find_overlaps
+from tourists.occupancy import (overbooked, capacity_error, lock_hotels,
+                                verify_capacity, Overbooked)
+from tourists.events import resolve_events
+from tourists.export import (invoice_rows, csv_response, xlsx_response,
+                             pdf_zip_response)
+
+
+class TimelineOverlapCheck:
+    """ Проверка пересечений по всем формсетам временных осей одной формы
+    туриста. Строки разных инлайнов (питание и экскурсии) сверяются между
+    собой по введенным значениям, а не по тем, что сохранены в базе.
+    Выполняется один раз на форму, одним запросом на группу таблиц """
+
+    def __init__(self, formsets):
+        self.formsets = formsets
+        self.done = False
+
+    def run(self):
+        if self.done:
+            return
+        self.done = True
+        groups = {}
+        for formset in self.formsets:
+            groups.setdefault(formset.model.overlapping_models(),
+                              []).append(formset)
+        for models, formsets in groups.items():
+            self.check(formsets, models)
+
+    def check(self, formsets, models):
+        forms, deleted = [], []
+        for formset in formsets:
+            for form in formset.forms:
+                # формы соседнего формсета могли еще не проверяться
+                errors = form.errors
+                if formset.can_delete and formset._should_delete_form(form):
+                    deleted.append(form.instance)
+                elif form.has_changed() and not errors:
+                    forms.append(form)
+
+        overlaps = find_overlaps(
+            formsets[0].instance.pk,
+            [form.instance for form in forms],
+            models,
+            exclude=deleted
+        )
+        for i in sorted(overlaps):
+            forms[i].add_error(None, forms[i].instance.busy_error)
+
+
+class TimelineInlineFormSet(BaseInlineFormSet):
+    """ Формсет временных осей: пересечения всех строк между собой и с
+    базой проверяются одним запросом, а не отдельным запросом на строку.
+    В форме туриста проверка общая для всех таких формсетов
+    (см. TouristAdmin._create_formsets) """
+    overlap_check = None
+
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        form.instance.defer_overlap_check = True
+        return form
+
+    def clean(self):
+        super().clean()
+        (self.overlap_check or TimelineOverlapCheck([self])).run()
+
+
+class DatelineInlineFormSet(TimelineInlineFormSet):
+    """ Формсет пребываний в отелях: свободные места для всех строк
+    проверяются одним запросом к таблице заполненности """
+
+    def clean(self):
+        super().clean()
+        forms, previous = [], []
+        for form in self.forms:
+            deleted = self.can_delete and self._should_delete_form(form)
+            if not deleted and (not form.has_changed() or form.errors):
+                continue
+            if form.instance.pk is not None:
+                # прежние даты строки, загруженные вместе с формсетом
+                previous.append((form.initial.get('hotel'),
+                                 form.initial.get('time_from'),
+                                 form.initial.get('time_to')))
+            if not deleted:
+                forms.append(form)
+
+        for i in sorted(overbooked([form.instance for form in forms],
+                                   previous)):
+            forms[i].add_error(None, capacity_error(forms[i].instance.hotel))
+
+
+class TimelineInline(admin.TabularInline):
+    """ Общая часть инлайнов временных осей туриста: события подгружаются
+    вместе со строками, а варианты выбора из справочника запрашиваются
+    один раз на весь формсет, а не для каждой строки """
+    formset = TimelineInlineFormSet
+    extra = 1
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('event')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        formfield = super().formfield_for_foreignkey(db_field, request,
+                                                     **kwargs)
+        if formfield is not None:
+            formfield.choices = list(formfield.choices)
+        return formfield
 
 
-class DatelineForHotelInline(admin.TabularInline):
+class DatelineForHotelInline(TimelineInline):
     model = DatelineForHotel
-    extra = 1
+    formset = DatelineInlineFormSet
     fields = ('hotel', ('time_from', 'time_to'))
 
 
-class TimelineForNutritionInline(admin.TabularInline):
+class TimelineForNutritionInline(TimelineInline):
     model = TimelineForNutrition
-    extra = 1
     fields = ('nutrition', ('time_from', 'time_to'), 'event')
     readonly_fields = ['event']
     show_change_link = True
@@ -32,9 +144,8 @@ class TimelineForNutritionInline(admin.TabularInline):
             time_from__gte=timezone.now() - timedelta(days=1))
 
 
-class TimelineForExcursionInline(admin.TabularInline):
+class TimelineForExcursionInline(TimelineInline):
     model = TimelineForExcursion
-    extra = 1
     fields = ('excursion', ('time_from', 'time_to'), 'event')
     readonly_fields = ['event']
     show_change_link = True
@@ -45,18 +156,62 @@ class FeedFileInline(admin.StackedInline):
     extra = 1
 
 
-def make_set_group_action(group):
+class FullPackageOfDocumentsFilter(admin.SimpleListFilter):
+    """ Фильтр по полному пакету документов, выполняемый в SQL """
+    title = 'Полный пакет документов'
+    parameter_name = 'full_package'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Да'),
+            ('no', 'Нет'),
+        )
+
+    def queryset(self, request, queryset):
+        if self.value() == 'yes':
+            return queryset.filter(FULL_PACKAGE_OF_DOCUMENTS)
+        if self.value() == 'no':
+            return queryset.exclude(FULL_PACKAGE_OF_DOCUMENTS)
+        return queryset
+
+
+class OutstandingBalanceFilter(admin.SimpleListFilter):
+    """ Фильтр по задолженности из сохраненных счетов туристов """
+    title = 'Задолженность'
+    parameter_name = 'outstanding'
+
+    def lookups(self, request, model_admin):
+        return (
+            ('yes', 'Есть'),
+            ('no', 'Нет'),
+        )
+
+    def queryset(self, request, queryset):
+        debt = Q(is_paid=False, balance__total__gt=0)
+        if self.value() == 'yes':
+            return queryset.filter(debt)
+        if self.value() == 'no':
+            return queryset.exclude(debt)
+        return queryset
+
+
+def make_set_group_action(group_id, group_name):
         def set_group(modeladmin, request, queryset):
-            for tourist in queryset:
-                selected_tourist = Tourist.objects.get(id=tourist.id)
-                selected_tourist.group=group
-                selected_tourist.save()
-                messages.info(request, 
-                    f'Турист {tourist.name} перемещен в {group.group_name}')
-        short = f'Переместить выбранных туристов в {group.group_name}'
+            try:
+                rows_updated = move_tourists(queryset, group_id)
+            except GroupUnavailable as error:
+                # список групп в кэше устарел
+                reset_active_groups()
+                modeladmin.message_user(
+                    request, f'{error}. Туристы не перемещены',
+                    messages.ERROR)
+                return
+            modeladmin.message_user(request,
+                f'Перемещено туристов в {group_name}: {rows_updated}')
+        short = f'Переместить выбранных туристов в {group_name}'
         set_group.short_description = short
         # Нам нужны уникальные '__name__' для каждого action
-        set_group.__name__ = f'assign_to_user_{group.id}'
+        set_group.__name__ = f'assign_to_user_{group_id}'
 
         return set_group
 
@@ -67,12 +222,15 @@ class TouristAdmin(admin.ModelAdmin):
         'phone',
         'is_full_package_of_documents', 
         'is_paid',
+        'balance_total',
         'status',
         'tourist_actions', 
         'note'
         )
     
     search_fields = ('name',)
+    list_filter = ('current_status', FullPackageOfDocumentsFilter,
+                   OutstandingBalanceFilter)
     filter_horizontal = ('excursion',)
     actions = ['set_paid_action']
 
@@ -84,6 +242,12 @@ class TouristAdmin(admin.ModelAdmin):
         ]
 
 
+    def get_queryset(self, request):
+        # документы для всего списка считаются одним запросом,
+        # статус и счет берутся из сохраненных значений
+        return super().get_queryset(request).with_documents(
+            ).select_related('balance')
+
     def set_paid_action(self, request, queryset):
         rows_updated = queryset.update(is_paid=True)
         if rows_updated == 1:
@@ -98,8 +262,8 @@ class TouristAdmin(admin.ModelAdmin):
     def get_actions(self, request):
         actions = super(TouristAdmin, self).get_actions(request)
 
-        for group in Group.objects.exclude(status='g').order_by('group_name'):
-            action = make_set_group_action(group)
+        for group_id, group_name in active_groups():
+            action = make_set_group_action(group_id, group_name)
             actions[action.__name__] = (action,
                                         action.__name__,
                                         action.short_description)
@@ -114,6 +278,14 @@ class TouristAdmin(admin.ModelAdmin):
                 r'^(?P<pk>.+)/list_of_services/$',
                 self.admin_site.admin_view(views.show_list_services),
                 name='show-list-services'),
+            url(
+                r'^(?P<pk>.+)/invoice\.pdf$',
+                self.admin_site.admin_view(views.invoice_pdf),
+                name='tourist-invoice-pdf'),
+            url(
+                r'^(?P<pk>.+)/itinerary\.pdf$',
+                self.admin_site.admin_view(views.itinerary_pdf),
+                name='tourist-itinerary-pdf'),
             #url(
             #    r'^(?P<pk>.+)/gantt_chart/$',
             #    self.admin_site.admin_view(views.gantt_chart),
@@ -132,65 +304,76 @@ class TouristAdmin(admin.ModelAdmin):
     tourist_actions.short_description = 'Кнопки'
     tourist_actions.allow_tags = True 
 
+    def _create_formsets(self, request, obj, change):
+        formsets, inline_instances = super()._create_formsets(
+            request, obj, change)
+        # Пересечения строк питания и экскурсий проверяются вместе
+        timelines = [formset for formset in formsets
+                     if isinstance(formset, TimelineInlineFormSet)]
+        check = TimelineOverlapCheck(timelines)
+        for formset in timelines:
+            formset.overlap_check = check
+        return formsets, inline_instances
+
     def save_formset(self, request, form, formset, change):
         instances = formset.save(commit=False)
         for obj in formset.deleted_objects:
             obj.delete()
+        # перед сохранением подбираем события, в которых турист может
+        # питаться или идти на экскурсию вместе с другими, сразу для всех
+        # записей формсета; если подходящего события нет, оно создаётся
+        resolve_events(instances)
+        stays = formset.model is DatelineForHotel
+        if stays:
+            lock_hotels(instance.hotel_id for instance in instances)
         for instance in instances:
-            if isinstance(instance, TimelineForNutrition):
-                # перед сохранением ищем подходящую группу, в которой турист 
-                # может питаться 
-                tl_nutr = TimelineForNutrition.objects.filter(
-                    time_from=instance.time_from).exclude(
-                    id=instance.id).first()
-                # если никто в это время не питается и запрос вернулся пустой
-                # cоздаём новое событие для Питания
-                if not tl_nutr:
-                    new_event = Event.objects.create(name=
-                        f"Питание в {instance.time_from}")
-                    instance.event = new_event
-                else:
-                    instance.event = tl_nutr.event 
-                instance.save()
-            elif isinstance(instance, TimelineForExcursion):
-                # ищем подходящую по времени и названию экскурсию
-                tl_ex = TimelineForExcursion.objects.filter(
-                    time_from=instance.time_from).filter(
-                    excursion__name=instance.excursion).exclude(
-                    id=instance.id).first()
-                # если никто в это время на эту экскурсию не идёт и запрос 
-                # вернулся пустой, создаём новое событие для Экскурсии
-                if not tl_ex:
-                    new_event = Event.objects.create(name=
-                      f"Экскурсия {instance.excursion} в {instance.time_from}")
-                    instance.event = new_event
-                else:
-                    instance.event = tl_ex.event
-                instance.save()
-            else:
-                instance.save()  
+            instance.save()
         formset.save_m2m()
+        if stays:
+            # места могли занять, пока форма проверялась и сохранялась
+            verify_capacity(instances)
+
+    def changeform_view(self, request, object_id=None, form_url='',
+                        extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url,
+                                           extra_context)
+        except Overbooked as error:
+            # транзакция сохранения уже откачена
+            self.message_user(request, f'{error}. Изменения не сохранены',
+                              messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
 
 
     def is_full_package_of_documents(self, obj):
         """ Функция для установки флажка Полный пакет документов"""
-        have_all_docs = Tourist.objects.filter(id=obj.id
-                                              ).exclude(visa=''
-                                              ).exclude(insurance=''
-                                              ).exclude(passport='')
-        return bool(have_all_docs)   
+        return obj.check_doc()
 
     is_full_package_of_documents.boolean = True
+    is_full_package_of_documents.admin_order_field = 'has_all_docs'
     is_full_package_of_documents.short_description = "Полный пакет документов"
 
+    def balance_total(self, obj):
+        balance = getattr(obj, 'balance', None)
+        return balance.total if balance is not None else 0
+
+    balance_total.admin_order_field = 'balance__total'
+    balance_total.short_description = 'Сумма счета'
+
+    def status(self, obj):
+        return obj.get_current_status_display()
+
+    status.admin_order_field = 'current_status'
+    status.short_description = 'Статус'
+
     def colored_name(self, obj):
-        if obj.status == 'ожидается приезд':   
+        if obj.current_status == 'await':
             color = 'ff9900'
-        elif obj.status == 'уехал': 
+        elif obj.current_status == 'left':
             color = '66ff33'
-        elif obj.status == 'ничем не занят': 
+        elif obj.current_status == 'idle':
             color = '000000'
-        elif obj.status == 'не заселен в гостиницу': 
+        elif obj.current_status == 'no_hotel':
             color = 'ff0000'
         else:    
             color = 'grey'
@@ -215,10 +398,29 @@ class GroupAdmin(admin.ModelAdmin):
     date_hierarchy = 'date_of_arrival'
     list_filter = ('status', )
 
+    actions = ['export_invoices_csv', 'export_invoices_xlsx',
+               'export_documents_pdf']
+
     inlines = [
         TouristInline,
     ]
 
+    def export_invoices_csv(self, request, queryset):
+        return csv_response(invoice_rows(queryset), 'invoices.csv')
+
+    export_invoices_csv.short_description = 'Выгрузить счета туристов в CSV'
+
+    def export_invoices_xlsx(self, request, queryset):
+        return xlsx_response(invoice_rows(queryset), 'invoices.xlsx')
+
+    export_invoices_xlsx.short_description = 'Выгрузить счета туристов в XLSX'
+
+    def export_documents_pdf(self, request, queryset):
+        return pdf_zip_response(queryset, 'documents.zip')
+
+    export_documents_pdf.short_description = (
+        'Выгрузить распорядок и счет каждого туриста в PDF (zip)')
+
 
 class HotelAdmin(admin.ModelAdmin):
     list_display = ('name', 'addres', 'phone')
@@ -227,6 +429,25 @@ class HotelAdmin(admin.ModelAdmin):
     list_filter =('name',)
 
 
+class HotelOccupancyAdmin(admin.ModelAdmin):
+    list_display = ('night', 'hotel', 'guests', 'capacity')
+    list_filter = ('hotel',)
+    date_hierarchy = 'night'
+    list_select_related = ('hotel',)
+
+    def capacity(self, obj):
+        return obj.hotel.capacity
+
+    capacity.short_description = 'Количество мест'
+
+    # Таблица заполняется автоматически
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
 class NutritionAdmin(admin.ModelAdmin):
     list_display = ('name', 'cost')
     ordering = ('cost',)
@@ -244,6 +465,11 @@ class TimelineForNutritionEventInline(admin.TabularInline):
     can_delete = False
     readonly_fields = ('nutrition', 'time_from', 'time_to', 'tourist')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('nutrition',
+                                                            'tourist')
+
+
 class TimelineForExcursionEventInline(admin.TabularInline):
     model = TimelineForExcursion
     extra = 0
@@ -251,6 +477,10 @@ class TimelineForExcursionEventInline(admin.TabularInline):
     can_delete = False
     readonly_fields = ('excursion', 'time_from', 'time_to', 'tourist')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('excursion',
+                                                            'tourist')
+
 
 class EventAdmin(admin.ModelAdmin):
     list_display = ('name', 'manager', 'manager_phone')
@@ -266,4 +496,5 @@ admin.site.register(Nutrition, NutritionAdmin)
 admin.site.register(Hotel)
 admin.site.register(Excursion, ExcursionAdmin)
 admin.site.register(Event, EventAdmin)
-admin.site.register(Group, GroupAdmin)
\ No newline at end of file
+admin.site.register(Group, GroupAdmin)
+admin.site.register(HotelOccupancy, HotelOccupancyAdmin)
\ No newline at end of file
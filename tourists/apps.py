@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TouristsConfig(AppConfig):
     name = 'tourists'
     verbose_name = 'CRM Туристичеcкая фирма'
+
+    def ready(self):
+        from . import signals
@@ -0,0 +1,82 @@
+""" Сохраненные счета туристов (TouristBalance).
+
+Счет пересчитывается через billing, поэтому суммы совпадают со страницей
+списка услуг. Сигналы (см. tourists.signals) отмечают туристов, чьи
+услуги или цены изменились, а пересчет выполняется после фиксации
+транзакции (см. tourists.deferred) """
+from django.db import transaction
+
+from .models import Tourist, TouristBalance
+from .billing import collect_invoices
+from .deferred import CommitBatch
+
+
+CHUNK_SIZE = 500
+
+
+def balance_values(invoice) -> dict:
+    return {
+        'hotel': invoice['total_of_hotel'],
+        'nutrition': invoice['total_of_nutrition'],
+        'excursion': invoice['total_of_excursion'],
+        'total': invoice['total'],
+    }
+
+
+def update_balances(tourist_ids):
+    """ Пересчитывает счета туристов, порциями по CHUNK_SIZE """
+    tourist_ids = sorted(set(tourist_ids))
+    for start in range(0, len(tourist_ids), CHUNK_SIZE):
+        chunk = tourist_ids[start:start + CHUNK_SIZE]
+        tourists = Tourist.objects.filter(id__in=chunk)
+        invoices = collect_invoices(list(tourists))
+        stored = TouristBalance.objects.in_bulk(
+            [invoice['tourist'].id for invoice in invoices])
+
+        changed, created = [], []
+        for invoice in invoices:
+            values = balance_values(invoice)
+            balance = stored.get(invoice['tourist'].id)
+            if balance is None:
+                created.append(TouristBalance(tourist=invoice['tourist'],
+                                              **values))
+            elif any(getattr(balance, name) != value
+                     for name, value in values.items()):
+                for name, value in values.items():
+                    setattr(balance, name, value)
+                changed.append(balance)
+
+        with transaction.atomic():
+            TouristBalance.objects.bulk_create(created)
+            TouristBalance.objects.bulk_update(
+                changed, ['hotel', 'nutrition', 'excursion', 'total'])
+
+
+# Отмечает туристов для пересчета счетов после фиксации транзакции
+schedule_balance_update = CommitBatch(update_balances).add
+
+
+def rebuild_balances():
+    """ Пересчитывает счета всех туристов """
+    update_balances(Tourist.objects.values_list('id', flat=True))
+
+
+def verify_balances() -> list:
+    """ Сверяет сохраненные счета с расчетом по услугам.
+    Возвращает список (турист, сохраненный итог, расчетный итог)
+    для расхождений. Отсутствующий счет считается нулевым: его нет
+    у туристов, которым еще не начисляли услуг """
+    mismatches = []
+    tourist_ids = list(Tourist.objects.order_by('id').values_list(
+        'id', flat=True))
+    for start in range(0, len(tourist_ids), CHUNK_SIZE):
+        tourists = Tourist.objects.filter(
+            id__in=tourist_ids[start:start + CHUNK_SIZE]).select_related(
+            'balance')
+        for invoice in collect_invoices(list(tourists)):
+            tourist = invoice['tourist']
+            balance = getattr(tourist, 'balance', None) or TouristBalance()
+            if any(getattr(balance, name) != value
+                   for name, value in balance_values(invoice).items()):
+                mismatches.append((tourist, balance.total, invoice['total']))
+    return mismatches
@@ -0,0 +1,111 @@
+""" Расчет стоимости услуг, оказанных туристам.
+
+Все услуги (проживание, питание, экскурсии) выбираются одним запросом
+UNION по трем таблицам, а количества и суммы считаются уже в Python,
+поэтому счет для одного туриста, группы или целого сезона стоит
+одинаковое число запросов """
+from collections import OrderedDict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import F, Value, CharField, QuerySet
+
+from .models import (Tourist, DatelineForHotel, TimelineForNutrition,
+                     TimelineForExcursion)
+
+
+HOTEL = 'hotel'
+NUTRITION = 'nutrition'
+EXCURSION = 'excursion'
+
+# Порядок, в котором услуги выводятся в счете
+KINDS = (HOTEL, NUTRITION, EXCURSION)
+
+SERVICES = (
+    (HOTEL, DatelineForHotel, 'hotel__name', 'hotel__cost_for_one_day'),
+    (NUTRITION, TimelineForNutrition, 'nutrition__name', 'nutrition__cost'),
+    (EXCURSION, TimelineForExcursion, 'excursion__name', 'excursion__cost'),
+)
+
+
+def nights_in_hotel(time_from, time_to) -> int:
+    """ Количество оплачиваемых суток проживания.
+    Если день заселения и выселения совпадает, платить все равно за сутки """
+    return max((time_to - time_from).days, 1)
+
+
+def services_query(**filters):
+    """ Один запрос, возвращающий все услуги туристов, отобранных по filters.
+    Фильтры применяются к каждой из таблиц временных осей """
+    queries = [
+        model.objects.filter(**filters).annotate(
+            name=F(name_field),
+            cost=F(cost_field),
+            kind=Value(kind, output_field=CharField())
+        ).values('tourist', 'time_from', 'time_to', 'name', 'cost', 'kind')
+        for kind, model, name_field, cost_field in SERVICES
+    ]
+    return queries[0].union(*queries[1:], all=True)
+
+
+def make_invoice(tourist, services) -> dict:
+    """ Собирает счет туриста из строк услуг, полученных из services_query """
+    services = sorted(services,
+                      key=lambda x: (KINDS.index(x['kind']), x['time_from']))
+    totals = dict.fromkeys(KINDS, Decimal(0))
+
+    for service in services:
+        cost = service['cost'] or Decimal(0)
+        if service['kind'] == HOTEL:
+            num = nights_in_hotel(service['time_from'], service['time_to'])
+            service['num'] = timedelta(days=num)
+        else:
+            num = 1
+            service['num'] = num
+        totals[service['kind']] += num * cost
+
+    return {
+        'tourist': tourist,
+        'list_of_services': services,
+        'amount': len(services),
+        'total_of_hotel': totals[HOTEL],
+        'total_of_nutrition': totals[NUTRITION],
+        'total_of_excursion': totals[EXCURSION],
+        'total': sum(totals.values()),
+    }
+
+
+def tourist_invoice(tourist) -> dict:
+    """ Счет для одного туриста """
+    return make_invoice(tourist, services_query(tourist=tourist))
+
+
+def collect_invoices(tourists, date_from=None, date_to=None) -> list:
+    """ Счета для набора туристов (queryset группы, сезона и т.п.).
+    Услуги всех туристов выбираются одним запросом; date_from и date_to
+    ограничивают услуги по времени начала """
+    filters = {}
+    if date_from is not None:
+        filters['time_from__gte'] = date_from
+    if date_to is not None:
+        filters['time_from__lte'] = date_to
+
+    if isinstance(tourists, QuerySet):
+        # подзапросом, чтобы не упереться в лимит параметров SQL
+        selection = tourists.values('id')
+    else:
+        selection = [tourist.id for tourist in tourists]
+    tourists = OrderedDict((tourist.id, tourist) for tourist in tourists)
+
+    services = {tourist_id: [] for tourist_id in tourists}
+    for service in services_query(tourist__in=selection, **filters):
+        services[service['tourist']].append(service)
+
+    return [make_invoice(tourist, services[tourist_id])
+            for tourist_id, tourist in tourists.items()]
+
+
+def group_invoices(group, date_from=None, date_to=None) -> list:
+    """ Счета для всех туристов группы """
+    tourists = Tourist.objects.filter(group=group).order_by('name')
+    return collect_invoices(tourists, date_from, date_to)
@@ -0,0 +1,33 @@
+""" Отложенный до фиксации транзакции пересчет по туристам.
+
+Сигналы сохранения только отмечают туристов, а пересчет выполняется
+один раз после фиксации транзакции: сохранение формы с десятком строк
+услуг пересчитывает туриста один раз, а удаленные туристы уже не
+попадают в пересчет """
+import threading
+
+from django.db import transaction
+
+
+class CommitBatch:
+    """ Копит id туристов и после фиксации передает их в handler(ids).
+    Обработчик регистрируется на каждую отметку: первый сработавший
+    забирает всех отмеченных, остальные ничего не делают. Если транзакция
+    откатилась, ее отметки уйдут со следующим пересчетом, а лишний
+    пересчет безвреден """
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.pending = threading.local()
+
+    def add(self, tourist_ids):
+        if not hasattr(self.pending, 'ids'):
+            self.pending.ids = set()
+        self.pending.ids.update(tourist_ids)
+        transaction.on_commit(self.flush)
+
+    def flush(self):
+        tourist_ids = getattr(self.pending, 'ids', None)
+        if tourist_ids:
+            self.pending.ids = set()
+            self.handler(tourist_ids)
@@ -0,0 +1,192 @@
+""" Счетчики ссылок на файлы документов (StoredFile).
+
+На один файл хранилища (см. tourists.storage) ссылаются поля документов
+разных туристов. Сигналы (см. tourists.signals) увеличивают счетчик,
+когда файл появляется в поле, и уменьшают, когда он из поля уходит или
+запись удаляется. Файл без ссылок удаляется с диска после фиксации
+транзакции. Только что записанный файл не удаляется: его могла как раз
+сохранить параллельная загрузка; такие файлы убирает rebuild_references.
+
+Записи, созданные в обход сигналов (bulk_create, update), учитываются
+полным пересчетом rebuild_references (команда rebuild_documents) """
+import os
+import time
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Tourist, FeedFile, StoredFile
+from .storage import BLOB_DIR, document_storage
+
+
+# Поля документов по моделям
+DOCUMENT_FIELDS = {
+    Tourist: ('visa', 'insurance', 'passport'),
+    FeedFile: ('file',),
+}
+
+# Сколько секунд не удалять только что записанный файл
+GRACE_SECONDS = 300
+
+CHUNK_SIZE = 500
+
+
+def document_names(instance) -> Counter:
+    """ Имена файлов в полях документов записи """
+    return Counter(
+        getattr(instance, field).name
+        for field in DOCUMENT_FIELDS[type(instance)]
+        if getattr(instance, field))
+
+
+def stored_names(model, pk) -> Counter:
+    """ Имена файлов в полях документов записи, как они сохранены в базе """
+    row = model.objects.filter(pk=pk).values_list(
+        *DOCUMENT_FIELDS[model]).first() or ()
+    return Counter(name for name in row if name)
+
+
+def file_size(name) -> int:
+    try:
+        return document_storage.size(name)
+    except OSError:
+        return 0
+
+
+def add_references(names: Counter):
+    """ Увеличивает счетчики ссылок на файлы {имя: число ссылок} """
+    for name, count in names.items():
+        updated = StoredFile.objects.filter(name=name).update(
+            references=F('references') + count)
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, size=file_size(name),
+                                          references=count)
+        except IntegrityError:
+            # запись успела создать параллельная загрузка
+            StoredFile.objects.filter(name=name).update(
+                references=F('references') + count)
+
+
+def release_references(names: Counter):
+    """ Уменьшает счетчики ссылок; файлы без ссылок удаляются
+    после фиксации транзакции """
+    for name, count in names.items():
+        StoredFile.objects.filter(name=name).update(
+            references=F('references') - count)
+    if names:
+        transaction.on_commit(lambda: remove_unreferenced(list(names)))
+
+
+def is_recent(name) -> bool:
+    try:
+        modified = os.path.getmtime(document_storage.path(name))
+    except OSError:
+        return False
+    return time.time() - modified < GRACE_SECONDS
+
+
+def remove_unreferenced(names=None) -> int:
+    """ Удаляет записи и файлы без ссылок (по умолчанию все такие),
+    кроме только что записанных. Возвращает число удаленных файлов """
+    unreferenced = StoredFile.objects.filter(references__lte=0)
+    if names is not None:
+        unreferenced = unreferenced.filter(name__in=names)
+    removed = 0
+    for name in unreferenced.values_list('name', flat=True):
+        if is_recent(name):
+            continue
+        deleted, _ = StoredFile.objects.filter(
+            name=name, references__lte=0).delete()
+        if deleted:
+            document_storage.delete(name)
+            removed += 1
+    return removed
+
+
+def count_references() -> Counter:
+    """ Ссылки на файлы по всем полям документов, порциями """
+    names = Counter()
+    for model, fields in DOCUMENT_FIELDS.items():
+        for row in model.objects.values_list(*fields).iterator(
+                chunk_size=CHUNK_SIZE):
+            names.update(name for name in row if name)
+    return names
+
+
+def orphan_blobs() -> list:
+    """ Файлы в каталоге хранилища, о которых нет записи StoredFile """
+    root = document_storage.path(BLOB_DIR)
+    known = set(StoredFile.objects.values_list('name', flat=True))
+    orphans = []
+    for directory, _, files in os.walk(root):
+        for file_name in files:
+            name = os.path.relpath(os.path.join(directory, file_name),
+                                   document_storage.location).replace(
+                                       os.sep, '/')
+            if name not in known:
+                orphans.append(name)
+    return orphans
+
+
+def rebuild_references() -> dict:
+    """ Пересчитывает счетчики ссылок по полям документов, удаляет файлы
+    без ссылок и файлы хранилища, о которых нет записей.
+    Возвращает число файлов, их общий размер и число удаленных """
+    names = count_references()
+    stored = StoredFile.objects.in_bulk(field_name='name')
+
+    changed, created = [], []
+    for name, count in names.items():
+        record = stored.pop(name, None)
+        size = file_size(name)
+        if record is None:
+            created.append(StoredFile(name=name, size=size, references=count))
+        elif (record.references, record.size) != (count, size):
+            record.references, record.size = count, size
+            changed.append(record)
+    for record in stored.values():
+        if record.references != 0:
+            record.references = 0
+            changed.append(record)
+
+    with transaction.atomic():
+        StoredFile.objects.bulk_create(created, batch_size=CHUNK_SIZE)
+        StoredFile.objects.bulk_update(changed, ['references', 'size'],
+                                       batch_size=CHUNK_SIZE)
+
+    removed = remove_unreferenced()
+    for name in orphan_blobs():
+        if not is_recent(name):
+            document_storage.delete(name)
+            removed += 1
+    return {
+        'files': len(names),
+        'references': sum(names.values()),
+        'bytes': sum(StoredFile.objects.filter(
+            references__gt=0).values_list('size', flat=True)),
+        'removed': removed,
+    }
+
+
+def deduplicate() -> int:
+    """ Переносит файлы, загруженные до хранилища с дедупликацией,
+    в хранилище и обновляет ссылки на них в обход сигналов, поэтому после
+    нужен rebuild_references. Возвращает число перенесенных файлов """
+    moved = 0
+    for name in count_references():
+        if name.startswith(BLOB_DIR + '/') or not document_storage.exists(name):
+            continue
+        with document_storage.open(name) as file:
+            blob = document_storage.save(name, file)
+        with transaction.atomic():
+            for model, fields in DOCUMENT_FIELDS.items():
+                for field in fields:
+                    model.objects.filter(**{field: name}).update(
+                        **{field: blob})
+        document_storage.delete(name)
+        moved += 1
+    return moved
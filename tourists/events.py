@@ -0,0 +1,60 @@
+""" Подбор событий для записей питания и экскурсий.
+
+Туристы, которые питаются в одно время или идут в одно время на одну
+экскурсию, попадают в одно событие. Событие находится по ключу
+(время начала, экскурсия), поэтому весь формсет обслуживается одним
+запросом на поиск и одним bulk_create для недостающих событий """
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Event, TimelineForNutrition, TimelineForExcursion
+
+
+def make_event_key(time_from, excursion_id=None, nutrition=False) -> str:
+    """ Ключ события; время приводится к UTC, чтобы не зависеть от пояса,
+    и берется целиком: записи, разошедшиеся на секунды, - разные события """
+    moment = time_from.astimezone(timezone.utc).isoformat(
+        timespec='microseconds')
+    if nutrition:
+        return f'nutrition:{moment}'
+    return f'excursion:{excursion_id or ""}:{moment}'
+
+
+def event_key(instance) -> str:
+    if isinstance(instance, TimelineForNutrition):
+        return make_event_key(instance.time_from, nutrition=True)
+    return make_event_key(instance.time_from, instance.excursion_id)
+
+
+def event_name(instance) -> str:
+    if isinstance(instance, TimelineForNutrition):
+        return f"Питание в {instance.time_from}"
+    return f"Экскурсия {instance.excursion} в {instance.time_from}"
+
+
+def resolve_events(instances):
+    """ Проставляет событие каждой записи питания и экскурсии из instances.
+    Существующие события ищутся одним запросом, недостающие создаются
+    одним bulk_create; при гонке двух сохранений уникальный ключ оставляет
+    только одно событие, и оно перечитывается """
+    instances = [
+        instance for instance in instances
+        if isinstance(instance, (TimelineForNutrition, TimelineForExcursion))
+    ]
+    if not instances:
+        return
+
+    keys = [(instance, event_key(instance)) for instance in instances]
+    with transaction.atomic():
+        events = Event.objects.in_bulk({key for _, key in keys},
+                                       field_name='key')
+        missing = {}
+        for instance, key in keys:
+            if key not in events and key not in missing:
+                missing[key] = Event(key=key, name=event_name(instance))
+        if missing:
+            Event.objects.bulk_create(missing.values(), ignore_conflicts=True)
+            events.update(Event.objects.in_bulk(missing, field_name='key'))
+
+    for instance, key in keys:
+        instance.event = events[key]
@@ -0,0 +1,220 @@
+""" Выгрузка счетов туристов в CSV и XLSX и документов туристов в PDF.
+
+Строки выдаются генератором порциями по CHUNK_SIZE туристов, поэтому
+расход памяти не зависит от количества туристов в выгрузке. CSV
+отдается клиенту по мере получения строк. XLSX - это zip-архив, который
+можно собрать только целиком, поэтому он сначала записывается во
+временный файл на диске и отдается после этого.
+Суммы считаются тем же модулем billing, что и страница списка услуг """
+import csv
+import datetime
+import tempfile
+
+from django.http import HttpResponse, StreamingHttpResponse, FileResponse
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import Tourist
+from .billing import collect_invoices, HOTEL
+from .pdf import render_pdf, render_all, zip_stream, fonts
+
+
+CHUNK_SIZE = 200
+
+HEADER = (
+    'Группа', 'Прибытие', 'Отъезд', 'Турист', 'Телефон', 'Кол-во услуг',
+    'Проживание', 'Питание', 'Экскурсии', 'Итого', 'Оплачено',
+)
+
+XLSX_CONTENT_TYPE = (
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+
+def day_bounds(date_from=None, date_to=None) -> tuple:
+    """ Переводит даты окна выгрузки в моменты начала и конца суток """
+    if date_from is not None:
+        date_from = timezone.make_aware(
+            datetime.datetime.combine(date_from, datetime.time.min))
+    if date_to is not None:
+        date_to = timezone.make_aware(
+            datetime.datetime.combine(date_to, datetime.time.max))
+    return date_from, date_to
+
+
+SERVICE_KINDS = {
+    'hotel': 'Проживание',
+    'nutrition': 'Питание',
+    'excursion': 'Экскурсия',
+}
+
+
+def local(moment, template='%d.%m.%Y %H:%M') -> str:
+    return timezone.localtime(moment).strftime(template) if moment else ''
+
+
+def pdf_document(invoice, parts=('itinerary', 'invoice')) -> dict:
+    """ Данные PDF-документа туриста (см. pdf.render_pdf) из его счета:
+    только строки, чтобы документ можно было передать в другой процесс """
+    tourist = invoice['tourist']
+    group = tourist.group
+
+    services, days = [], {}
+    for service in invoice['list_of_services']:
+        name = service['name'] or ''
+        cost = service['cost'] or 0
+        if service['kind'] == HOTEL:
+            number = service['num'].days
+            quantity = f'{number} сут.'
+        else:
+            number = service['num']
+            quantity = f'{number} шт.'
+        services.append((name, local(service['time_from']),
+                         local(service['time_to']), quantity, f'{cost}',
+                         f'{number * cost}'))
+
+        if service['time_from'] is None:
+            continue
+        time_from = timezone.localtime(service['time_from'])
+        time_to = service['time_to'] and timezone.localtime(service['time_to'])
+        if time_to is None:
+            period = f'{time_from:%H:%M}'
+        elif time_to.date() == time_from.date():
+            period = f'{time_from:%H:%M} - {time_to:%H:%M}'
+        else:
+            period = f'{time_from:%H:%M} - {time_to:%d.%m %H:%M}'
+        days.setdefault(time_from.date(), []).append(
+            (time_from, f'{SERVICE_KINDS[service["kind"]]}: {name}', period))
+
+    return {
+        'parts': parts,
+        'tourist': tourist.name,
+        'group': group.group_name if group else '',
+        'dates': (f'{group.date_of_arrival:%d.%m.%Y} - '
+                  f'{group.date_of_departure:%d.%m.%Y}' if group else ''),
+        'itinerary': [
+            (f'{day:%d.%m.%Y}',
+             [(name, period) for _, name, period in sorted(
+                 rows, key=lambda row: row[0])])
+            for day, rows in sorted(days.items())
+        ],
+        'services': services,
+        'amount': invoice['amount'],
+        'total': f'{invoice["total"]}',
+        'created': local(timezone.now()),
+    }
+
+
+def pdf_documents(groups):
+    """ Генератор пар (путь в архиве, документ) по туристам групп:
+    папка на группу, файл на туриста; счета собираются порциями """
+    tourists = Tourist.objects.filter(group__in=groups).select_related(
+        'group').order_by('group__date_of_arrival', 'group__group_name',
+                          'name')
+    ids = list(tourists.values_list('id', flat=True))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = tourists.filter(id__in=ids[start:start + CHUNK_SIZE])
+        for invoice in collect_invoices(list(chunk)):
+            tourist = invoice['tourist']
+            folder = get_valid_filename(
+                f'{tourist.group.group_name} {tourist.group_id}')
+            name = get_valid_filename(f'{tourist.name} {tourist.id}')
+            yield f'{folder}/{name}.pdf', pdf_document(invoice)
+
+
+def invoice_rows(groups=None, date_from=None, date_to=None):
+    """ Генератор строк выгрузки: заголовок, затем по строке на туриста.
+    groups - группы для выгрузки, date_from и date_to - окно дат (date),
+    в которое должна попадать поездка группы и начало услуги """
+    tourists = Tourist.objects.select_related('group').order_by(
+        'group__date_of_arrival', 'group__group_name', 'name')
+    if groups is not None:
+        tourists = tourists.filter(group__in=groups)
+    if date_from is not None:
+        tourists = tourists.filter(group__date_of_departure__gte=date_from)
+    if date_to is not None:
+        tourists = tourists.filter(group__date_of_arrival__lte=date_to)
+    time_from, time_to = day_bounds(date_from, date_to)
+
+    yield HEADER
+    ids = list(tourists.values_list('id', flat=True))
+    for start in range(0, len(ids), CHUNK_SIZE):
+        chunk = tourists.filter(id__in=ids[start:start + CHUNK_SIZE])
+        for invoice in collect_invoices(list(chunk), time_from, time_to):
+            tourist = invoice['tourist']
+            group = tourist.group
+            yield (
+                group.group_name if group else '',
+                group.date_of_arrival if group else '',
+                group.date_of_departure if group else '',
+                tourist.name,
+                tourist.phone,
+                invoice['amount'],
+                invoice['total_of_hotel'],
+                invoice['total_of_nutrition'],
+                invoice['total_of_excursion'],
+                invoice['total'],
+                'да' if tourist.is_paid else 'нет',
+            )
+
+
+class Echo:
+    """ Псевдо-файл, который возвращает записанное вместо хранения """
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    """ Превращает строки в CSV построчно.
+    BOM в начале нужен, чтобы Excel правильно открыл кириллицу """
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_xlsx(rows, file):
+    """ Записывает строки в XLSX. Книга в режиме write_only
+    сбрасывает строки на диск, а не держит их в памяти """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Счета')
+    for row in rows:
+        sheet.append(row)
+    workbook.save(file)
+
+
+def csv_response(rows, filename):
+    response = StreamingHttpResponse(iter_csv(rows),
+                                     content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def xlsx_response(rows, filename):
+    """ Книга целиком пишется во временный файл на диске, отдача
+    начинается только после этого """
+    file = tempfile.TemporaryFile()
+    write_xlsx(rows, file)
+    file.seek(0)
+    response = FileResponse(file, content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def pdf_response(invoice, parts, filename):
+    """ PDF одного туриста рисуется прямо в запросе """
+    response = HttpResponse(render_pdf(pdf_document(invoice, parts), fonts()),
+                            content_type='application/pdf')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def pdf_zip_response(groups, filename):
+    """ Архив PDF туристов групп; файлы рисуются в пуле процессов и
+    отдаются клиенту по мере готовности """
+    response = StreamingHttpResponse(
+        zip_stream(render_all(pdf_documents(groups))),
+        content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
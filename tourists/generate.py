@@ -0,0 +1,250 @@
+""" Генерация синтетического сезона для нагрузочных проверок.
+
+Группы прибывают с заданным интервалом и живут в отеле days суток.
+Каждый день у туриста завтрак и ужин, в дни между приездом и отъездом -
+экскурсия; промежутки одного туриста не пересекаются. Туристы, которые
+едят или едут на экскурсию в одно время, попадают в общее событие.
+
+Все пишется через bulk_create порциями групп, поэтому сигналы
+не срабатывают, а заполненность отелей, счета, статусы туристов и
+ссылки на файлы документов пересчитываются в конце целиком. Созданные строки перечитываются
+по последним id - генератор рассчитан на то, что параллельно в базу
+никто не пишет """
+import datetime
+import random
+from collections import Counter
+from itertools import cycle
+
+from django.core.files.base import ContentFile
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (Group, Tourist, FeedFile, Event, Hotel, Nutrition,
+                     Excursion, DatelineForHotel, TimelineForNutrition,
+                     TimelineForExcursion)
+from .events import make_event_key
+from .occupancy import rebuild_occupancy
+from .balance import rebuild_balances
+from .statuses import refresh_statuses
+from .storage import document_storage
+from .documents import rebuild_references
+
+
+# Сколько строк временных осей держать в памяти между записями в базу
+CHUNK_ROWS = 50000
+
+MEALS = (('Завтрак', 9, 300), ('Ужин', 19, 500))
+HOTELS = 5
+EXCURSIONS = 10
+
+DOCUMENTS = ('visa', 'insurance', 'passport')
+DOCUMENTS_DIR = 'files/generated'
+
+
+def created(model, count) -> list:
+    """ Только что созданные bulk_create строки вместе с их id:
+    SQLite не возвращает id из bulk_create """
+    return list(model.objects.order_by('-id')[:count])[::-1]
+
+
+def insert(model, objs, batch_size, **kwargs):
+    """ bulk_create пачками не больше, чем допускает база:
+    в SQLite ограничено число строк и параметров в одном INSERT """
+    objs = list(objs)
+    limit = connection.ops.bulk_batch_size(model._meta.concrete_fields, objs)
+    model.objects.bulk_create(objs, batch_size=min(batch_size, limit), **kwargs)
+
+
+def moment(day, hour):
+    return timezone.make_aware(
+        datetime.datetime.combine(day, datetime.time(hour)))
+
+
+def reference_rows(model, rows: list) -> list:
+    """ Строки справочника по списку несохраненных строк: строки с тем же
+    названием берутся из базы, недостающие создаются одним bulk_create.
+    Повторный запуск генератора не плодит дубли справочников """
+    names = [row.name for row in rows]
+
+    def by_name() -> dict:
+        # из уже накопившихся дублей берется самый ранний
+        return {row.name: row for row in
+                model.objects.filter(name__in=names).order_by('-id')}
+
+    existing = by_name()
+    missing = [row for row in rows if row.name not in existing]
+    if missing:
+        model.objects.bulk_create(missing)
+        existing = by_name()
+    return [existing[name] for name in names]
+
+
+def make_references() -> tuple:
+    """ Отели, питание и экскурсии, на которые ссылаются временные оси """
+    hotels = reference_rows(Hotel, [
+        Hotel(name=f'Отель {number}', addres=f'Улица {number}', phone='1',
+              cost_for_one_day=1000 + 100 * number, check_in=datetime.time(14),
+              check_out=datetime.time(12))
+        for number in range(HOTELS)])
+    nutrition = reference_rows(Nutrition, [
+        Nutrition(name=name, cost=cost) for name, _, cost in MEALS])
+    excursions = reference_rows(Excursion, [
+        Excursion(name=f'Экскурсия {number}', cost=500 + 50 * number)
+        for number in range(EXCURSIONS)])
+    return hotels, nutrition, excursions
+
+
+def placeholder_documents() -> dict:
+    """ По одному маленькому файлу на вид документа, общему для всех;
+    хранилище документов само не хранит повторы """
+    return {
+        field: document_storage.save(f'{DOCUMENTS_DIR}/{field}.pdf',
+                                     ContentFile(f'%PDF-1.4 {field}\n'.encode()))
+        for field in DOCUMENTS + ('feed',)
+    }
+
+
+def trip_plan(arrival, days, hotel, nutrition, excursions) -> tuple:
+    """ Проживание, питание и экскурсии группы: (справочник, начало, конец) """
+    dates = [arrival + datetime.timedelta(days=day) for day in range(days)]
+    stay = (hotel, moment(dates[0], 14),
+            moment(arrival + datetime.timedelta(days=days), 12))
+    meals = [(item, moment(day, hour), moment(day, hour + 1))
+             for day in dates
+             for item, (_, hour, _) in zip(nutrition, MEALS)]
+    trips = [(excursion, moment(day, 12), moment(day, 16))
+             for day, excursion in zip(dates[1:-1], cycle(excursions))]
+    return stay, meals, trips
+
+
+def resolve_keys(keys: dict, batch_size) -> dict:
+    """ События по ключам {ключ: название}; недостающие создаются """
+    events = Event.objects.in_bulk(list(keys), field_name='key')
+    missing = [Event(key=key, name=name) for key, name in keys.items()
+               if key not in events]
+    if missing:
+        insert(Event, missing, batch_size, ignore_conflicts=True)
+        events.update(Event.objects.in_bulk([event.key for event in missing],
+                                             field_name='key'))
+    return events
+
+
+def generate_chunk(numbers, tourists, days, start, interval, today,
+                   references, documents, rng, batch_size) -> Counter:
+    hotels, nutrition, excursions = references
+    counts = Counter()
+
+    groups, plans = [], []
+    for number in numbers:
+        arrival = start + datetime.timedelta(days=interval * number)
+        departure = arrival + datetime.timedelta(days=days)
+        if departure < today:
+            status = 'g'
+        elif arrival <= today:
+            status = 'c'
+        else:
+            status = 'f'
+        groups.append(Group(group_name=f'Группа {number}', status=status,
+                            date_of_arrival=arrival,
+                            date_of_departure=departure))
+        plans.append(trip_plan(arrival, days, rng.choice(hotels), nutrition,
+                               rng.sample(excursions, len(excursions))))
+    insert(Group, groups, batch_size)
+    groups = created(Group, len(groups))
+    counts['groups'] += len(groups)
+
+    people = []
+    for number, group in zip(numbers, groups):
+        for index in range(tourists):
+            tourist = Tourist(name=f'Турист {number}-{index}',
+                              phone=f'+7{number:05}{index:05}',
+                              group=group, is_paid=rng.random() < 0.5)
+            if documents:
+                # у части туристов не хватает одного из документов
+                missing = rng.choice(DOCUMENTS) if rng.random() < 0.3 else None
+                for field in DOCUMENTS:
+                    if field != missing:
+                        setattr(tourist, field, documents[field])
+            people.append(tourist)
+    insert(Tourist, people, batch_size)
+    people = created(Tourist, len(people))
+    counts['tourists'] += len(people)
+
+    if documents:
+        insert(FeedFile, (FeedFile(feed=tourist, file=documents['feed'])
+                          for tourist in people), batch_size)
+        counts['files'] += len(people)
+
+    keys = {}
+    for _, meals, trips in plans:
+        for item, time_from, _ in meals:
+            keys[make_event_key(time_from, nutrition=True)] = (
+                f'Питание в {time_from}')
+        for item, time_from, _ in trips:
+            keys[make_event_key(time_from, item.id)] = (
+                f'Экскурсия {item} в {time_from}')
+    events = resolve_keys(keys, batch_size)
+
+    by_group = {}
+    for tourist in people:
+        by_group.setdefault(tourist.group_id, []).append(tourist)
+
+    stays, meals, trips = [], [], []
+    for group, ((hotel, stay_from, stay_to), group_meals, group_trips) in zip(
+            groups, plans):
+        for tourist in by_group.get(group.id, ()):
+            stays.append(DatelineForHotel(tourist=tourist, hotel=hotel,
+                                          time_from=stay_from,
+                                          time_to=stay_to))
+            meals.extend(
+                TimelineForNutrition(
+                    tourist=tourist, nutrition=item, time_from=time_from,
+                    time_to=time_to,
+                    event=events[make_event_key(time_from, nutrition=True)])
+                for item, time_from, time_to in group_meals)
+            trips.extend(
+                TimelineForExcursion(
+                    tourist=tourist, excursion=item, time_from=time_from,
+                    time_to=time_to,
+                    event=events[make_event_key(time_from, item.id)])
+                for item, time_from, time_to in group_trips)
+    insert(DatelineForHotel, stays, batch_size)
+    insert(TimelineForNutrition, meals, batch_size)
+    insert(TimelineForExcursion, trips, batch_size)
+    counts['timelines'] += len(stays) + len(meals) + len(trips)
+    return counts
+
+
+def generate_data(groups=50, tourists=20, days=7, interval=4, files=False,
+                  batch_size=1000, seed=None, today=None, progress=None) -> Counter:
+    """ Создает groups групп по tourists туристов, поездка длится days суток,
+    группы прибывают каждые interval дней так, что к today (по умолчанию
+    сегодня) в поездке две последние. У туриста 3 * days - 1 записей
+    временных осей. files - добавить туристам документы и файлы.
+    progress(counts) вызывается после каждой записанной порции """
+    rng = random.Random(seed)
+    today = today or timezone.localdate()
+    start = today - datetime.timedelta(days=interval * max(groups - 2, 0))
+    days = max(days, 2)
+
+    with transaction.atomic():
+        references = make_references()
+    documents = placeholder_documents() if files else {}
+
+    counts = Counter()
+    per_chunk = max(1, CHUNK_ROWS // max(1, tourists * (3 * days - 1)))
+    for first in range(0, groups, per_chunk):
+        numbers = range(first, min(first + per_chunk, groups))
+        with transaction.atomic():
+            counts += generate_chunk(numbers, tourists, days, start, interval,
+                                     today, references, documents, rng,
+                                     batch_size)
+        if progress is not None:
+            progress(counts)
+
+    rebuild_occupancy()
+    rebuild_balances()
+    refresh_statuses()
+    if files:
+        rebuild_references()
+    return counts
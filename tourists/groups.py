@@ -0,0 +1,55 @@
+""" Действия "Переместить в группу": кэш списка действующих групп
+и само перемещение (move_tourists).
+
+Список берется из кэша Django и сбрасывается сигналами при сохранении
+или удалении группы (см. tourists.signals). Таймаут страхует процессы,
+у которых свой локальный кэш и до которых сброс не дошел """
+from django.core.cache import cache
+from django.db import transaction
+
+from overview.timeline import touch_timeline
+from .models import Group, Tourist
+from .statuses import schedule_status_update
+
+
+ACTIVE_GROUPS_KEY = 'tourists:active-groups'
+ACTIVE_GROUPS_TIMEOUT = 5 * 60
+
+
+def active_groups() -> list:
+    """ Пары (id, название) групп, которые еще не уехали """
+    groups = cache.get(ACTIVE_GROUPS_KEY)
+    if groups is None:
+        groups = list(Group.objects.filter(
+            status__in=Group.ACTIVE_STATUSES).order_by(
+            'group_name').values_list('id', 'group_name'))
+        cache.set(ACTIVE_GROUPS_KEY, groups, ACTIVE_GROUPS_TIMEOUT)
+    return groups
+
+
+def reset_active_groups():
+    cache.delete(ACTIVE_GROUPS_KEY)
+
+
+class GroupUnavailable(Exception):
+    """ Группа уехала или удалена, а действие взято из кэша списка """
+
+
+def move_tourists(queryset, group_id) -> int:
+    """ Перемещает туристов в группу одним UPDATE. Сигналы при этом
+    не вызываются, поэтому расписание отмечается измененным, а статусы
+    туристов (зависят от дат группы) пересчитываются здесь же.
+    Возвращает число перемещенных туристов; если группа уже не
+    действует, вызывает GroupUnavailable """
+    tourist_ids = list(queryset.values_list('id', flat=True))
+    with transaction.atomic():
+        # группа блокируется до конца перемещения
+        if not Group.objects.select_for_update().filter(
+                pk=group_id, status__in=Group.ACTIVE_STATUSES).exists():
+            raise GroupUnavailable('Группа уже уехала или удалена')
+        rows_updated = Tourist.objects.filter(id__in=tourist_ids).update(
+            group=group_id)
+    if rows_updated:
+        touch_timeline()
+        schedule_status_update(tourist_ids)
+    return rows_updated
@@ -0,0 +1,137 @@
+import json
+import math
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from tourists.models import Group, Tourist
+
+
+VIEWS = ('show_list_services', 'crm', 'tourist_changelist')
+
+
+def percentile(values, share):
+    """ Значение, не меньше которого share всех замеров (по рангу) """
+    values = sorted(values)
+    return values[max(math.ceil(share * len(values)) - 1, 0)]
+
+
+class QueryCounter:
+    """ Считает запросы через execute_wrapper: журнал connection.queries
+    сбрасывается в начале каждого запроса к странице """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def client_host() -> str:
+    """ Хост, который пропустит проверка ALLOWED_HOSTS """
+    hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+    if '*' in settings.ALLOWED_HOSTS:
+        return 'testserver'
+    if hosts:
+        return hosts[0].lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время и число запросов ключевых страниц '
+            'и выводит p50/p95 в JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='замеров на страницу')
+        parser.add_argument('--view', action='append', choices=VIEWS,
+                            dest='views', help='страница, можно несколько; '
+                                               'по умолчанию все')
+        parser.add_argument('--user',
+                            help='сотрудник, от имени которого открываются '
+                                 'страницы; по умолчанию первый суперпользователь')
+        parser.add_argument('--output', '-o', help='файл для JSON')
+
+    def urls(self) -> dict:
+        tourist = (Tourist.objects.filter(
+            group__status__in=Group.ACTIVE_STATUSES).first() or
+            Tourist.objects.first())
+        if tourist is None:
+            raise CommandError('В базе нет туристов, '
+                               'заполните ее командой generate_data')
+        return {
+            'show_list_services': reverse('admin:show-list-services',
+                                          args=[tourist.pk]),
+            'crm': reverse('crm_url'),
+            'tourist_changelist': reverse('admin:tourists_tourist_changelist'),
+        }
+
+    def measure(self, client, url, repeat) -> dict:
+        # Первый запрос прогревает кэши и замеряется отдельно
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = client.get(url)
+            first = time.perf_counter() - started
+            first_queries = counter.count
+            if response.status_code != 200:
+                raise CommandError(f'{url}: ответ {response.status_code}')
+
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                client.get(url)
+                timings.append(time.perf_counter() - started)
+
+        def ms(value):
+            return round(value * 1000, 1)
+
+        return {
+            'url': url,
+            'queries': (counter.count - first_queries) // repeat,
+            'first_queries': first_queries,
+            'first_ms': ms(first),
+            'p50_ms': ms(statistics.median(timings)),
+            'p95_ms': ms(percentile(timings, 0.95)),
+            'min_ms': ms(min(timings)),
+            'max_ms': ms(max(timings)),
+            'runs': len(timings),
+        }
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть не меньше 1')
+        users = User.objects.filter(is_staff=True, is_active=True)
+        if options['user']:
+            user = users.filter(username=options['user']).first()
+        else:
+            user = users.filter(is_superuser=True).first()
+        if user is None:
+            raise CommandError('Нет подходящего сотрудника, укажите --user '
+                               'или создайте суперпользователя')
+
+        client = Client(HTTP_HOST=client_host())
+        client.force_login(user)
+        urls = self.urls()
+
+        report = {
+            name: self.measure(client, urls[name], options['repeat'])
+            for name in options['views'] or VIEWS
+        }
+        report['data'] = {
+            'groups': Group.objects.count(),
+            'tourists': Tourist.objects.count(),
+        }
+
+        result = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(result)
+        else:
+            self.stdout.write(result)
@@ -0,0 +1,50 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tourists.models import Group
+from tourists.export import invoice_rows, iter_csv, write_xlsx
+
+
+def parse_date(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'Неверная дата {value}, ожидается ГГГГ-ММ-ДД')
+
+
+class Command(BaseCommand):
+    help = 'Выгружает счета туристов по группам или за период в CSV или XLSX'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=int, action='append',
+                            dest='groups', help='id группы, можно несколько')
+        parser.add_argument('--date-from', type=parse_date,
+                            help='начало периода, ГГГГ-ММ-ДД')
+        parser.add_argument('--date-to', type=parse_date,
+                            help='конец периода, ГГГГ-ММ-ДД')
+        parser.add_argument('--format', choices=('csv', 'xlsx'),
+                            default='csv')
+        parser.add_argument('--output', '-o',
+                            help='файл для выгрузки, для CSV по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        groups = None
+        if options['groups']:
+            groups = Group.objects.filter(id__in=options['groups'])
+            if len(groups) != len(set(options['groups'])):
+                raise CommandError('Указаны несуществующие группы')
+
+        rows = invoice_rows(groups, options['date_from'], options['date_to'])
+        output = options['output']
+
+        if options['format'] == 'xlsx':
+            if not output:
+                raise CommandError('Для XLSX укажите файл --output')
+            write_xlsx(rows, output)
+        elif output:
+            with open(output, 'w', encoding='utf-8', newline='') as file:
+                file.writelines(iter_csv(rows))
+        else:
+            for line in iter_csv(rows):
+                self.stdout.write(line, ending='')
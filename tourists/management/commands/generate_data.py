@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from tourists.generate import generate_data
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическим сезоном: группы, туристы, '
+            'проживание, питание, экскурсии и общие события')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--groups', type=int, default=50,
+                            help='количество групп')
+        parser.add_argument('--tourists', type=int, default=20,
+                            help='туристов в группе')
+        parser.add_argument('--days', type=int, default=7,
+                            help='длительность поездки в сутках, у туриста '
+                                 '3 * days - 1 записей временных осей')
+        parser.add_argument('--interval', type=int, default=4,
+                            help='дней между прибытием групп')
+        parser.add_argument('--files', action='store_true',
+                            help='добавить туристам документы и файлы')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='строк в одном INSERT')
+        parser.add_argument('--seed', type=int,
+                            help='зерно случайных чисел для повторяемости')
+
+    def handle(self, *args, **options):
+        def progress(counts):
+            if options['verbosity'] > 1:
+                self.stdout.write(f"Групп: {counts['groups']}, "
+                                  f"записей: {counts['timelines']}")
+
+        counts = generate_data(
+            groups=options['groups'], tourists=options['tourists'],
+            days=options['days'], interval=options['interval'],
+            files=options['files'], batch_size=options['batch_size'],
+            seed=options['seed'], progress=progress)
+        self.stdout.write(
+            f"Создано групп: {counts['groups']}, туристов: {counts['tourists']}, "
+            f"файлов: {counts['files']}, записей временных осей: "
+            f"{counts['timelines']}")
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tourists.models import TouristBalance
+from tourists.balance import rebuild_balances, verify_balances
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сохраненные счета всех туристов '
+            'или сверяет их с расчетом по услугам')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Только сверить счета, ничего не записывая')
+
+    def handle(self, *args, **options):
+        if not options['verify']:
+            rebuild_balances()
+            self.stdout.write(
+                f'Счетов туристов: {TouristBalance.objects.count()}')
+            return
+
+        mismatches = verify_balances()
+        for tourist, stored, live in mismatches:
+            self.stdout.write(f'{tourist}: сохранено {stored}, по услугам {live}')
+        if mismatches:
+            raise CommandError(f'Расхождений: {len(mismatches)}')
+        self.stdout.write('Расхождений нет')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from tourists.documents import rebuild_references, deduplicate
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает ссылки на файлы документов туристов '
+            'и удаляет файлы, на которые никто не ссылается')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--deduplicate', action='store_true',
+                            help='Сначала перенести файлы, загруженные до '
+                                 'хранилища с дедупликацией')
+
+    def handle(self, *args, **options):
+        if options['deduplicate']:
+            self.stdout.write(f'Перенесено файлов: {deduplicate()}')
+        result = rebuild_references()
+        self.stdout.write(
+            f'Файлов: {result["files"]}, ссылок: {result["references"]}, '
+            f'объем: {result["bytes"] / 2 ** 20:.1f} МБ, '
+            f'удалено: {result["removed"]}')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from tourists.models import HotelOccupancy
+from tourists.occupancy import rebuild_occupancy
+
+
+class Command(BaseCommand):
+    help = 'Полностью пересчитывает заполненность отелей по ночам'
+
+    def handle(self, *args, **options):
+        rebuild_occupancy()
+        self.stdout.write(
+            f'Записей заполненности: {HotelOccupancy.objects.count()}')
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from tourists.statuses import refresh_statuses, run_scheduler, MAX_SLEEP
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает сохраненные статусы туристов; с --loop работает '
+            'планировщиком, который обновляет статусы на границах занятий')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='работать постоянно, просыпаясь на границах')
+        parser.add_argument('--max-sleep', type=int, default=MAX_SLEEP,
+                            help='наибольший интервал проверки, секунд')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            run_scheduler(options['max_sleep'], log=self.stdout.write)
+        else:
+            changed = refresh_statuses()
+            self.stdout.write(f'Статусов изменено: {changed}')
@@ -0,0 +1,159 @@
+""" Отдача загруженных файлов (сканы паспортов, виз и т.п.) после
+проверки прав в Django.
+
+Сам файл передает фронтенд-сервер, если он настроен
+(MEDIA_SENDFILE_BACKEND): Django отвечает пустым ответом с заголовком
+X-Accel-Redirect (nginx) или X-Sendfile (Apache mod_xsendfile, lighttpd),
+и процесс Python не занят передачей. Для nginx нужен внутренний location:
+
+    location /protected-media/ {
+        internal;
+        alias /путь/к/MEDIA_ROOT/;
+    }
+
+Без фронтенд-сервера (разработка) файл отдается FileResponse с поддержкой
+запросов диапазонов (Range), чтобы большие сканы догружались частями """
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, HttpResponse, HttpResponseNotModified,
+                         Http404)
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .storage import BLOB_DIR
+
+
+X_ACCEL_REDIRECT = 'x-accel-redirect'
+X_SENDFILE = 'x-sendfile'
+
+# Внутренний адрес nginx, если в настройках не задан MEDIA_ACCEL_PREFIX
+ACCEL_PREFIX = '/protected-media/'
+
+# Файлы хранилища документов названы по содержимому и не меняются
+IMMUTABLE = 'private, max-age=31536000, immutable'
+PRIVATE = 'private, no-cache'
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def media_path(path) -> str:
+    """ Полный путь к файлу внутри MEDIA_ROOT; выход за его пределы
+    и отсутствующий файл дают 404 """
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(full_path):
+        raise Http404('Файл не найден')
+    return full_path
+
+
+def byte_range(header, size):
+    """ (начало, конец включительно) из заголовка Range с одним
+    диапазоном; None - отдать файл целиком, ValueError - диапазон за
+    пределами файла. Несколько диапазонов и неверный диапазон (конец
+    раньше начала) не поддерживаются: по стандарту тогда заголовок
+    не учитывается и отдается весь файл """
+    match = RANGE.match(header.replace(' ', '')) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # последние N байт; у пустого файла их нет
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    first = int(first)
+    if last and int(last) < first:
+        return None
+    if first >= size:
+        raise ValueError(header)
+    return first, min(int(last), size - 1) if last else size - 1
+
+
+class FilePart:
+    """ Часть файла для FileResponse: читает не дальше length байт """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def file_response(request, full_path, stats, content_type):
+    """ FileResponse всего файла или запрошенного диапазона """
+    size = stats.st_size
+    last_modified = http_date(stats.st_mtime)
+    requested = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != last_modified:
+        # файл изменился с тех пор, как клиент получил первую часть
+        requested = None
+    try:
+        part = byte_range(requested, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = open(full_path, 'rb')
+    if part is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        first, last = part
+        response = FileResponse(FilePart(file, first, last - first + 1),
+                                content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+        response['Content-Length'] = last - first + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def media_response(request, path):
+    """ Ответ с файлом path из MEDIA_ROOT; права проверяет представление """
+    full_path = media_path(path)
+    stats = os.stat(full_path)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'),
+                              stats.st_mtime, stats.st_size):
+        return HttpResponseNotModified()
+
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    backend = getattr(settings, 'MEDIA_SENDFILE_BACKEND', '')
+    if backend == X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        prefix = getattr(settings, 'MEDIA_ACCEL_PREFIX', ACCEL_PREFIX)
+        response['X-Accel-Redirect'] = prefix + quote(path)
+    elif backend == X_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = quote(full_path)
+    else:
+        response = file_response(request, full_path, stats, content_type)
+    if response.status_code != 416:
+        response['Last-Modified'] = http_date(stats.st_mtime)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    response['Cache-Control'] = (
+        IMMUTABLE if path.startswith(BLOB_DIR + '/') else PRIVATE)
+    response['X-Content-Type-Options'] = 'nosniff'
+    return response
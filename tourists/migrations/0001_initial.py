@@ -0,0 +1,181 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:17
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DatelineForHotel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_from', models.DateTimeField(verbose_name='Начало')),
+                ('time_to', models.DateTimeField(verbose_name='Окончание')),
+            ],
+            options={
+                'verbose_name_plural': 'Пребывание в отелях',
+            },
+        ),
+        migrations.CreateModel(
+            name='Event',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='Название события')),
+                ('manager', models.CharField(blank=True, max_length=200, verbose_name='Менеджер группы туристов')),
+                ('manager_phone', models.CharField(blank=True, max_length=20, verbose_name='Телефон менеджера')),
+            ],
+            options={
+                'verbose_name': 'Событие',
+                'verbose_name_plural': 'События',
+            },
+        ),
+        migrations.CreateModel(
+            name='Excursion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=300, verbose_name='Название экскурсии')),
+                ('note', models.TextField(blank=True, max_length=500, null=True, verbose_name='Описание')),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=7, verbose_name='Стоимость')),
+            ],
+            options={
+                'verbose_name': 'Экскурсия',
+                'verbose_name_plural': 'Экскурсии',
+            },
+        ),
+        migrations.CreateModel(
+            name='Group',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('group_name', models.CharField(max_length=50, verbose_name='Название группы')),
+                ('date_of_arrival', models.DateField(blank=True, null=True, verbose_name='Дата прибытия группы')),
+                ('date_of_departure', models.DateField(blank=True, null=True, verbose_name='Дата убытия группы')),
+                ('status', models.CharField(blank=True, choices=[('f', 'группа формируется'), ('c', 'группа прибыла'), ('g', 'группа уехала')], default='f', max_length=1, verbose_name='Статус группы')),
+            ],
+            options={
+                'verbose_name': 'Группу',
+                'verbose_name_plural': 'Группы',
+                'ordering': ['date_of_arrival'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Nutrition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=300, verbose_name='Наименование')),
+                ('note', models.TextField(blank=True, max_length=500, null=True, verbose_name='Описание')),
+                ('cost', models.DecimalField(decimal_places=2, max_digits=7, verbose_name='Стоимость')),
+            ],
+            options={
+                'verbose_name': 'Питание',
+                'verbose_name_plural': 'Питание',
+            },
+        ),
+        migrations.CreateModel(
+            name='Tourist',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, verbose_name='ФИО Туриста')),
+                ('phone', models.CharField(max_length=20, verbose_name='Телефон')),
+                ('email', models.EmailField(blank=True, max_length=50, null=True, verbose_name='email')),
+                ('note', models.TextField(blank=True, max_length=100, null=True, verbose_name='Примечание')),
+                ('visa', models.FileField(blank=True, null=True, upload_to='files', verbose_name='Копия визы')),
+                ('insurance', models.FileField(blank=True, null=True, upload_to='files', verbose_name='Копия страховки')),
+                ('passport', models.FileField(blank=True, null=True, upload_to='files', verbose_name='Копия паспорта')),
+                ('is_paid', models.BooleanField(default=False, verbose_name='оплачено')),
+                ('group', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tourists.Group', verbose_name='Группа')),
+            ],
+            options={
+                'verbose_name': 'Туриста',
+                'verbose_name_plural': 'Туристы',
+            },
+        ),
+        migrations.CreateModel(
+            name='TimelineForNutrition',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_from', models.DateTimeField(verbose_name='Начало')),
+                ('time_to', models.DateTimeField(verbose_name='Окончание')),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tourists.Event', verbose_name='Событие')),
+                ('nutrition', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tourists.Nutrition', verbose_name='Питание')),
+                ('tourist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tourists.Tourist', verbose_name='Турист')),
+            ],
+            options={
+                'verbose_name_plural': 'Время для питания',
+            },
+        ),
+        migrations.CreateModel(
+            name='TimelineForExcursion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time_from', models.DateTimeField(verbose_name='Начало')),
+                ('time_to', models.DateTimeField(verbose_name='Окончание')),
+                ('event', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tourists.Event', verbose_name='Событие')),
+                ('excursion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tourists.Excursion', verbose_name='Экскурсии')),
+                ('tourist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tourists.Tourist', verbose_name='Турист')),
+            ],
+            options={
+                'verbose_name_plural': 'Время для экскурсий',
+            },
+        ),
+        migrations.AddField(
+            model_name='nutrition',
+            name='timelines',
+            field=models.ManyToManyField(through='tourists.TimelineForNutrition', to='tourists.Tourist'),
+        ),
+        migrations.CreateModel(
+            name='Hotel',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=300, verbose_name='Название отеля')),
+                ('addres', models.CharField(max_length=300, verbose_name='Адрес отеля')),
+                ('phone', models.CharField(max_length=20, verbose_name='Телефон отеля')),
+                ('cost_for_one_day', models.DecimalField(decimal_places=2, max_digits=7, verbose_name='Стоимость за сутки')),
+                ('check_in', models.TimeField(verbose_name='Время заселения')),
+                ('check_out', models.TimeField(verbose_name='Время выезда')),
+                ('datelines', models.ManyToManyField(through='tourists.DatelineForHotel', to='tourists.Tourist')),
+            ],
+            options={
+                'verbose_name': 'Отель',
+                'verbose_name_plural': 'Отели',
+            },
+        ),
+        migrations.CreateModel(
+            name='FeedFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file', models.FileField(blank=True, null=True, upload_to='files/%Y/%m/%d')),
+                ('feed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tourists.Tourist')),
+            ],
+            options={
+                'verbose_name': 'Другие документы',
+                'verbose_name_plural': 'Другие документы',
+            },
+        ),
+        migrations.AddField(
+            model_name='excursion',
+            name='timelines',
+            field=models.ManyToManyField(through='tourists.TimelineForExcursion', to='tourists.Tourist'),
+        ),
+        migrations.AddField(
+            model_name='datelineforhotel',
+            name='event',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='tourists.Event', verbose_name='Событие'),
+        ),
+        migrations.AddField(
+            model_name='datelineforhotel',
+            name='hotel',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tourists.Hotel', verbose_name='Отели'),
+        ),
+        migrations.AddField(
+            model_name='datelineforhotel',
+            name='tourist',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tourists.Tourist', verbose_name='Турист'),
+        ),
+    ]
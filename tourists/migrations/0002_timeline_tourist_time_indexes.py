@@ -0,0 +1,25 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datelineforhotel',
+            index=models.Index(fields=['tourist', 'time_from', 'time_to'], name='hotel_tourist_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineforexcursion',
+            index=models.Index(fields=['tourist', 'time_from', 'time_to'], name='excursion_tourist_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelinefornutrition',
+            index=models.Index(fields=['tourist', 'time_from', 'time_to'], name='nutrition_tourist_time_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0002_timeline_tourist_time_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='key',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True, verbose_name='Ключ события'),
+        ),
+    ]
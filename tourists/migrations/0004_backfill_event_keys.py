@@ -0,0 +1,46 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:18
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def make_event_key(time_from, excursion_id=None, nutrition=False):
+    # Копия tourists.events.make_event_key на момент миграции
+    moment = time_from.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M')
+    if nutrition:
+        return f'nutrition:{moment}'
+    return f'excursion:{excursion_id or ""}:{moment}'
+
+
+def backfill_event_keys(apps, schema_editor):
+    """ Проставляет ключи событиям, созданным до их появления """
+    Event = apps.get_model('tourists', 'Event')
+    TimelineForNutrition = apps.get_model('tourists', 'TimelineForNutrition')
+    TimelineForExcursion = apps.get_model('tourists', 'TimelineForExcursion')
+
+    keys = {}
+    for event_id, time_from in TimelineForNutrition.objects.filter(
+            event__isnull=False).values_list('event', 'time_from'):
+        keys.setdefault(event_id, make_event_key(time_from, nutrition=True))
+    for event_id, time_from, excursion_id in TimelineForExcursion.objects.filter(
+            event__isnull=False).values_list('event', 'time_from', 'excursion'):
+        keys.setdefault(event_id, make_event_key(time_from, excursion_id))
+
+    used = set()
+    for event_id, key in sorted(keys.items()):
+        # Дубли, созданные раньше, остаются без ключа
+        if key in used:
+            continue
+        used.add(key)
+        Event.objects.filter(id=event_id).update(key=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0003_event_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_event_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:26
+
+from django.db import migrations, models
+import datetime
+from collections import Counter
+
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def fill_occupancy(apps, schema_editor):
+    """ Начальное заполнение таблицы по уже существующим пребываниям """
+    DatelineForHotel = apps.get_model('tourists', 'DatelineForHotel')
+    HotelOccupancy = apps.get_model('tourists', 'HotelOccupancy')
+
+    guests = Counter()
+    for hotel_id, time_from, time_to in DatelineForHotel.objects.filter(
+            hotel__isnull=False).values_list('hotel', 'time_from', 'time_to'):
+        night = timezone.localdate(time_from)
+        end = max(timezone.localdate(time_to), night + datetime.timedelta(days=1))
+        while night < end:
+            guests[hotel_id, night] += 1
+            night += datetime.timedelta(days=1)
+
+    HotelOccupancy.objects.bulk_create(
+        HotelOccupancy(hotel_id=hotel_id, night=night, guests=count)
+        for (hotel_id, night), count in guests.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0004_backfill_event_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HotelOccupancy',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField(verbose_name='Ночь')),
+                ('guests', models.PositiveIntegerField(default=0, verbose_name='Туристов')),
+            ],
+            options={
+                'verbose_name': 'Заполненность отеля',
+                'verbose_name_plural': 'Заполненность отелей',
+                'ordering': ['night'],
+            },
+        ),
+        migrations.AddField(
+            model_name='hotel',
+            name='capacity',
+            field=models.PositiveIntegerField(blank=True, help_text='Оставьте пустым, если количество мест не ограничено', null=True, verbose_name='Количество мест'),
+        ),
+        migrations.AddIndex(
+            model_name='datelineforhotel',
+            index=models.Index(fields=['hotel', 'time_from', 'time_to'], name='hotel_stay_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='hoteloccupancy',
+            name='hotel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='tourists.Hotel', verbose_name='Отель'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hoteloccupancy',
+            unique_together={('hotel', 'night')},
+        ),
+        migrations.RunPython(fill_occupancy, migrations.RunPython.noop),
+    ]
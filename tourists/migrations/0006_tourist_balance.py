@@ -0,0 +1,58 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:28
+
+from django.db import migrations, models
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+
+
+def fill_balances(apps, schema_editor):
+    """ Начальный расчет счетов по уже введенным услугам,
+    по тем же правилам, что и tourists.billing """
+    TouristBalance = apps.get_model('tourists', 'TouristBalance')
+    services = (
+        ('hotel', 'DatelineForHotel', 'hotel__cost_for_one_day'),
+        ('nutrition', 'TimelineForNutrition', 'nutrition__cost'),
+        ('excursion', 'TimelineForExcursion', 'excursion__cost'),
+    )
+
+    totals = defaultdict(lambda: dict.fromkeys(('hotel', 'nutrition', 'excursion'),
+                                               Decimal(0)))
+    for kind, model_name, cost_field in services:
+        model = apps.get_model('tourists', model_name)
+        for tourist_id, time_from, time_to, cost in model.objects.values_list(
+                'tourist', 'time_from', 'time_to', cost_field):
+            num = max((time_to - time_from).days, 1) if kind == 'hotel' else 1
+            totals[tourist_id][kind] += num * (cost or Decimal(0))
+
+    TouristBalance.objects.bulk_create(
+        TouristBalance(tourist_id=tourist_id, total=sum(values.values()), **values)
+        for tourist_id, values in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0005_hotel_capacity_occupancy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TouristBalance',
+            fields=[
+                ('tourist', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='balance', serialize=False, to='tourists.Tourist', verbose_name='Турист')),
+                ('hotel', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Проживание')),
+                ('nutrition', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Питание')),
+                ('excursion', models.DecimalField(decimal_places=2, default=0, max_digits=10, verbose_name='Экскурсии')),
+                ('total', models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=10, verbose_name='Итого')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Пересчитан')),
+            ],
+            options={
+                'verbose_name': 'Счет туриста',
+                'verbose_name_plural': 'Счета туристов',
+            },
+        ),
+        migrations.RunPython(fill_balances, migrations.RunPython.noop),
+    ]
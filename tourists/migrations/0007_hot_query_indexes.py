@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0006_tourist_balance'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='datelineforhotel',
+            index=models.Index(fields=['time_from', 'time_to'], name='hotel_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['status', 'date_of_arrival'], name='group_status_arrival_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='group',
+            index=models.Index(fields=['date_of_arrival', 'date_of_departure'], name='group_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineforexcursion',
+            index=models.Index(fields=['time_from', 'time_to'], name='excursion_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelinefornutrition',
+            index=models.Index(fields=['time_from', 'time_to'], name='nutrition_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tourist',
+            index=models.Index(fields=['group', 'name'], name='tourist_group_name_idx'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:44
+
+from django.db import migrations, models
+from django.db.models import Case, When, Exists, OuterRef, BooleanField
+from django.utils import timezone
+
+
+def status_code(is_await, is_left, in_hotel, is_nutr, on_excur) -> str:
+    """ Код статуса по признакам, как tourists.models.resolve_status """
+    if is_await:
+        return 'await'
+    if is_left:
+        return 'left'
+    if not in_hotel:
+        return 'no_hotel'
+    if not is_nutr or not on_excur:
+        return 'idle'
+    return 'busy'
+
+
+def fill_statuses(apps, schema_editor):
+    """ Начальные статусы туристов на момент миграции, как их считает
+    refresh_statuses; дальше статусы поддерживают сигналы
+    и планировщик update_statuses """
+    Tourist = apps.get_model('tourists', 'Tourist')
+    now = timezone.now()
+
+    def is_busy(model_name):
+        return Exists(apps.get_model('tourists', model_name).objects.filter(
+            tourist=OuterRef('pk'), time_from__lte=now, time_to__gte=now))
+
+    rows = Tourist.objects.annotate(
+        status_await=Case(When(group__date_of_arrival__gte=now, then=True),
+                          default=False, output_field=BooleanField()),
+        status_left=Case(When(group__date_of_departure__lte=now, then=True),
+                         default=False, output_field=BooleanField()),
+        status_hotel=is_busy('DatelineForHotel'),
+        status_nutr=is_busy('TimelineForNutrition'),
+        status_excur=is_busy('TimelineForExcursion'),
+    ).values_list('id', 'status_await', 'status_left', 'status_hotel',
+                  'status_nutr', 'status_excur')
+
+    codes = {}
+    for tourist_id, *flags in rows.iterator():
+        codes.setdefault(status_code(*flags), []).append(tourist_id)
+    for code, ids in codes.items():
+        for start in range(0, len(ids), 500):
+            Tourist.objects.filter(id__in=ids[start:start + 500]).update(
+                current_status=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tourist',
+            name='current_status',
+            field=models.CharField(blank=True, choices=[('await', 'ожидается приезд'), ('left', 'уехал'), ('no_hotel', 'не заселен в гостиницу'), ('idle', 'ничем не занят'), ('busy', ' - ')], db_index=True, editable=False, max_length=10, verbose_name='Статус'),
+        ),
+        migrations.RunPython(fill_statuses, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='datelineforhotel',
+            index=models.Index(fields=['time_to'], name='hotel_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineforexcursion',
+            index=models.Index(fields=['time_to'], name='excursion_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelinefornutrition',
+            index=models.Index(fields=['time_to'], name='nutrition_end_idx'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.28 on 2026-10-18 17:54
+
+from collections import Counter
+
+from django.db import migrations, models
+import tourists.storage
+
+
+def fill_references(apps, schema_editor):
+    """ Начальные счетчики ссылок на уже загруженные файлы; сами файлы
+    переносит в хранилище команда rebuild_documents --deduplicate """
+    StoredFile = apps.get_model('tourists', 'StoredFile')
+    fields = (
+        ('Tourist', ('visa', 'insurance', 'passport')),
+        ('FeedFile', ('file',)),
+    )
+    names = Counter()
+    for model_name, model_fields in fields:
+        model = apps.get_model('tourists', model_name)
+        for row in model.objects.values_list(*model_fields).iterator():
+            names.update(name for name in row if name)
+    StoredFile.objects.bulk_create(
+        (StoredFile(name=name, references=count)
+         for name, count in names.items()),
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0008_tourist_current_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True, verbose_name='Файл')),
+                ('size', models.BigIntegerField(default=0, verbose_name='Размер')),
+                ('references', models.IntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Файл документа',
+                'verbose_name_plural': 'Файлы документов',
+            },
+        ),
+        migrations.AlterField(
+            model_name='feedfile',
+            name='file',
+            field=models.FileField(blank=True, null=True, storage=tourists.storage.DedupStorage(), upload_to='files/%Y/%m/%d'),
+        ),
+        migrations.AlterField(
+            model_name='tourist',
+            name='insurance',
+            field=models.FileField(blank=True, null=True, storage=tourists.storage.DedupStorage(), upload_to='files', verbose_name='Копия страховки'),
+        ),
+        migrations.AlterField(
+            model_name='tourist',
+            name='passport',
+            field=models.FileField(blank=True, null=True, storage=tourists.storage.DedupStorage(), upload_to='files', verbose_name='Копия паспорта'),
+        ),
+        migrations.AlterField(
+            model_name='tourist',
+            name='visa',
+            field=models.FileField(blank=True, null=True, storage=tourists.storage.DedupStorage(), upload_to='files', verbose_name='Копия визы'),
+        ),
+        migrations.RunPython(fill_references, migrations.RunPython.noop),
+    ]
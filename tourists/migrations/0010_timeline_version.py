@@ -0,0 +1,33 @@
+# Generated by Django 2.2.28 on 2026-10-18 18:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def create_version(apps, schema_editor):
+    """ Единственная запись версии расписания (см. overview.timeline) """
+    TimelineVersion = apps.get_model('tourists', 'TimelineVersion')
+    TimelineVersion.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0009_stored_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0, verbose_name='Версия')),
+                ('changed', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Изменено')),
+            ],
+            options={
+                'verbose_name': 'Версия расписания',
+                'verbose_name_plural': 'Версии расписания',
+            },
+        ),
+        migrations.RunPython(create_version, migrations.RunPython.noop),
+    ]
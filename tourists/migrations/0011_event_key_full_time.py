@@ -0,0 +1,50 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:02
+
+from django.db import migrations
+from django.utils import timezone
+
+
+def make_event_key(time_from, excursion_id=None, nutrition=False):
+    # Копия tourists.events.make_event_key на момент миграции
+    moment = time_from.astimezone(timezone.utc).isoformat(
+        timespec='microseconds')
+    if nutrition:
+        return f'nutrition:{moment}'
+    return f'excursion:{excursion_id or ""}:{moment}'
+
+
+def full_time_event_keys(apps, schema_editor):
+    """ Переводит ключи событий с точности до минуты на полное время """
+    Event = apps.get_model('tourists', 'Event')
+    TimelineForNutrition = apps.get_model('tourists', 'TimelineForNutrition')
+    TimelineForExcursion = apps.get_model('tourists', 'TimelineForExcursion')
+
+    keys = {}
+    for event_id, time_from in TimelineForNutrition.objects.filter(
+            event__key__isnull=False).values_list('event', 'time_from'):
+        keys.setdefault(event_id, make_event_key(time_from, nutrition=True))
+    for event_id, time_from, excursion_id in TimelineForExcursion.objects.filter(
+            event__key__isnull=False).values_list('event', 'time_from',
+                                                  'excursion'):
+        keys.setdefault(event_id, make_event_key(time_from, excursion_id))
+
+    # Ключи без записей в старом виде ни с чем не совпадут
+    Event.objects.filter(key__isnull=False).exclude(id__in=keys).update(
+        key=None)
+    used = set()
+    for event_id, key in sorted(keys.items()):
+        # Дубли остаются без ключа, как в 0004_backfill_event_keys
+        Event.objects.filter(id=event_id).update(
+            key=None if key in used else key)
+        used.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tourists', '0010_timeline_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(full_time_event_keys, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
-from itertools import chain
 from django.core.exceptions import ValidationError
-from django.db.models import Q
+from django.db.models import Q, OuterRef, Exists, Case, When, BooleanField
 from django.utils import timezone
-from overview.make_gantt import *
+from django.utils.functional import cached_property
+from overview.gantt_cache import cached_gantt, gantt_mode
+from overview.rendering import render_tourist_gantt
+from .overlaps import find_overlaps
+from .storage import document_storage
 
 
 class Group(models.Model):
@@ -22,6 +25,10 @@ class Group(models.Model):
            ('c', 'группа прибыла'),
            ('g', 'группа уехала'),
         )
+    # Статусы групп, которые еще не уехали. Выбираются через IN,
+    # а не exclude, чтобы запрос мог пройти по индексу статуса;
+    # пустой статус допускается формой и тоже считается действующим
+    ACTIVE_STATUSES = ('', 'f', 'c')
 
     status = models.CharField(verbose_name='Статус группы',
         max_length=1,
@@ -44,6 +51,92 @@ class Group(models.Model):
         verbose_name = "Группу" 
         verbose_name_plural = "Группы" 
         ordering = ['date_of_arrival']
+        indexes = [
+            models.Index(fields=['status', 'date_of_arrival'],
+                         name='group_status_arrival_idx'),
+            models.Index(fields=['date_of_arrival', 'date_of_departure'],
+                         name='group_dates_idx'),
+        ]
+
+
+STATUS_FLAGS = ('status_await', 'status_left', 'status_hotel',
+                'status_nutr', 'status_excur')
+
+# Сохраненный статус туриста (Tourist.current_status) и его название
+STATUS_CHOICES = (
+    ('await', 'ожидается приезд'),
+    ('left', 'уехал'),
+    ('no_hotel', 'не заселен в гостиницу'),
+    ('idle', 'ничем не занят'),
+    ('busy', ' - '),
+)
+STATUS_CODES = {name: code for code, name in STATUS_CHOICES}
+
+
+def resolve_status(is_await, is_left, in_hotel, is_nutr, on_excur) -> str:
+    """ Функция, выбирающая статус туриста по вычисленным признакам """
+    if is_await:
+        _status = 'ожидается приезд'
+    elif is_left:
+        _status = 'уехал'
+    elif not in_hotel:
+        _status = 'не заселен в гостиницу'
+    elif not is_nutr or not on_excur:
+        _status = 'ничем не занят'
+    else:
+        _status = ' - '
+    return _status
+
+
+# Условие полного пакета документов: виза, страховка и паспорт загружены
+FULL_PACKAGE_OF_DOCUMENTS = (
+    Q(visa__isnull=False) & ~Q(visa='') &
+    Q(insurance__isnull=False) & ~Q(insurance='') &
+    Q(passport__isnull=False) & ~Q(passport='')
+)
+
+
+class TouristQuerySet(models.QuerySet):
+
+    def with_documents(self):
+        """ Добавляет к туристам признак полного пакета документов,
+        вычисленный в том же запросе """
+        return self.annotate(
+            has_all_docs=Case(
+                When(FULL_PACKAGE_OF_DOCUMENTS, then=True),
+                default=False,
+                output_field=BooleanField()
+            )
+        )
+
+    def with_status(self, now=None):
+        """ Добавляет к туристам признаки для вычисления статуса.
+        Все признаки считаются одним запросом относительно одного момента now """
+        if now is None:
+            now = timezone.now()
+
+        def is_busy(timeline):
+            return Exists(timeline.objects.filter(
+                tourist=OuterRef('pk'),
+                time_from__lte=now,
+                time_to__gte=now
+            ))
+
+        return self.annotate(
+            status_await=Case(
+                When(group__date_of_arrival__gte=now, then=True),
+                default=False,
+                output_field=BooleanField()
+            ),
+            status_left=Case(
+                When(group__date_of_departure__lte=now, then=True),
+                default=False,
+                output_field=BooleanField()
+            ),
+            status_hotel=is_busy(DatelineForHotel),
+            status_nutr=is_busy(TimelineForNutrition),
+            status_excur=is_busy(TimelineForExcursion),
+        )
 
 
 class Tourist(models.Model):
@@ -63,15 +156,15 @@ class Tourist(models.Model):
         )
     visa = models.FileField(verbose_name='Копия визы',
         blank=True, null=True,
-        upload_to='files'
+        upload_to='files', storage=document_storage
         )
     insurance = models.FileField(verbose_name='Копия страховки',
         blank=True, null=True,
-        upload_to='files'
+        upload_to='files', storage=document_storage
         )
     passport = models.FileField(verbose_name='Копия паспорта',
         blank=True, null=True,
-        upload_to='files'
+        upload_to='files', storage=document_storage
         )
     group = models.ForeignKey('Group', verbose_name='Группа',
         on_delete=models.SET_NULL,
@@ -80,91 +173,146 @@ class Tourist(models.Model):
     is_paid = models.BooleanField(verbose_name='оплачено',
         default=False
     )
+    # Статус на момент последнего пересчета. Поддерживается сигналами
+    # и планировщиком update_statuses (см. tourists.statuses)
+    current_status = models.CharField(verbose_name='Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        blank=True,
+        editable=False,
+        db_index=True
+    )
+
+    objects = TouristQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Туриста'
         verbose_name_plural = "Туристы" 
+        indexes = [
+            models.Index(fields=['group', 'name'],
+                         name='tourist_group_name_idx'),
+        ]
 
-    @property
+    @cached_property
     def status(self):
-        ''' Функция для установки вычисляемого поля статус '''
-        from datetime import datetime 
-
-        is_await = Tourist.objects.filter(id=self.id, 
-                group__date_of_arrival__gte=timezone.now()
-                )
-        is_left = Tourist.objects.filter(id=self.id, 
-                group__date_of_departure__lte=timezone.now()
-                )
-        is_nutr = TimelineForNutrition.objects.filter(tourist=self.id, 
-            time_from__lte=timezone.now(), 
-            time_to__gte=timezone.now()
-            )
-        on_excur = TimelineForExcursion.objects.filter(tourist=self.id, 
-            time_from__lte=timezone.now(),
-            time_to__gte=timezone.now() 
-            )
-        in_hotel = DatelineForHotel.objects.filter(tourist=self.id, 
-            time_from__lte=timezone.now(),
-            time_to__gte=timezone.now()
-            )
-
-        if is_await:
-            _status = 'ожидается приезд'
-        elif is_left:
-            _status = 'уехал'
-        elif not in_hotel:
-            _status = 'не заселен в гостиницу'
-        elif not is_nutr or not on_excur:
-            _status = 'ничем не занят'
+        ''' Функция для установки вычисляемого поля статус.
+        Если турист получен через Tourist.objects.with_status(), признаки
+        уже посчитаны, иначе они добираются одним запросом '''
+        if hasattr(self, STATUS_FLAGS[0]):
+            flags = [getattr(self, flag) for flag in STATUS_FLAGS]
         else:
-            _status = ' - '
-
-        return _status 
-
+            flags = Tourist.objects.with_status().values_list(
+                *STATUS_FLAGS).get(id=self.id)
+        return resolve_status(*flags)
+
+    def business(self, accessor: str, name_field: str) -> list:
+        """ Занятия туриста (название, начало, окончание) из временной оси
+        accessor. Если записи уже подгружены через prefetch_related,
+        повторного запроса к базе нет """
+        if accessor in getattr(self, '_prefetched_objects_cache', {}):
+            business = []
+            for timeline in getattr(self, accessor).all():
+                item = getattr(timeline, name_field)
+                business.append((item.name if item else None,
+                                 timeline.time_from, timeline.time_to))
+            return business
+        return list(getattr(self, accessor).values_list(
+            f'{name_field}__name', 'time_from', 'time_to'))
+
+    def gantt_business(self) -> list:
+        """ Занятия туриста, которые показываются на диаграмме Ганта """
+        return (
+            self.business('timelinefornutrition_set', 'nutrition') +
+            self.business('timelineforexcursion_set', 'excursion')
+        )
 
-    def gantt_to_html(self) -> str:
+    def render_gantt(self) -> str:
         """ Функция берет список всех занятий туриста и рисует по ним диаграммы
         возвращает строковое представление HTML странички с диаграммами """
-        all_business = chain(
-            # DatelineForHotel.objects.filter(tourist=self).values_list(
-            #     'hotel__name', 'time_from', 'time_to'),
-            TimelineForNutrition.objects.filter(tourist=self).values_list(
-                'nutrition__name', 'time_from', 'time_to'),
-            TimelineForExcursion.objects.filter(tourist=self).values_list(
-                'excursion__name', 'time_from', 'time_to')
-        )
-        list_of_business = [i for i in all_business]
-        return start_gantt(list_of_business)
+        return render_tourist_gantt(self.gantt_business(), gantt_mode())
+
+    def gantt_to_html(self) -> str:
+        """ Диаграммы туриста из кэша, рисуются заново только после
+        изменения его питания или экскурсий """
+        return cached_gantt(self.id, self.render_gantt)
   
     def check_doc(self):
-        doc_pack = Tourist.objects.filter(
-            id=self.id
-        ).values('visa', 'insurance', 'passport')
-        for pack in doc_pack:
-            for _, doc in pack.items():
-                if doc is None or doc == '':
-                    return False
-        return True
+        """ Проверка полного пакета документов по уже загруженным полям,
+        без обращения к базе """
+        return all((self.visa, self.insurance, self.passport))
         
     def check_hotel(self):
-        return set(DatelineForHotel.objects.filter(
-            tourist=self.id
-        ).values_list('hotel__name', flat=True))
+        return {name for name, *_ in self.business('datelineforhotel_set',
+                                                   'hotel')}
 
     def check_nutrition(self):
-        return set(TimelineForNutrition.objects.filter(
-            tourist=self.id
-        ).values_list('nutrition__name', flat=True))
-  
+        return {name for name, *_ in self.business('timelinefornutrition_set',
+                                                   'nutrition')}
 
     def __str__(self):
         """ Функция, отображающая имя туриста и его телефон"""
         return f'{self.name} {self.phone}'
 
 
+class TouristBalance(models.Model):
+    """ Сохраненный счет туриста: суммы по видам услуг и итог.
+    Пересчитывается при изменении услуг туриста и цен (см. tourists.balance),
+    чтобы списки можно было сортировать и фильтровать по задолженности """
+    tourist = models.OneToOneField('Tourist', verbose_name='Турист',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='balance'
+        )
+    hotel = models.DecimalField(verbose_name='Проживание',
+        max_digits=10,
+        decimal_places=2,
+        default=0
+        )
+    nutrition = models.DecimalField(verbose_name='Питание',
+        max_digits=10,
+        decimal_places=2,
+        default=0
+        )
+    excursion = models.DecimalField(verbose_name='Экскурсии',
+        max_digits=10,
+        decimal_places=2,
+        default=0
+        )
+    total = models.DecimalField(verbose_name='Итого',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        db_index=True
+        )
+    updated = models.DateTimeField(verbose_name='Пересчитан', auto_now=True)
+
+    def __str__(self):
+        return f'{self.tourist_id}: {self.total}'
+
+    class Meta:
+        verbose_name = 'Счет туриста'
+        verbose_name_plural = 'Счета туристов'
+
+
+class TimelineVersion(models.Model):
+    """ Номер версии и время последнего изменения расписания для условных
+    GET (см. overview.timeline). Одна запись на всю базу, поэтому версия
+    общая для всех процессов веб-сервера """
+    version = models.BigIntegerField(verbose_name='Версия', default=0)
+    changed = models.DateTimeField(verbose_name='Изменено',
+                                   default=timezone.now)
+
+    class Meta:
+        verbose_name = 'Версия расписания'
+        verbose_name_plural = 'Версии расписания'
+
+    def __str__(self):
+        return f'{self.version}: {self.changed}'
+
+
 class FeedFile(models.Model):
-    file = models.FileField(blank=True, null=True, upload_to="files/%Y/%m/%d")
+    file = models.FileField(blank=True, null=True, upload_to="files/%Y/%m/%d",
+                            storage=document_storage)
     feed = models.ForeignKey(Tourist, on_delete=models.CASCADE)
 
     class Meta:
@@ -172,6 +320,21 @@ class FeedFile(models.Model):
         verbose_name_plural = 'Другие документы'
 
 
+class StoredFile(models.Model):
+    """ Файл документа в хранилище и число ссылок на него из полей
+    документов; без ссылок файл удаляется (см. tourists.documents) """
+    name = models.CharField(verbose_name='Файл', max_length=255, unique=True)
+    size = models.BigIntegerField(verbose_name='Размер', default=0)
+    references = models.IntegerField(verbose_name='Ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'Файл документа'
+        verbose_name_plural = 'Файлы документов'
+
+    def __str__(self):
+        return self.name
+
+
 class Event(models.Model):
     """ Модель, описывающая события, в которых могут участвовать туристы  """
     name = models.CharField(max_length=200, verbose_name='Название события')
@@ -184,6 +347,14 @@ class Event(models.Model):
         max_length=20, 
         blank=True,
         )
+    # Ключ автоматически созданного события: время начала и экскурсия.
+    # Уникальность не дает двум одновременным сохранениям создать дубли
+    key = models.CharField(verbose_name='Ключ события',
+        max_length=100,
+        unique=True,
+        blank=True, null=True,
+        editable=False
+        )
 
     def __str__(self):
         return self.name
@@ -205,32 +376,34 @@ class Timeline(models.Model):
         blank=True, null=True
         )
 
+    # Формсет админки проверяет пересечения (и места в отелях) всех своих
+    # строк разом и выставляет этот флаг, чтобы clean не ходил в базу
+    # для каждой строки
+    defer_overlap_check = False
+
+    order_error = 'Время начала не может быть больше времени окончания'
+    busy_error = 'Выберите другое время, это уже занято'
+
     class Meta:
         abstract = True       
         get_latest_by = "date_from" 
 
+    @classmethod
+    def overlapping_models(cls) -> tuple:
+        """ Таблицы, промежутки из которых не должны пересекаться с этой """
+        return (TimelineForExcursion, TimelineForNutrition)
+
     def clean(self):
         if not self.time_from or not self.time_to:
             raise ValidationError("Заполните пустые поля")
         
         if self.time_from > self.time_to: 
-            raise ValidationError(
-               'Время начала не может быть больше времени окончания')
+            raise ValidationError(self.order_error)
 
         # Проверим, нет ли у этого туриста других дел на это время
-
-        tle = TimelineForExcursion.objects.filter(Q(tourist=self.tourist),
-            Q(time_from__gt=self.time_from, time_from__lt=self.time_to) |
-            Q(time_to__gt=self.time_from, time_to__lt=self.time_to)
-            ).exclude(id=self.id)
-
-        tln = TimelineForNutrition.objects.filter(Q(tourist=self.tourist),
-            Q(time_from__gt=self.time_from, time_from__lt=self.time_to) |
-            Q(time_to__gt=self.time_from, time_to__lt=self.time_to)
-            ).exclude(id=self.id)
-        # Если хотя бы один запрос вернулся не пустым
-        if tle or tln:
-            raise ValidationError('Выберите другое время, это уже занято') 
+        if not self.defer_overlap_check and find_overlaps(
+                self.tourist_id, [self], self.overlapping_models()):
+            raise ValidationError(self.busy_error)
 
 
 class TimelineForNutrition(Timeline):
@@ -244,6 +417,13 @@ class TimelineForNutrition(Timeline):
 
     class Meta:
         verbose_name_plural = "Время для питания"
+        indexes = [
+            models.Index(fields=['tourist', 'time_from', 'time_to'],
+                         name='nutrition_tourist_time_idx'),
+            models.Index(fields=['time_from', 'time_to'],
+                         name='nutrition_time_idx'),
+            models.Index(fields=['time_to'], name='nutrition_end_idx'),
+        ]
 
        
 class TimelineForExcursion(Timeline):
@@ -256,6 +436,13 @@ class TimelineForExcursion(Timeline):
 
     class Meta:
         verbose_name_plural = "Время для экскурсий"
+        indexes = [
+            models.Index(fields=['tourist', 'time_from', 'time_to'],
+                         name='excursion_tourist_time_idx'),
+            models.Index(fields=['time_from', 'time_to'],
+                         name='excursion_time_idx'),
+            models.Index(fields=['time_to'], name='excursion_end_idx'),
+        ]
  
 
 class DatelineForHotel(Timeline):
@@ -266,27 +453,32 @@ class DatelineForHotel(Timeline):
         null=True
         )
 
+    order_error = 'Время заселения не может быть меньше времени выселения'
+
     class Meta:
         verbose_name_plural = "Пребывание в отелях"
+        indexes = [
+            models.Index(fields=['tourist', 'time_from', 'time_to'],
+                         name='hotel_tourist_time_idx'),
+            models.Index(fields=['hotel', 'time_from', 'time_to'],
+                         name='hotel_stay_time_idx'),
+            models.Index(fields=['time_from', 'time_to'],
+                         name='hotel_time_idx'),
+            models.Index(fields=['time_to'], name='hotel_end_idx'),
+        ]
+
+    @classmethod
+    def overlapping_models(cls) -> tuple:
+        # Турист не может жить в двух гостиницах одновременно
+        return (DatelineForHotel,)
 
     def clean(self):
-        if not self.time_from or not self.time_to:
-            raise ValidationError("Заполните пустые поля")
-        
-        if self.time_from > self.time_to: 
-            raise ValidationError(
-               'Время заселения не может быть меньше времени выселения')
-
-        # Проверим, не живет ли турист в другой гостинице это время
-
-        dlh = DatelineForHotel.objects.filter(Q(tourist=self.tourist),
-            Q(time_from__gt=self.time_from, time_from__lt=self.time_to) |
-            Q(time_to__gt=self.time_from, time_to__lt=self.time_to)
-            ).exclude(id=self.id)
-
-        # Если запрос вернулся не пустым
-        if dlh:
-            raise ValidationError(f'Выберите другое время, это уже занято')     
+        super().clean()
+        # Проверим, есть ли в отеле свободные места на все ночи;
+        # формсет админки проверяет все свои строки разом
+        if not self.defer_overlap_check:
+            from .occupancy import check_capacity
+            check_capacity(self)
 
 
 class Excursion(models.Model):
@@ -358,6 +550,10 @@ class Hotel(models.Model):
         )
     check_in = models.TimeField(verbose_name='Время заселения')
     check_out = models.TimeField(verbose_name='Время выезда')
+    capacity = models.PositiveIntegerField(verbose_name='Количество мест',
+        blank=True, null=True,
+        help_text='Оставьте пустым, если количество мест не ограничено'
+        )
     datelines = models.ManyToManyField(Tourist, through='DatelineForHotel')
 
     def __str__(self):
@@ -367,3 +563,25 @@ class Hotel(models.Model):
     class Meta:
         verbose_name = 'Отель'
         verbose_name_plural = 'Отели'
+
+
+class HotelOccupancy(models.Model):
+    """ Заполненность отеля: сколько наших туристов ночует в нем в ночь
+    с night на следующий день. Пересчитывается при изменении пребываний
+    в отелях (см. tourists.occupancy) """
+    hotel = models.ForeignKey('Hotel', verbose_name='Отель',
+        on_delete=models.CASCADE
+        )
+    night = models.DateField(verbose_name='Ночь')
+    guests = models.PositiveIntegerField(verbose_name='Туристов',
+        default=0
+        )
+
+    def __str__(self):
+        return f'{self.hotel} {self.night}: {self.guests}'
+
+    class Meta:
+        verbose_name = 'Заполненность отеля'
+        verbose_name_plural = 'Заполненность отелей'
+        unique_together = ('hotel', 'night')
+        ordering = ['night']
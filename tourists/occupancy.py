@@ -0,0 +1,212 @@
+""" Заполненность отелей по ночам.
+
+Ночь - это дата заселения (в местном времени), турист занимает место
+с ночи заселения до ночи перед выселением. Если заселение и выселение
+приходятся на один день, турист все равно занимает одну ночь - так же,
+как при оплате (см. billing.nights_in_hotel).
+
+Количество туристов на каждую ночь считается заметающей прямой по
+событиям заселения (+1) и выселения (-1) и хранится в таблице
+HotelOccupancy. При изменении пребывания пересчитываются только ночи,
+которые оно затрагивает.
+
+Свободные места проверяются по таблице дважды: при проверке формы
+(overbooked, одним запросом на все строки формсета) и после сохранения
+пребываний (verify_capacity), пока строки их отелей заблокированы
+(lock_hotels). Так два одновременных сохранения не займут последнее
+место оба: второе дождется первого и увидит его гостей """
+import datetime
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Min, Max, Q, F
+from django.utils import timezone
+
+from .models import DatelineForHotel, HotelOccupancy, Hotel
+
+
+ONE_DAY = datetime.timedelta(days=1)
+
+
+def stay_nights(time_from, time_to) -> tuple:
+    """ Первая ночь пребывания и ночь, которая уже не оплачивается """
+    first = timezone.localdate(time_from)
+    end = timezone.localdate(time_to)
+    return first, max(end, first + ONE_DAY)
+
+
+def day_start(night):
+    return timezone.make_aware(
+        datetime.datetime.combine(night, datetime.time.min))
+
+
+def sweep(stays, date_from, date_to) -> dict:
+    """ Количество гостей на каждую ночь из [date_from, date_to).
+    stays - пары (начало, окончание) пребываний """
+    events = defaultdict(int)
+    for time_from, time_to in stays:
+        first, end = stay_nights(time_from, time_to)
+        first, end = max(first, date_from), min(end, date_to)
+        if first < end:
+            events[first] += 1
+            events[end] -= 1
+
+    # Проходим ночи по порядку, накапливая заселения и выселения
+    result, guests, night = {}, 0, date_from
+    while night < date_to:
+        guests += events.get(night, 0)
+        if guests:
+            result[night] = guests
+        night += ONE_DAY
+    return result
+
+
+def stays_query(date_from, date_to):
+    """ Пребывания, которые могут задевать ночи из [date_from, date_to) """
+    return DatelineForHotel.objects.filter(
+        hotel__isnull=False,
+        time_from__lt=day_start(date_to),
+        time_to__gte=day_start(date_from),
+    )
+
+
+def compute_occupancy(date_from, date_to, hotels=None) -> dict:
+    """ {id отеля: {ночь: гостей}} за период одним запросом, без таблицы """
+    stays = stays_query(date_from, date_to)
+    if hotels is not None:
+        stays = stays.filter(hotel__in=hotels)
+
+    by_hotel = defaultdict(list)
+    for hotel_id, time_from, time_to in stays.values_list(
+            'hotel', 'time_from', 'time_to'):
+        by_hotel[hotel_id].append((time_from, time_to))
+    return {hotel_id: sweep(hotel_stays, date_from, date_to)
+            for hotel_id, hotel_stays in by_hotel.items()}
+
+
+def refresh_occupancy(hotel_id, date_from, date_to):
+    """ Пересчитывает в таблице ночи отеля из [date_from, date_to) """
+    if hotel_id is None:
+        return
+    nights = compute_occupancy(date_from, date_to, [hotel_id]).get(hotel_id, {})
+    with transaction.atomic():
+        HotelOccupancy.objects.filter(
+            hotel=hotel_id, night__gte=date_from, night__lt=date_to).delete()
+        HotelOccupancy.objects.bulk_create(
+            HotelOccupancy(hotel_id=hotel_id, night=night, guests=guests)
+            for night, guests in nights.items()
+        )
+
+
+def refresh_stay(hotel_id, time_from, time_to):
+    """ Пересчитывает ночи, которые затрагивает одно пребывание """
+    if time_from and time_to:
+        refresh_occupancy(hotel_id, *stay_nights(time_from, time_to))
+
+
+def rebuild_occupancy():
+    """ Полностью пересчитывает таблицу заполненности """
+    bounds = DatelineForHotel.objects.filter(hotel__isnull=False).aggregate(
+        first=Min('time_from'), last=Max('time_to'))
+    with transaction.atomic():
+        HotelOccupancy.objects.all().delete()
+        if bounds['first'] is None:
+            return
+        date_from, _ = stay_nights(bounds['first'], bounds['first'])
+        _, date_to = stay_nights(bounds['last'], bounds['last'])
+        HotelOccupancy.objects.bulk_create(
+            HotelOccupancy(hotel_id=hotel_id, night=night, guests=guests)
+            for hotel_id, nights in compute_occupancy(date_from, date_to).items()
+            for night, guests in nights.items()
+        )
+
+
+class Overbooked(Exception):
+    """ Места в отеле заняли, пока форма сохранялась """
+
+
+def capacity_error(hotel) -> str:
+    return f'В отеле {hotel} нет свободных мест на эти даты'
+
+
+def each_night(time_from, time_to):
+    night, end = stay_nights(time_from, time_to)
+    while night < end:
+        yield night
+        night += ONE_DAY
+
+
+def nights_q(stays) -> Q:
+    """ Условие для таблицы: ночи пребываний в их отелях """
+    conditions = []
+    for stay in stays:
+        first, end = stay_nights(stay.time_from, stay.time_to)
+        conditions.append(Q(hotel=stay.hotel_id, night__gte=first,
+                            night__lt=end))
+    return reduce(or_, conditions)
+
+
+def overbooked(stays, previous=()) -> set:
+    """ Номера пребываний stays, для которых в отеле не хватает мест хотя бы
+    на одну ночь. Пребывания проверяются вместе, так что места, которые они
+    занимают друг у друга, тоже учитываются. previous - прежние (отель,
+    начало, окончание) сохраненных пребываний, которые меняются или
+    удаляются: их места освобождаются. Заполненность берется из таблицы
+    одним запросом на все пребывания """
+    limited = [(i, stay) for i, stay in enumerate(stays)
+               if stay.hotel is not None and stay.hotel.capacity is not None]
+    if not limited:
+        return set()
+
+    guests = defaultdict(int)
+    guests.update(((hotel_id, night), count) for hotel_id, night, count in
+                  HotelOccupancy.objects.filter(nights_q(
+                      stay for _, stay in limited)).values_list(
+                      'hotel', 'night', 'guests'))
+    for hotel_id, time_from, time_to in previous:
+        if hotel_id is not None:
+            for night in each_night(time_from, time_to):
+                guests[hotel_id, night] -= 1
+    for _, stay in limited:
+        for night in each_night(stay.time_from, stay.time_to):
+            guests[stay.hotel_id, night] += 1
+
+    return {i for i, stay in limited
+            if any(guests[stay.hotel_id, night] > stay.hotel.capacity
+                   for night in each_night(stay.time_from, stay.time_to))}
+
+
+def check_capacity(stay):
+    """ Проверка, что для одного пребывания хватает мест в отеле на все
+    ночи. Уже сохраненное пребывание учтено в таблице, его место не считаем """
+    previous = ()
+    if stay.pk is not None:
+        previous = DatelineForHotel.objects.filter(pk=stay.pk).values_list(
+            'hotel', 'time_from', 'time_to')
+    if overbooked([stay], previous):
+        raise ValidationError(capacity_error(stay.hotel))
+
+
+def lock_hotels(hotel_ids):
+    """ Блокирует строки отелей до конца транзакции, чтобы пребывания
+    в одном отеле сохранялись по очереди (в SQLite запись и так
+    идет по очереди, блокировки строк нет) """
+    hotel_ids = sorted({pk for pk in hotel_ids if pk is not None})
+    if hotel_ids:
+        list(Hotel.objects.select_for_update().filter(
+            pk__in=hotel_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def verify_capacity(stays):
+    """ Повторная проверка после сохранения пребываний stays и пересчета
+    таблицы (см. tourists.signals), под блокировкой lock_hotels.
+    Если гостей в какую-то ночь больше, чем мест, - Overbooked """
+    stays = [stay for stay in stays if stay.hotel_id is not None]
+    if stays and HotelOccupancy.objects.filter(
+            nights_q(stays), hotel__capacity__isnull=False,
+            guests__gt=F('hotel__capacity')).exists():
+        hotels = sorted({str(stay.hotel) for stay in stays})
+        raise Overbooked(capacity_error(', '.join(hotels)))
@@ -0,0 +1,59 @@
+""" Проверка пересечений временных промежутков туриста.
+
+Промежутки считаются полуоткрытыми [начало, окончание): два промежутка
+пересекаются, если каждый начинается раньше, чем заканчивается другой.
+Так ловятся и вложенные, и полностью совпадающие промежутки, а стыковка
+"конец одного = начало другого" пересечением не считается """
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+
+
+def overlap_q(time_from, time_to) -> Q:
+    """ Условие для запроса: промежуток в базе пересекается с заданным """
+    return Q(time_from__lt=time_to, time_to__gt=time_from)
+
+
+def intervals_overlap(first, second) -> bool:
+    return first.time_from < second.time_to and second.time_from < first.time_to
+
+
+def find_overlaps(tourist_id, instances: list, models: tuple,
+                  exclude: list = ()) -> set:
+    """ Возвращает номера тех instances, которые пересекаются друг с другом
+    или с уже сохраненными промежутками туриста в таблицах models.
+    Сохраненные версии самих instances и записи из exclude (например,
+    удаляемые в том же формсете) не учитываются.
+    Все таблицы проверяются одним запросом """
+    overlaps = set()
+
+    # Сначала сверим промежутки между собой
+    for i, first in enumerate(instances):
+        for j in range(i + 1, len(instances)):
+            if intervals_overlap(first, instances[j]):
+                overlaps.update((i, j))
+
+    if tourist_id is None or not instances:
+        return overlaps
+
+    skip = {}
+    for obj in list(instances) + list(exclude):
+        if obj.pk is not None:
+            skip.setdefault(type(obj), []).append(obj.pk)
+
+    condition = reduce(or_, (overlap_q(obj.time_from, obj.time_to)
+                             for obj in instances))
+    queries = [
+        model.objects.filter(condition, tourist=tourist_id).exclude(
+            pk__in=skip.get(model, [])
+        ).values_list('time_from', 'time_to')
+        for model in models
+    ]
+    saved = queries[0].union(*queries[1:], all=True)
+
+    for time_from, time_to in saved:
+        for i, obj in enumerate(instances):
+            if obj.time_from < time_to and time_from < obj.time_to:
+                overlaps.add(i)
+    return overlaps
@@ -0,0 +1,256 @@
+""" PDF-документы туриста: распорядок поездки и счет за услуги.
+
+Документ на входе render_pdf - словарь из строк, собранный из базы
+заранее (см. export.pdf_document), поэтому PDF строится без обращения
+к базе и без настроенного Django. Так документы целой группы рисуются
+параллельно в пуле на PDF_WORKERS процессов; шрифты и стили каждый
+процесс регистрирует один раз при запуске.
+
+ReportLab импортируется только при первой отрисовке. Стандартные шрифты
+PDF не содержат кириллицы, поэтому нужны TrueType-шрифты PDF_FONTS
+(обычный и жирный) """
+import io
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+
+
+# Шрифты и число процессов пула, если в настройках не заданы PDF_FONTS и
+# PDF_WORKERS. 0 процессов - рисовать в самом процессе веб-сервера
+FONTS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf',
+)
+WORKERS = 0
+
+# Сколько документов на процесс отдавать пулу наперед
+AHEAD = 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def fonts() -> tuple:
+    return tuple(getattr(settings, 'PDF_FONTS', FONTS))
+
+
+def workers() -> int:
+    return getattr(settings, 'PDF_WORKERS', WORKERS)
+
+
+@lru_cache(maxsize=None)
+def setup(font_files=FONTS) -> dict:
+    """ Регистрирует шрифты и строит стили документов, один раз на процесс.
+    Если файлов шрифтов нет, документ выйдет со стандартной Helvetica """
+    from reportlab.lib import colors
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.platypus import TableStyle
+
+    regular, bold = 'Helvetica', 'Helvetica-Bold'
+    if all(os.path.exists(path) for path in font_files):
+        pdfmetrics.registerFont(TTFont('Document', font_files[0]))
+        pdfmetrics.registerFont(TTFont('Document-Bold', font_files[1]))
+        regular, bold = 'Document', 'Document-Bold'
+
+    sample = getSampleStyleSheet()
+    return {
+        'title': ParagraphStyle('title', sample['Title'], fontName=bold),
+        'heading': ParagraphStyle('heading', sample['Heading3'],
+                                  fontName=bold),
+        'text': ParagraphStyle('text', sample['Normal'], fontName=regular),
+        'cell': ParagraphStyle('cell', sample['Normal'], fontName=regular,
+                               fontSize=9, leading=11),
+        'table': TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), regular),
+            ('FONTNAME', (0, 0), (-1, 0), bold),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#dff0d8')),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ]),
+    }
+
+
+def table(header, rows, style, widths):
+    """ Таблица с заголовком; первый столбец переносится по словам """
+    from reportlab.platypus import Table, Paragraph
+
+    data = [header] + [[Paragraph(escape(row[0]), style['cell'])] +
+                       list(row[1:]) for row in rows]
+    result = Table(data, colWidths=widths, repeatRows=1)
+    result.setStyle(style['table'])
+    return result
+
+
+def heading(document, title, style) -> list:
+    from reportlab.platypus import Paragraph
+
+    story = [Paragraph(escape(f'{title}: {document["tourist"]}'),
+                       style['title'])]
+    if document['group']:
+        story.append(Paragraph(
+            escape(f'Группа {document["group"]}, {document["dates"]}'),
+            style['text']))
+    return story
+
+
+def itinerary(document, style) -> list:
+    """ Распорядок поездки по дням """
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph
+
+    story = heading(document, 'Распорядок поездки', style)
+    if not document['itinerary']:
+        story.append(Paragraph('Занятий не запланировано', style['text']))
+    for day, rows in document['itinerary']:
+        story.append(Paragraph(escape(day), style['heading']))
+        story.append(table(['Занятие', 'Время'], rows, style,
+                           [120 * mm, 50 * mm]))
+    return story
+
+
+def invoice(document, style) -> list:
+    """ Счет за оказанные услуги, как на странице списка услуг """
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, Spacer
+
+    story = heading(document, 'Счет за услуги', style)
+    story.append(Spacer(0, 5 * mm))
+    if document['services']:
+        story.append(table(
+            ['Наименование', 'Начало', 'Окончание', 'Кол-во', 'Цена',
+             'Сумма'],
+            document['services'], style,
+            [55 * mm, 28 * mm, 28 * mm, 18 * mm, 20 * mm, 25 * mm]))
+        story.append(Spacer(0, 5 * mm))
+        story.append(Paragraph(escape(
+            f'Итого: оказано {document["amount"]} услуг на сумму '
+            f'{document["total"]} руб.'), style['heading']))
+    else:
+        story.append(Paragraph('У данного туриста нет оказанных услуг',
+                               style['text']))
+    story.append(Paragraph(escape(f'Данные на {document["created"]}'),
+                           style['text']))
+    return story
+
+
+PARTS = {
+    'itinerary': itinerary,
+    'invoice': invoice,
+}
+
+
+def render_pdf(document, font_files=FONTS) -> bytes:
+    """ PDF из частей document['parts'], каждая с новой страницы """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import mm
+    from reportlab.platypus import SimpleDocTemplate, PageBreak
+
+    style = setup(tuple(font_files))
+    buffer = io.BytesIO()
+    pdf = SimpleDocTemplate(buffer, pagesize=A4, title=document['tourist'],
+                            leftMargin=15 * mm, rightMargin=15 * mm,
+                            topMargin=15 * mm, bottomMargin=15 * mm)
+    story = []
+    for part in document['parts']:
+        if story:
+            story.append(PageBreak())
+        story.extend(PARTS[part](document, style))
+    pdf.build(story)
+    return buffer.getvalue()
+
+
+def pool() -> ProcessPoolExecutor:
+    """ Пул процессов для PDF, создается при первом обращении
+    (spawn - по той же причине, что в overview.rendering) """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                workers(), mp_context=multiprocessing.get_context('spawn'),
+                initializer=setup, initargs=(fonts(),))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def render_all(documents):
+    """ Генератор пар (имя, PDF) по парам (имя, документ) в том же порядке.
+    Пулу отдается не больше AHEAD документов на процесс наперед, поэтому
+    готовые PDF не копятся в памяти, пока их забирают медленно """
+    font_files = fonts()
+    if workers() < 1:
+        for name, document in documents:
+            yield name, render_pdf(document, font_files)
+        return
+
+    window = deque()
+
+    def finished():
+        name, document, future = window.popleft()
+        try:
+            return name, future.result()
+        except BrokenProcessPool:
+            # процесс пула упал: этот документ рисуем здесь же. Другие
+            # документы упавшего пула попадут сюда же, а следующие
+            # документы pool() отдаст новому пулу
+            shutdown_pool()
+            return name, render_pdf(document, font_files)
+
+    for name, document in documents:
+        try:
+            future = pool().submit(render_pdf, document, font_files)
+        except BrokenProcessPool:
+            shutdown_pool()
+            future = pool().submit(render_pdf, document, font_files)
+        window.append((name, document, future))
+        if len(window) >= AHEAD * workers():
+            yield finished()
+    while window:
+        yield finished()
+
+
+class ZipBuffer:
+    """ Файл только для записи, из которого записанное забирается по
+    частям. Без tell и seek zipfile пишет архив последовательно """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self.chunks = b''.join(self.chunks), []
+        return data
+
+
+def zip_stream(files):
+    """ Архив из пар (имя, содержимое), который отдается по мере
+    поступления файлов. PDF уже сжат, поэтому файлы не сжимаются """
+    buffer = ZipBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for name, content in files:
+            archive.writestr(name, content)
+            yield buffer.take()
+    yield buffer.take()
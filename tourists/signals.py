@@ -0,0 +1,141 @@
+from collections import Counter
+
+from django.db.models.signals import (pre_save, post_save, pre_delete,
+                                      post_delete)
+from django.dispatch import receiver
+
+from .models import (Group, Tourist, DatelineForHotel, TimelineForNutrition,
+                     TimelineForExcursion, Hotel, Nutrition, Excursion,
+                     FeedFile)
+from .groups import reset_active_groups
+from .occupancy import refresh_stay
+from .balance import schedule_balance_update
+from .statuses import schedule_status_update, group_tourists
+from .documents import (DOCUMENT_FIELDS, document_names, stored_names,
+                        add_references, release_references)
+
+
+# Справочник цен: временная ось, которая на него ссылается, и поле цены
+PRICES = {
+    Hotel: (DatelineForHotel, 'hotel', 'cost_for_one_day'),
+    Nutrition: (TimelineForNutrition, 'nutrition', 'cost'),
+    Excursion: (TimelineForExcursion, 'excursion', 'cost'),
+}
+
+
+@receiver([post_save, post_delete], sender=Group)
+def group_changed(sender, **kwargs):
+    reset_active_groups()
+
+
+@receiver(pre_save, sender=DatelineForHotel)
+def remember_stay(sender, instance, **kwargs):
+    # Запомним прежние даты, чтобы освободить ночи, которые больше не заняты
+    instance._previous_stay = None
+    if instance.pk is not None:
+        instance._previous_stay = DatelineForHotel.objects.filter(
+            pk=instance.pk).values_list('hotel', 'time_from', 'time_to').first()
+
+
+@receiver(post_save, sender=DatelineForHotel)
+def stay_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_stay', None)
+    if previous is not None:
+        refresh_stay(*previous)
+    refresh_stay(instance.hotel_id, instance.time_from, instance.time_to)
+
+
+@receiver(post_delete, sender=DatelineForHotel)
+def stay_deleted(sender, instance, **kwargs):
+    refresh_stay(instance.hotel_id, instance.time_from, instance.time_to)
+
+
+@receiver([post_save, post_delete], sender=DatelineForHotel)
+@receiver([post_save, post_delete], sender=TimelineForNutrition)
+@receiver([post_save, post_delete], sender=TimelineForExcursion)
+def services_changed(sender, instance, **kwargs):
+    schedule_balance_update([instance.tourist_id])
+    schedule_status_update([instance.tourist_id])
+
+
+@receiver(post_save, sender=Tourist)
+def tourist_saved(sender, instance, **kwargs):
+    # статус зависит от группы туриста
+    schedule_status_update([instance.id])
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_dates_changed(sender, instance, **kwargs):
+    # при удалении туристы остаются без группы, поэтому ищем их заранее
+    schedule_status_update(group_tourists(instance.id))
+
+
+def price_users(sender, instance) -> list:
+    """ Туристы, у которых в услугах есть эта позиция справочника """
+    timeline, relation, _ = PRICES[sender]
+    return list(timeline.objects.filter(**{relation: instance.pk}).values_list(
+        'tourist', flat=True).distinct())
+
+
+@receiver(pre_save, sender=Hotel)
+@receiver(pre_save, sender=Nutrition)
+@receiver(pre_save, sender=Excursion)
+def remember_price(sender, instance, **kwargs):
+    _, _, field = PRICES[sender]
+    instance._previous_price = None
+    if instance.pk is not None:
+        instance._previous_price = sender.objects.filter(
+            pk=instance.pk).values_list(field, flat=True).first()
+
+
+@receiver(post_save, sender=Hotel)
+@receiver(post_save, sender=Nutrition)
+@receiver(post_save, sender=Excursion)
+def price_saved(sender, instance, created, **kwargs):
+    # Новая позиция еще не используется, а переименование на счет не влияет
+    _, _, field = PRICES[sender]
+    if created or getattr(instance, '_previous_price', None) == getattr(
+            instance, field):
+        return
+    schedule_balance_update(price_users(sender, instance))
+
+
+@receiver(pre_delete, sender=Hotel)
+@receiver(pre_delete, sender=Nutrition)
+@receiver(pre_delete, sender=Excursion)
+def price_deleted(sender, instance, **kwargs):
+    # Ссылки на позицию обнуляются при удалении, поэтому туристов
+    # находим заранее, а пересчет все равно пройдет после фиксации
+    schedule_balance_update(price_users(sender, instance))
+
+
+@receiver(pre_save, sender=Tourist)
+@receiver(pre_save, sender=FeedFile)
+def remember_documents(sender, instance, update_fields=None, **kwargs):
+    # Запомним прежние файлы, чтобы снять с них ссылки после сохранения;
+    # None - поля документов не сохраняются
+    instance._previous_documents = None
+    if update_fields is not None and not set(
+            DOCUMENT_FIELDS[sender]) & set(update_fields):
+        return
+    instance._previous_documents = (
+        stored_names(sender, instance.pk) if instance.pk is not None
+        else Counter())
+
+
+@receiver(post_save, sender=Tourist)
+@receiver(post_save, sender=FeedFile)
+def documents_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_previous_documents', None)
+    if previous is None:
+        return
+    current = document_names(instance)
+    add_references(current - previous)
+    release_references(previous - current)
+
+
+@receiver(post_delete, sender=Tourist)
+@receiver(post_delete, sender=FeedFile)
+def documents_deleted(sender, instance, **kwargs):
+    release_references(document_names(instance))
@@ -0,0 +1,133 @@
+""" Сохраненный статус туриста (Tourist.current_status).
+
+Статус зависит от текущего момента, но меняется только на границах:
+в начале и сразу после окончания проживания, питания или экскурсии и в
+полночь после даты прибытия или в день отъезда группы (даты групп
+сравниваются с местной датой). Планировщик (команда update_statuses
+--loop) находит ближайшую границу по временным осям, спит до нее
+и пересчитывает только туристов, у которых граница прошла.
+
+Изменения данных (услуги, группа туриста, даты группы) пересчитывают
+статусы сразу через сигналы, после фиксации транзакции """
+import datetime
+import time
+
+from django.db.models import Min, Q
+from django.utils import timezone
+
+from .models import (Tourist, STATUS_FLAGS, STATUS_CODES,
+                     resolve_status, DatelineForHotel, TimelineForNutrition,
+                     TimelineForExcursion)
+from .deferred import CommitBatch
+
+
+TIMELINES = (DatelineForHotel, TimelineForNutrition, TimelineForExcursion)
+
+# Занятие считается идущим по time_to включительно,
+# поэтому статус меняется чуть позже окончания
+AFTER_END = datetime.timedelta(seconds=1)
+
+CHUNK_SIZE = 500
+
+# Дольше не спим: изменения данных могли добавить более раннюю границу
+MAX_SLEEP = 60
+
+
+def next_midnight(moment):
+    day = timezone.localdate(moment) + datetime.timedelta(days=1)
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def next_boundary(after):
+    """ Ближайший момент после after, когда у кого-то может смениться статус """
+    candidates = [next_midnight(after)]
+    for model in TIMELINES:
+        # отдельными запросами, чтобы каждый шел по своему индексу
+        start = model.objects.filter(time_from__gt=after).aggregate(
+            start=Min('time_from'))['start']
+        end = model.objects.filter(time_to__gte=after).aggregate(
+            end=Min('time_to'))['end']
+        if start is not None:
+            candidates.append(start)
+        if end is not None:
+            candidates.append(end + AFTER_END)
+    return min(candidates)
+
+
+def crossed(since, until) -> set:
+    """ id туристов, у которых между since и until прошла граница """
+    tourist_ids = set()
+    for model in TIMELINES:
+        tourist_ids.update(model.objects.filter(
+            Q(time_from__gt=since, time_from__lte=until) |
+            Q(time_to__gte=since - AFTER_END, time_to__lte=until)
+        ).values_list('tourist', flat=True).distinct())
+
+    first, last = timezone.localdate(since), timezone.localdate(until)
+    if first != last:
+        # в полночь меняются "ожидается приезд" и "уехал"
+        days = (first - datetime.timedelta(days=1), last)
+        tourist_ids.update(Tourist.objects.filter(
+            Q(group__date_of_arrival__range=days) |
+            Q(group__date_of_departure__range=days)
+        ).values_list('id', flat=True))
+    return tourist_ids
+
+
+def refresh_statuses(tourist_ids=None, now=None) -> int:
+    """ Пересчитывает сохраненные статусы туристов (по умолчанию всех)
+    на момент now. Записываются только изменившиеся; возвращает их число """
+    now = now or timezone.now()
+    tourists = Tourist.objects.all()
+    if tourist_ids is not None:
+        tourist_ids = list(tourist_ids)
+
+    def chunks():
+        if tourist_ids is None:
+            yield tourists
+            return
+        for start in range(0, len(tourist_ids), CHUNK_SIZE):
+            yield tourists.filter(id__in=tourist_ids[start:start + CHUNK_SIZE])
+
+    changed = {}
+    for chunk in chunks():
+        rows = chunk.with_status(now).values_list(
+            'id', 'current_status', *STATUS_FLAGS)
+        for tourist_id, stored, *flags in rows.iterator():
+            code = STATUS_CODES[resolve_status(*flags)]
+            if code != stored:
+                changed.setdefault(code, []).append(tourist_id)
+
+    for code, ids in changed.items():
+        for start in range(0, len(ids), CHUNK_SIZE):
+            Tourist.objects.filter(
+                id__in=ids[start:start + CHUNK_SIZE]).update(current_status=code)
+    return sum(len(ids) for ids in changed.values())
+
+
+# Отмечает туристов для пересчета статуса после фиксации транзакции
+schedule_status_update = CommitBatch(refresh_statuses).add
+
+
+def group_tourists(group_id) -> list:
+    return list(Tourist.objects.filter(group=group_id).values_list(
+        'id', flat=True))
+
+
+def run_scheduler(max_sleep=MAX_SLEEP, log=None):
+    """ Бесконечный цикл планировщика: полный пересчет при запуске,
+    затем пересчет туристов, у которых прошла очередная граница """
+    last = timezone.now()
+    changed = refresh_statuses(now=last)
+    if log:
+        log(f'{last:%Y-%m-%d %H:%M:%S}: статусов изменено {changed}')
+    while True:
+        boundary = next_boundary(last)
+        now = timezone.now()
+        if boundary > now:
+            time.sleep(min((boundary - now).total_seconds(), max_sleep))
+            continue
+        changed = refresh_statuses(crossed(last, now), now)
+        last = now
+        if log:
+            log(f'{now:%Y-%m-%d %H:%M:%S}: статусов изменено {changed}')
@@ -0,0 +1,64 @@
+""" Хранилище документов туристов с дедупликацией по содержимому.
+
+Загружаемый файл по частям пишется во временный файл и одновременно
+хешируется, затем переименовывается в blobs/ab/cd/<sha256><расширение>.
+Одинаковые файлы (например, общая страховка группы) получают одно и то
+же имя и лежат на диске один раз; имя, предложенное upload_to, не
+используется.
+
+Хранилище само файлы не удаляет: на один файл могут ссылаться многие
+записи. Ссылки считаются в StoredFile (см. tourists.documents) """
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+BLOB_DIR = 'blobs'
+
+# Расширение сохраняется, чтобы по имени определялся тип файла
+MAX_EXTENSION = 10
+
+
+def blob_name(digest: str, name: str) -> str:
+    extension = os.path.splitext(name)[1].lower()
+    if len(extension) > MAX_EXTENSION or not extension[1:].isalnum():
+        extension = ''
+    return f'{BLOB_DIR}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+@deconstructible
+class DedupStorage(FileSystemStorage):
+
+    def get_available_name(self, name, max_length=None):
+        # Имя все равно заменяется хешем содержимого в _save
+        return name
+
+    def _save(self, name, content):
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        digest = hashlib.sha256()
+        handle, temporary = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(handle, 'wb') as file:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    file.write(chunk)
+            name = blob_name(digest.hexdigest(), name)
+            full_path = self.path(name)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # Если такое содержимое уже есть, файл заменяется тем же самым:
+            # так он точно на месте, даже если его как раз удаляют
+            os.replace(temporary, full_path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+        return name
+
+
+document_storage = DedupStorage()
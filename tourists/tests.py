@@ -1,3 +1,1008 @@
-from django.test import TestCase
+import datetime
+import io
+import os
+import re
+import tempfile
+import time
+import zipfile
+from decimal import Decimal
+from unittest import skipUnless, mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from overview.timeline import build_timeline
+from overview.views import CRM
+from tourists.models import (Group, Tourist, Hotel, Nutrition, Excursion,
+                             DatelineForHotel, TimelineForNutrition,
+                             TimelineForExcursion, FeedFile, StoredFile,
+                             HotelOccupancy, TouristBalance, Event)
+from tourists.balance import rebuild_balances, verify_balances
+from tourists.billing import (group_invoices, collect_invoices,
+                              tourist_invoice)
+from tourists.events import make_event_key, resolve_events
+from tourists.generate import generate_data
+from tourists.export import invoice_rows, pdf_documents
+from tourists import pdf
+from tourists.groups import active_groups, reset_active_groups, move_tourists
+from tourists.occupancy import (check_capacity, refresh_occupancy,
+                                rebuild_occupancy)
+from tourists.overlaps import find_overlaps
+from tourists.statuses import next_boundary, crossed
+
+
+# Префиксы инлайнов формы туриста в админке
+TOURIST_INLINES = ('timelinefornutrition_set', 'timelineforexcursion_set',
+                   'datelineforhotel_set', 'feedfile_set')
+
+# Шаг плана "SCAN таблица" означает полный перебор таблицы,
+# в том числе по индексу ("SCAN таблица USING INDEX ...")
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN есть только в SQLite')
+class QueryPlanTests(TestCase):
+    """ Горячие запросы должны находить строки по индексам,
+    а не перебирать таблицы целиком """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now().replace(microsecond=0)
+        hour = datetime.timedelta(hours=1)
+        cls.group = Group.objects.create(
+            group_name='Первая', status='c',
+            date_of_arrival=cls.now.date() - datetime.timedelta(days=1),
+            date_of_departure=cls.now.date() + datetime.timedelta(days=5))
+        hotel = Hotel.objects.create(
+            name='Отель', addres='Адрес', phone='1', cost_for_one_day=1000,
+            check_in=datetime.time(14), check_out=datetime.time(12),
+            capacity=10)
+        nutrition = Nutrition.objects.create(name='Обед', cost=300)
+        excursion = Excursion.objects.create(name='Музей', cost=500)
+        for number in range(3):
+            tourist = Tourist.objects.create(name=f'Турист {number}',
+                                             phone='1', group=cls.group)
+            DatelineForHotel.objects.create(
+                tourist=tourist, hotel=hotel,
+                time_from=cls.now - hour, time_to=cls.now + 48 * hour)
+            TimelineForNutrition.objects.create(
+                tourist=tourist, nutrition=nutrition,
+                time_from=cls.now + hour, time_to=cls.now + 2 * hour)
+            TimelineForExcursion.objects.create(
+                tourist=tourist, excursion=excursion,
+                time_from=cls.now + 3 * hour, time_to=cls.now + 5 * hour)
+        cls.tourist = tourist
+        cls.hotel = hotel
+
+    def full_scans(self, sql) -> list:
+        tables = set(connection.introspection.table_names())
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            plan = [row[-1] for row in cursor.fetchall()]
+        return [step for step in plan
+                if FULL_SCAN.match(step) and
+                FULL_SCAN.match(step).group(1) in tables]
+
+    def assertNoFullScan(self, run):
+        """ Выполняет run и проверяет планы всех выполненных им SELECT """
+        with CaptureQueriesContext(connection) as context:
+            run()
+        selects = [query['sql'] for query in context.captured_queries
+                   if query['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects, 'Не выполнено ни одного запроса')
+        for sql in selects:
+            scans = self.full_scans(sql)
+            self.assertFalse(scans, f'Полный перебор {scans} в запросе:\n{sql}')
+
+    def test_status_of_group_tourists(self):
+        self.assertNoFullScan(lambda: list(
+            Tourist.objects.filter(group=self.group).with_status(self.now)))
+
+    def test_tourist_status(self):
+        tourist = Tourist.objects.get(pk=self.tourist.pk)
+        self.assertNoFullScan(lambda: tourist.status)
+
+    def test_active_groups(self):
+        reset_active_groups()
+        self.assertNoFullScan(active_groups)
+
+    @override_settings(GANTT_MODE='tourist')
+    def test_crm_context(self):
+        self.assertNoFullScan(lambda: CRM().get_context_data())
+
+    def test_group_invoices(self):
+        self.assertNoFullScan(lambda: group_invoices(self.group))
+
+    def test_invoices_in_window(self):
+        self.assertNoFullScan(lambda: collect_invoices(
+            [self.tourist], self.now, self.now + datetime.timedelta(days=1)))
+
+    def test_export_in_window(self):
+        self.assertNoFullScan(lambda: list(invoice_rows(
+            date_from=self.now.date(), date_to=self.now.date())))
+
+    def test_timeline_window(self):
+        self.assertNoFullScan(lambda: build_timeline(
+            date_from=self.now, date_to=self.now + datetime.timedelta(days=1)))
+
+    def test_timeline_of_group(self):
+        self.assertNoFullScan(lambda: build_timeline(group=self.group))
+
+    def test_overlaps(self):
+        excursion = TimelineForExcursion(
+            tourist=self.tourist, time_from=self.now,
+            time_to=self.now + datetime.timedelta(hours=4))
+        self.assertNoFullScan(lambda: find_overlaps(
+            self.tourist.id, [excursion],
+            TimelineForExcursion.overlapping_models()))
+
+    def test_resolve_events(self):
+        nutrition = TimelineForNutrition(
+            tourist=self.tourist, nutrition=Nutrition.objects.first(),
+            time_from=self.now + datetime.timedelta(days=1),
+            time_to=self.now + datetime.timedelta(days=1, hours=1))
+        self.assertNoFullScan(lambda: resolve_events([nutrition]))
+
+    def test_hotel_capacity(self):
+        stay = DatelineForHotel.objects.filter(hotel=self.hotel).first()
+        self.assertNoFullScan(lambda: check_capacity(stay))
+
+    def test_next_status_boundary(self):
+        self.assertNoFullScan(lambda: next_boundary(self.now))
+
+    def test_crossed_status_boundary(self):
+        self.assertNoFullScan(lambda: crossed(
+            self.now, self.now + datetime.timedelta(minutes=5)))
+
+    def test_refresh_occupancy(self):
+        self.assertNoFullScan(lambda: refresh_occupancy(
+            self.hotel.id, self.now.date(),
+            self.now.date() + datetime.timedelta(days=3)))
+
+
+# Бюджеты страниц: (наибольшее число запросов, секунд на отрисовку).
+# Число запросов не должно зависеть от объема данных; время проверяется
+# с запасом. Для другой машины бюджеты переопределяются настройкой
+# PAGE_BUDGETS = {'страница': (запросов, секунд)}
+PAGE_BUDGETS = {
+    'tourist_changelist': (6, 2.0),
+    'tourist_change': (17, 2.0),
+    'tourist_services': (4, 1.0),
+    'group_changelist': (7, 1.0),
+    'group_change': (7, 2.0),
+    'event_changelist': (5, 1.0),
+    'event_change': (8, 1.0),
+    'crm': (5, 1.0),
+}
+
+
+def page_budget(page) -> tuple:
+    return getattr(settings, 'PAGE_BUDGETS', {}).get(page, PAGE_BUDGETS[page])
+
+
+@override_settings(GANTT_MODE='tourist')
+class PageBudgetTests(TestCase):
+    """ Страницы админки и CRM на сезоне из 50 групп и 1000 туристов
+    по 20 записей временных осей укладываются в бюджет запросов и времени """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(groups=50, tourists=20, days=7, seed=0)
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+        cls.tourist = Tourist.objects.filter(group__status='c').first()
+        cls.event = cls.tourist.timelinefornutrition_set.first().event
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def assertWithinBudget(self, page, url):
+        queries, seconds = page_budget(page)
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(context.captured_queries), queries,
+            f'{page}: запросов {len(context.captured_queries)}, '
+            f'бюджет {queries}')
+        self.assertLessEqual(elapsed, seconds,
+                             f'{page}: {elapsed:.2f} с, бюджет {seconds} с')
+
+    def test_tourist_changelist(self):
+        self.assertWithinBudget('tourist_changelist',
+                                reverse('admin:tourists_tourist_changelist'))
+
+    def test_tourist_change(self):
+        self.assertWithinBudget('tourist_change', reverse(
+            'admin:tourists_tourist_change', args=[self.tourist.pk]))
+
+    def test_tourist_services(self):
+        self.assertWithinBudget('tourist_services', reverse(
+            'admin:show-list-services', args=[self.tourist.pk]))
+
+    def test_group_changelist(self):
+        self.assertWithinBudget('group_changelist',
+                                reverse('admin:tourists_group_changelist'))
+
+    def test_group_change(self):
+        self.assertWithinBudget('group_change', reverse(
+            'admin:tourists_group_change', args=[self.tourist.group_id]))
+
+    def test_event_changelist(self):
+        self.assertWithinBudget('event_changelist',
+                                reverse('admin:tourists_event_changelist'))
+
+    def test_event_change(self):
+        self.assertWithinBudget('event_change', reverse(
+            'admin:tourists_event_change', args=[self.event.pk]))
+
+    def test_crm(self):
+        # Диаграммы туристов кэшируются, первая отрисовка их заполняет;
+        # бюджет задан для страницы с заполненным кэшем
+        self.client.get(reverse('crm_url'))
+        self.assertWithinBudget('crm', reverse('crm_url'))
+
+
+@override_settings(PDF_WORKERS=0)
+class PdfExportTests(TestCase):
+    """ Документы туристов в PDF: по одному и архивом на группы """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(groups=2, tourists=3, days=3, seed=0)
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_tourist_documents(self):
+        tourist = Tourist.objects.first()
+        for name in ('tourist-invoice-pdf', 'tourist-itinerary-pdf'):
+            response = self.client.get(reverse(f'admin:{name}',
+                                               args=[tourist.pk]))
+            self.assertEqual(response['Content-Type'], 'application/pdf')
+            self.assertTrue(response.content.startswith(b'%PDF'))
+
+    def test_group_archive(self):
+        groups = list(Group.objects.values_list('pk', flat=True))
+        response = self.client.post(
+            reverse('admin:tourists_group_changelist'),
+            {'action': 'export_documents_pdf', '_selected_action': groups})
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        names = archive.namelist()
+        self.assertEqual(len(names), Tourist.objects.count())
+        self.assertEqual(len({name.split('/')[0] for name in names}), 2)
+        self.assertTrue(archive.read(names[0]).startswith(b'%PDF'))
+
+    @override_settings(PDF_WORKERS=1)
+    def test_group_archive_in_pool(self):
+        pdf.shutdown_pool()
+        self.addCleanup(stop_pdf_pool)
+        groups = list(Group.objects.values_list('pk', flat=True))
+        response = self.client.post(
+            reverse('admin:tourists_group_changelist'),
+            {'action': 'export_documents_pdf', '_selected_action': groups})
+        archive = zipfile.ZipFile(
+            io.BytesIO(b''.join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.namelist(),
+                         [name for name, _ in pdf_documents(groups)])
+        # шрифты зарегистрированы в процессе пула
+        self.assertIn(b'DejaVuSans', archive.read(archive.namelist()[0]))
+
+
+def stop_pdf_pool():
+    """ Останавливает пул PDF и дожидается его процессов """
+    running = pdf._pool
+    pdf.shutdown_pool()
+    if running is not None:
+        running.shutdown(wait=True)
+
+
+@override_settings(PDF_WORKERS=1)
+class PdfPoolTests(SimpleTestCase):
+    """ Отрисовка PDF в пуле процессов: порядок документов и окно
+    из AHEAD документов на процесс """
+
+    def setUp(self):
+        pdf.shutdown_pool()
+        self.addCleanup(stop_pdf_pool)
+        self.taken = []
+
+    def documents(self, count):
+        for number in range(count):
+            self.taken.append(number)
+            yield f'{number}.pdf', {'tourist': f'Tourist {number}',
+                                    'parts': ()}
+
+    def test_order_and_window(self):
+        files = pdf.render_all(self.documents(6))
+        name, content = next(files)
+        self.assertEqual(name, '0.pdf')
+        # пока первый PDF не забран, пулу отдано не больше окна
+        self.assertEqual(len(self.taken), pdf.AHEAD)
+        executor = pdf._pool
+        files = [(name, content)] + list(files)
+        self.assertEqual([name for name, _ in files],
+                         [f'{number}.pdf' for number in range(6)])
+        for number, (_, content) in enumerate(files):
+            self.assertIn(f'/Title (Tourist {number})'.encode(), content)
+        # процесс пула не падал: пул тот же
+        self.assertIs(pdf._pool, executor)
+
+
+@mock.patch('tourists.documents.GRACE_SECONDS', 0)
+class DocumentStorageTests(TransactionTestCase):
+    """ Одинаковые документы хранятся один раз и удаляются вместе с
+    последней ссылкой на них (после фиксации транзакции) """
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, name, content=b'%PDF-1.4 insurance'):
+        return SimpleUploadedFile(name, content)
+
+    def test_shared_file(self):
+        first = Tourist.objects.create(name='Первый', phone='1',
+                                       insurance=self.upload('a.pdf'))
+        second = Tourist.objects.create(name='Второй', phone='2',
+                                        insurance=self.upload('b.pdf'))
+        FeedFile.objects.create(feed=second, file=self.upload('c.pdf'))
+        name = first.insurance.name
+        self.assertEqual(second.insurance.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).references, 3)
+
+        second.delete()
+        self.assertEqual(StoredFile.objects.get(name=name).references, 1)
+        self.assertTrue(os.path.exists(first.insurance.path))
+
+        path = first.insurance.path
+        first.delete()
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_replaced_file(self):
+        tourist = Tourist.objects.create(name='Турист', phone='1',
+                                         visa=self.upload('visa.jpg', b'old'))
+        old = tourist.visa.path
+        tourist.visa = self.upload('visa.jpg', b'new')
+        tourist.save()
+        self.assertFalse(os.path.exists(old))
+        self.assertEqual(
+            list(StoredFile.objects.values_list('name', 'references')),
+            [(tourist.visa.name, 1)])
+
+
+class MediaTests(TestCase):
+    """ Загруженные файлы: только сотрудникам, с поддержкой Range
+    и передачей файла фронтенд-серверу """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        os.makedirs(os.path.join(media.name, 'files'))
+        self.content = bytes(range(256)) * 4
+        with open(os.path.join(media.name, 'files', 'scan.pdf'), 'wb') as file:
+            file.write(self.content)
+        self.url = reverse('media', args=['files/scan.pdf'])
+        self.client.force_login(self.user)
+
+    def test_staff_only(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_outside_media_root(self):
+        response = self.client.get(reverse('media', args=['../manage.py']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_whole_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_ranges(self):
+        for header, part in (('bytes=10-19', self.content[10:20]),
+                             ('bytes=1000-', self.content[1000:]),
+                             ('bytes=-5', self.content[-5:])):
+            response = self.client.get(self.url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(int(response['Content-Length']), len(part))
+            self.assertEqual(b''.join(response.streaming_content), part)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_invalid_range(self):
+        # конец раньше начала: заголовок не учитывается
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+
+    def test_empty_file(self):
+        open(os.path.join(settings.MEDIA_ROOT, 'files', 'empty.pdf'),
+             'wb').close()
+        url = reverse('media', args=['files/empty.pdf'])
+        for header in ('bytes=-5', 'bytes=0-'):
+            response = self.client.get(url, HTTP_RANGE=header)
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response['Content-Range'], 'bytes */0')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_front_end_transfer(self):
+        with self.settings(MEDIA_SENDFILE_BACKEND='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/files/scan.pdf')
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_SENDFILE_BACKEND='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertTrue(response['X-Sendfile'].endswith('/files/scan.pdf'))
+
+
+class TimelineVersionTests(TestCase):
+    """ Условный GET расписания: после перемещения туристов в другую
+    группу (одним UPDATE, без сигналов) ответ 304 не отдается,
+    анониму не отдается ни 304, ни расписание """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(groups=2, tourists=2, days=2, seed=0)
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+
+    def setUp(self):
+        reset_active_groups()
+        self.client.force_login(self.user)
+
+    def test_group_move(self):
+        target, _ = active_groups()[0]
+        tourist = Tourist.objects.exclude(group=target).first()
+        url = reverse('timeline_json') + f'?group={target}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.client.post(reverse('admin:tourists_tourist_changelist'), {
+            'action': f'assign_to_user_{target}',
+            '_selected_action': [tourist.pk]})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(tourist.pk, response.json()['tourist'])
+
+    def test_anonymous(self):
+        url = reverse('timeline_json') + '?group=1'
+        etag = self.client.get(url)['ETag']
+        self.client.logout()
+        for headers in ({}, {'HTTP_IF_NONE_MATCH': etag}):
+            response = self.client.get(url, **headers)
+            self.assertEqual(response.status_code, 302)
+            self.assertNotIn('ETag', response)
+
+
+class GenerateDataTests(TestCase):
+    """ Повторный запуск генератора данных """
+
+    def test_references_reused(self):
+        generate_data(groups=1, tourists=1, days=2, seed=0)
+        counts = [model.objects.count()
+                  for model in (Hotel, Nutrition, Excursion)]
+        generate_data(groups=1, tourists=1, days=2, seed=1)
+        self.assertEqual([model.objects.count()
+                          for model in (Hotel, Nutrition, Excursion)], counts)
+        self.assertEqual(Tourist.objects.count(), 2)
+
+
+class BalanceTests(TestCase):
+    """ Сверка сохраненных счетов с расчетом по услугам """
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_data(groups=1, tourists=2, days=2, seed=0)
+        rebuild_balances()
+
+    def test_new_tourist(self):
+        # у туриста без услуг счета еще нет, это не расхождение
+        Tourist.objects.create(name='Новый', phone='1')
+        self.assertEqual(verify_balances(), [])
+
+    def test_missing_balance(self):
+        tourist = Tourist.objects.filter(balance__total__gt=0).first()
+        tourist.balance.delete()
+        [(mismatch, stored, live)] = verify_balances()
+        self.assertEqual((mismatch, stored), (tourist, 0))
+        self.assertGreater(live, 0)
+
+
+class BalanceSignalTests(TransactionTestCase):
+    """ Сохраненный счет пересчитывается после фиксации изменений услуг
+    и цен и совпадает с расчетом по услугам """
+
+    def setUp(self):
+        self.start = timezone.make_aware(datetime.datetime(2026, 5, 10, 14))
+        self.hotel = Hotel.objects.create(
+            name='Отель', addres='Адрес', phone='1', cost_for_one_day=1000,
+            check_in=datetime.time(14), check_out=datetime.time(12))
+        self.lunch = Nutrition.objects.create(name='Обед', cost=300)
+        self.museum = Excursion.objects.create(name='Музей', cost=500)
+        self.tourist = Tourist.objects.create(name='Турист', phone='1')
+        DatelineForHotel.objects.create(
+            tourist=self.tourist, hotel=self.hotel, time_from=self.start,
+            time_to=self.start + datetime.timedelta(days=2))
+
+    def assertBalance(self, total):
+        balance = TouristBalance.objects.get(tourist=self.tourist)
+        self.assertEqual(balance.total, tourist_invoice(self.tourist)['total'])
+        self.assertEqual(balance.total, total)
+        self.assertEqual(verify_balances(), [])
+
+    def add_lunch(self):
+        return TimelineForNutrition.objects.create(
+            tourist=self.tourist, nutrition=self.lunch,
+            time_from=self.start + datetime.timedelta(hours=5),
+            time_to=self.start + datetime.timedelta(hours=6))
+
+    def test_timeline_rows(self):
+        self.assertBalance(2000)
+        meal = self.add_lunch()
+        self.assertBalance(2300)
+        meal.nutrition = None
+        meal.save()
+        self.assertBalance(2000)
+        meal.delete()
+        self.assertBalance(2000)
+        TimelineForExcursion.objects.create(
+            tourist=self.tourist, excursion=self.museum,
+            time_from=self.start + datetime.timedelta(days=1),
+            time_to=self.start + datetime.timedelta(days=1, hours=3))
+        self.assertBalance(2500)
+
+    def test_price_change(self):
+        self.add_lunch()
+        self.lunch.cost = 400
+        self.lunch.save()
+        self.assertBalance(2400)
+        self.hotel.cost_for_one_day = 1500
+        self.hotel.save()
+        self.assertBalance(3400)
+
+    def test_price_deleted(self):
+        self.add_lunch()
+        self.lunch.delete()
+        self.assertBalance(2000)
+        self.hotel.delete()
+        self.assertBalance(0)
+
+
+class GroupMoveTests(TransactionTestCase):
+    """ Перемещение туристов одним UPDATE пересчитывает их статусы
+    после фиксации транзакции """
+
+    def test_status_after_move(self):
+        today = timezone.localdate()
+        current = Group.objects.create(
+            group_name='Прибыла',
+            date_of_arrival=today - datetime.timedelta(days=1),
+            date_of_departure=today + datetime.timedelta(days=3))
+        future = Group.objects.create(
+            group_name='Формируется',
+            date_of_arrival=today + datetime.timedelta(days=10),
+            date_of_departure=today + datetime.timedelta(days=13))
+        tourist = Tourist.objects.create(name='Турист', phone='1',
+                                         group=current)
+        tourist.refresh_from_db()
+        self.assertEqual(tourist.current_status, 'no_hotel')
+
+        moved = move_tourists(Tourist.objects.filter(group=current),
+                              future.pk)
+        self.assertEqual(moved, 1)
+        tourist.refresh_from_db()
+        self.assertEqual(tourist.current_status, 'await')
+
+
+class GroupActionTests(TestCase):
+    """ Действие "Переместить в группу" в списке туристов """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+        cls.source = Group.objects.create(group_name='Прибыла', status='c')
+        cls.target = Group.objects.create(group_name='Формируется',
+                                          status='f')
+        cls.tourists = [
+            Tourist.objects.create(name=name, phone=phone, group=cls.source)
+            for name, phone in (('Первый', '1'), ('Второй', '2'),
+                                ('Третий', '3'))]
+
+    def setUp(self):
+        reset_active_groups()
+        self.addCleanup(reset_active_groups)
+        self.client.force_login(self.user)
+
+    def move(self, group, tourists):
+        response = self.client.post(
+            reverse('admin:tourists_tourist_changelist'), {
+                'action': f'assign_to_user_{group.pk}',
+                '_selected_action': [tourist.pk for tourist in tourists]},
+            follow=True)
+        self.assertEqual(response.status_code, 200)
+        return [str(message) for message in response.context['messages']]
+
+    def groups(self) -> list:
+        for tourist in self.tourists:
+            tourist.refresh_from_db()
+        return [tourist.group_id for tourist in self.tourists]
+
+    def test_move(self):
+        messages = self.move(self.target, self.tourists[:2])
+        self.assertEqual(messages,
+                         [f'Перемещено туристов в {self.target.group_name}: 2'])
+        self.assertEqual(self.groups(),
+                         [self.target.pk, self.target.pk, self.source.pk])
+
+    def test_departed_group(self):
+        active_groups()
+        # группа уехала, а список действий остался в кэше
+        Group.objects.filter(pk=self.target.pk).update(status='g')
+        messages = self.move(self.target, self.tourists[:2])
+        self.assertEqual(
+            messages, ['Группа уже уехала или удалена. Туристы не перемещены'])
+        self.assertEqual(self.groups(), [self.source.pk] * 3)
+        self.assertNotIn(self.target.pk, dict(active_groups()))
+
+
+class BillingTests(TestCase):
+    """ Суммы счета туриста по видам услуг """
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.make_aware(datetime.datetime(2026, 5, 10, 14))
+        day, hour = datetime.timedelta(days=1), datetime.timedelta(hours=1)
+        cls.group = Group.objects.create(
+            group_name='Группа', date_of_arrival=start.date(),
+            date_of_departure=start.date() + 6 * day)
+        hotel = Hotel.objects.create(
+            name='Отель', addres='Адрес', phone='1', cost_for_one_day=1000,
+            check_in=datetime.time(14), check_out=datetime.time(12))
+        hostel = Hotel.objects.create(
+            name='Хостел', addres='Адрес', phone='2', cost_for_one_day=700,
+            check_in=datetime.time(10), check_out=datetime.time(12))
+        lunch = Nutrition.objects.create(name='Обед', cost=300)
+        museum = Excursion.objects.create(name='Музей', cost=500)
+
+        cls.tourist = Tourist.objects.create(name='Турист', phone='1',
+                                             group=cls.group)
+        # три ночи и заселение с выселением в один день - одна ночь
+        DatelineForHotel.objects.create(
+            tourist=cls.tourist, hotel=hotel,
+            time_from=start, time_to=start + 3 * day)
+        DatelineForHotel.objects.create(
+            tourist=cls.tourist, hotel=hostel,
+            time_from=start + 4 * day - 4 * hour,
+            time_to=start + 4 * day - 2 * hour)
+        for number in range(2):
+            TimelineForNutrition.objects.create(
+                tourist=cls.tourist, nutrition=lunch,
+                time_from=start + number * day - 2 * hour,
+                time_to=start + number * day - hour)
+        # позиция справочника удалена: услуга есть, но без цены
+        TimelineForNutrition.objects.create(
+            tourist=cls.tourist, nutrition=None,
+            time_from=start + 2 * day - 2 * hour,
+            time_to=start + 2 * day - hour)
+        TimelineForExcursion.objects.create(
+            tourist=cls.tourist, excursion=museum,
+            time_from=start + day, time_to=start + day + 3 * hour)
+
+        other = Tourist.objects.create(name='Другой', phone='2',
+                                       group=cls.group)
+        TimelineForExcursion.objects.create(
+            tourist=other, excursion=museum,
+            time_from=start + day, time_to=start + day + 3 * hour)
+
+    def figures(self, invoice) -> tuple:
+        return (invoice['amount'], invoice['total_of_hotel'],
+                invoice['total_of_nutrition'], invoice['total_of_excursion'],
+                invoice['total'])
+
+    def test_tourist_invoice(self):
+        invoice = tourist_invoice(self.tourist)
+        self.assertEqual(self.figures(invoice), (
+            6, Decimal(3700), Decimal(600), Decimal(500), Decimal(4800)))
+        self.assertEqual(len(invoice['list_of_services']), 6)
+
+    def test_hotel_nights(self):
+        stays = [service['num'] for service in
+                 tourist_invoice(self.tourist)['list_of_services']
+                 if service['kind'] == 'hotel']
+        self.assertEqual(stays, [datetime.timedelta(days=3),
+                                 datetime.timedelta(days=1)])
+
+    def test_group_invoices(self):
+        invoices = group_invoices(self.group)
+        self.assertEqual([invoice['tourist'] for invoice in invoices],
+                         list(Tourist.objects.order_by('name')))
+        for invoice in invoices:
+            self.assertEqual(self.figures(invoice),
+                             self.figures(tourist_invoice(invoice['tourist'])))
+
+
+def change_form_data(tourist, rows: dict) -> dict:
+    """ Данные формы туриста в админке. rows - строки инлайнов по
+    префиксам: (поле справочника, позиция, начало, окончание, id или None) """
+    data = {'name': tourist.name, 'phone': tourist.phone}
+    for prefix in TOURIST_INLINES:
+        data.update({f'{prefix}-TOTAL_FORMS': 0, f'{prefix}-INITIAL_FORMS': 0})
+    for prefix, prefix_rows in rows.items():
+        # сохраненные строки идут в формсете первыми
+        for number, (field, item, time_from, time_to, pk) in enumerate(
+                sorted(prefix_rows, key=lambda row: row[-1] is None)):
+            row = f'{prefix}-{number}-'
+            data.update({row + 'id': pk or '', row + field: item.pk,
+                         row + 'tourist': tourist.pk})
+            for name, moment in (('time_from', time_from),
+                                 ('time_to', time_to)):
+                moment = timezone.localtime(moment)
+                data[f'{row}{name}_0'] = moment.strftime('%d.%m.%Y')
+                data[f'{row}{name}_1'] = moment.strftime('%H:%M')
+        data[f'{prefix}-TOTAL_FORMS'] = len(prefix_rows)
+        data[f'{prefix}-INITIAL_FORMS'] = sum(1 for row in prefix_rows
+                                              if row[-1] is not None)
+    return data
+
+
+class TimelineOverlapAdminTests(TestCase):
+    """ Пересечения занятий в форме туриста: промежутки полуоткрытые,
+    строки питания и экскурсий сверяются между собой по введенным
+    значениям """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+        cls.tourist = Tourist.objects.create(name='Турист', phone='1')
+        cls.lunch = Nutrition.objects.create(name='Обед', cost=300)
+        cls.museum = Excursion.objects.create(name='Музей', cost=500)
+        cls.day = timezone.make_aware(datetime.datetime.combine(
+            timezone.localdate() + datetime.timedelta(days=1),
+            datetime.time.min))
+        cls.visit = TimelineForExcursion.objects.create(
+            tourist=cls.tourist, excursion=cls.museum,
+            time_from=cls.at(10), time_to=cls.at(12))
+
+    @classmethod
+    def at(cls, hour):
+        return cls.day + datetime.timedelta(hours=hour)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def save(self, nutrition=(), excursion=()):
+        """ Отправляет форму туриста с новыми строками питания (часы начала
+        и окончания) и строками экскурсий {id или None: (начало, окончание)} """
+        rows = {
+            'timelineforexcursion_set': [
+                ('excursion', self.museum, self.at(first), self.at(last), pk)
+                for pk, (first, last) in dict(excursion).items()],
+            'timelinefornutrition_set': [
+                ('nutrition', self.lunch, self.at(first), self.at(last), None)
+                for first, last in nutrition],
+        }
+        return self.client.post(
+            reverse('admin:tourists_tourist_change', args=[self.tourist.pk]),
+            change_form_data(self.tourist, rows))
+
+    def assertBusy(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, TimelineForNutrition.busy_error)
+        self.assertFalse(TimelineForNutrition.objects.exists())
+
+    def test_enclosing(self):
+        self.assertBusy(self.save(nutrition=[(9, 13)]))
+
+    def test_identical(self):
+        self.assertBusy(self.save(nutrition=[(10, 12)]))
+
+    def test_adjacent(self):
+        response = self.save(nutrition=[(8, 10), (12, 13)])
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TimelineForNutrition.objects.count(), 2)
+
+    def test_rows_of_both_inlines(self):
+        # новые обед и экскурсия в одно время в одной отправке формы
+        self.assertBusy(self.save(nutrition=[(14, 15)],
+                                  excursion={None: (14, 16)}))
+        self.assertEqual(TimelineForExcursion.objects.count(), 1)
+
+    def test_edited_row(self):
+        # экскурсия переносится, обед ставится на ее прежнее время
+        response = self.save(nutrition=[(10, 12)],
+                             excursion={self.visit.pk: (14, 16)})
+        self.assertEqual(response.status_code, 302)
+        self.visit.refresh_from_db()
+        self.assertEqual(self.visit.time_from, self.at(14))
+
+    def test_edited_row_new_time(self):
+        # сверяется новое время экскурсии, а не сохраненное
+        self.assertBusy(self.save(nutrition=[(15, 16)],
+                                  excursion={self.visit.pk: (14, 16)}))
+        self.visit.refresh_from_db()
+        self.assertEqual(self.visit.time_from, self.at(10))
+
+
+class EventTests(TestCase):
+    """ Туристы на одном обеде в одно время попадают в одно событие """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+        cls.first = Tourist.objects.create(name='Первый', phone='1')
+        cls.second = Tourist.objects.create(name='Второй', phone='2')
+        cls.lunch = Nutrition.objects.create(name='Обед', cost=300)
+        cls.time_from = timezone.make_aware(datetime.datetime.combine(
+            timezone.localdate() + datetime.timedelta(days=1),
+            datetime.time(13)))
+        cls.time_to = cls.time_from + datetime.timedelta(hours=1)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def save(self, tourist, pk=None):
+        rows = {'timelinefornutrition_set': [
+            ('nutrition', self.lunch, self.time_from, self.time_to, pk)]}
+        response = self.client.post(
+            reverse('admin:tourists_tourist_change', args=[tourist.pk]),
+            change_form_data(tourist, rows))
+        self.assertEqual(response.status_code, 302)
+        return tourist.timelinefornutrition_set.get()
+
+    def test_key_is_full_time(self):
+        self.assertEqual(
+            make_event_key(self.time_from, nutrition=True),
+            make_event_key(timezone.localtime(self.time_from,
+                                              timezone.utc), nutrition=True))
+        self.assertNotEqual(
+            make_event_key(self.time_from, nutrition=True),
+            make_event_key(self.time_from + datetime.timedelta(seconds=30),
+                           nutrition=True))
+
+    def test_repeated_saves(self):
+        lunch = self.save(self.first)
+        self.assertEqual(self.save(self.first, lunch.pk).event, lunch.event)
+        self.assertEqual(self.save(self.second).event, lunch.event)
+        self.assertEqual(Event.objects.count(), 1)
+
+    def test_created_concurrently(self):
+        # другое сохранение создало событие между поиском и bulk_create
+        event = Event.objects.create(
+            name='Обед', key=make_event_key(self.time_from, nutrition=True))
+        search, calls = Event.objects.in_bulk, []
+
+        def in_bulk(*args, **kwargs):
+            # первый поиск еще не видит событие другого сохранения
+            calls.append(args)
+            return {} if len(calls) == 1 else search(*args, **kwargs)
+
+        lunch = TimelineForNutrition(
+            tourist=self.first, nutrition=self.lunch,
+            time_from=self.time_from, time_to=self.time_to)
+        with mock.patch.object(Event.objects, 'in_bulk', in_bulk):
+            resolve_events([lunch])
+        self.assertEqual(lunch.event, event)
+        self.assertEqual(Event.objects.count(), 1)
+
+
+class OccupancyTests(TestCase):
+    """ Заполненность отеля по ночам и проверка свободных мест """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com',
+                                                 'pass')
+        cls.hotel = Hotel.objects.create(
+            name='Отель', addres='Адрес', phone='1', cost_for_one_day=1000,
+            check_in=datetime.time(14), check_out=datetime.time(12),
+            capacity=2)
+        cls.first = timezone.localdate() + datetime.timedelta(days=1)
+        cls.tourists = [Tourist.objects.create(name=f'Турист {number}',
+                                               phone='1')
+                        for number in range(3)]
+        # ночи first, first + 1, first + 2 и только ночь first + 1
+        cls.long = cls.stay(0, 0, 3)
+        cls.short = cls.stay(1, 1, 2)
+
+    @classmethod
+    def at(cls, day, hour):
+        return timezone.make_aware(datetime.datetime.combine(
+            cls.first + datetime.timedelta(days=day), datetime.time(hour)))
+
+    @classmethod
+    def stay(cls, tourist, first, last, save=True):
+        stay = DatelineForHotel(tourist=cls.tourists[tourist],
+                                hotel=cls.hotel, time_from=cls.at(first, 14),
+                                time_to=cls.at(last, 12))
+        if save:
+            stay.save()
+        return stay
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def nights(self) -> dict:
+        return {(night - self.first).days: guests for night, guests in
+                HotelOccupancy.objects.filter(hotel=self.hotel).values_list(
+                    'night', 'guests')}
+
+    def test_guests_per_night(self):
+        # в ночь выселения турист уже не занимает место
+        self.assertEqual(self.nights(), {0: 1, 1: 2, 2: 1})
+
+    def test_edit_and_delete(self):
+        self.short.time_to = self.at(3, 12)
+        self.short.save()
+        self.assertEqual(self.nights(), {0: 1, 1: 2, 2: 2})
+        self.long.delete()
+        self.assertEqual(self.nights(), {1: 1, 2: 1})
+
+    def test_rebuild(self):
+        self.stay(2, 3, 5)
+        self.short.time_from = self.at(0, 14)
+        self.short.save()
+        incremental = self.nights()
+        rebuild_occupancy()
+        self.assertEqual(self.nights(), incremental)
+
+    def test_no_free_places(self):
+        with self.assertRaises(ValidationError):
+            check_capacity(self.stay(2, 1, 2, save=False))
+        check_capacity(self.stay(2, 2, 4, save=False))
+        # свое место сохраненное пребывание не занимает
+        check_capacity(self.short)
+
+    def post_stay(self, first, last):
+        return self.client.post(
+            reverse('admin:tourists_tourist_change',
+                    args=[self.tourists[2].pk]),
+            change_form_data(self.tourists[2], {'datelineforhotel_set': [
+                ('hotel', self.hotel, self.at(first, 14), self.at(last, 12),
+                 None)]}))
+
+    def test_form_no_free_places(self):
+        response = self.post_stay(0, 2)
+        self.assertContains(response, 'нет свободных мест')
+        self.assertEqual(DatelineForHotel.objects.count(), 2)
+
+    def test_places_taken_while_saving(self):
+        # проверка формы не видит параллельную запись, сохранение видит
+        with mock.patch('tourists.admin.overbooked', return_value=set()):
+            response = self.post_stay(0, 2)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(DatelineForHotel.objects.count(), 2)
+        self.assertEqual(self.nights(), {0: 1, 1: 2, 2: 1})